@@ -1,463 +1,5447 @@
 #!/usr/bin/env python
-#
-# TODO: Add support for in-memory databases.
 
+import array
+import asyncio
+import bisect
+import bz2
+import collections
+import concurrent.futures
 import contextlib
+import csv
+import functools
+import gzip
+import itertools
 import logging
+import lzma
+import multiprocessing
 import os
+import queue
+import re
 import sqlite3
 import sys
+import tempfile
+import threading
+import time
+import zlib
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 #logging.basicConfig(level=logging.DEBUG)
 
-class SQLite3DB(object):
-    """A simple wrapper class for working with sqlite3 databases.
+# Named sets of PRAGMA settings applied to each connection opened by a 
+# SQLite3DB object. Settings are applied in the order given.
+#
+#      durable: WAL journaling with a full sync on every commit. Readers
+#               are no longer blocked by writers.
+#     balanced: WAL journaling, syncing only at checkpoints, with memory
+#               mapped I/O and a larger page cache. A power loss may 
+#               roll back the most recent commits, but cannot corrupt 
+#               the database.
+#    bulk_load: WAL journaling with no syncing and a very large page 
+#               cache. Fastest for loading data, but a power loss may 
+#               corrupt the database.
+#    read_only: Queries only, with memory mapped I/O and a larger page 
+#               cache.
+PROFILES = {
+    'durable': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'busy_timeout': 5000,
+    },
+    'balanced': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 268435456,
+        'cache_size': -65536,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+    },
+    'bulk_load': {
+        'journal_mode': 'WAL',
+        'synchronous': 'OFF',
+        'cache_size': -262144,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 30000,
+    },
+    'read_only': {
+        'query_only': 'ON',
+        'mmap_size': 1073741824,
+        'cache_size': -65536,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+    },
+}
 
-    This wrapper class is intended to help simplify your programmatic
-    interactions with sqlite3 databases in Python. It'll allow you to 
-    quickly create a database object and begin executing SQL 
-    statement(s) against it. There is no need to worry about opening
-    connections to the database, creating database cursors on those 
-    connections, or tracking what connections and/or cursors are opened
-    or closed at any given time. All of this boilerplate housekeeping
-    code is handled by the class' methods for you. The aim here is to 
-    simply get you working with your database sooner rather than later.
+# PRAGMA settings reported by SQLite3DB.settings().
+SETTINGS = ('foreign_keys', 'journal_mode', 'synchronous', 'mmap_size',
+            'cache_size', 'temp_store', 'busy_timeout', 'query_only')
 
-    Check out the example database interactions in the class' main 
-    function below.
+# PRAGMA settings that a profile may apply to each connection, and the
+# keywords (besides integers) that they may be set to.
+PRAGMAS = SETTINGS + ('analysis_limit', 'auto_vacuum', 'automatic_index',
+                      'cache_spill', 'cell_size_check', 
+                      'checkpoint_fullfsync', 'defer_foreign_keys', 
+                      'fullfsync', 'journal_size_limit', 'locking_mode',
+                      'max_page_count', 'page_size', 'recursive_triggers',
+                      'reverse_unordered_selects', 'secure_delete', 
+                      'threads', 'trusted_schema', 'wal_autocheckpoint')
+PRAGMA_KEYWORDS = ('ON', 'OFF', 'TRUE', 'FALSE', 'YES', 'NO', 'DELETE', 
+                   'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'NORMAL', 
+                   'FULL', 'EXTRA', 'DEFAULT', 'FILE', 'EXCLUSIVE', 'NONE',
+                   'INCREMENTAL', 'FAST')
+
+StatementCacheInfo = collections.namedtuple(
+    'StatementCacheInfo', ['hits', 'misses', 'maxsize'])
+
+
+class StatementCache(object):
+    """Counts the use of the prepared statement cache of a connection.
+
+    The sqlite3 module keeps a least-recently-used cache of prepared 
+    statements on each connection, keyed by the SQL string, but it does 
+    not report on its use. SQLite calls a connection's authorizer (see 
+    TableTracker) while it prepares a statement, and only then, so a 
+    statement executed without a call to the authorizer was a hit (it 
+    was only re-bound), and one executed with calls was a miss (it was 
+    parsed and planned, because it was new to the cache, had been 
+    evicted from it, or had expired, e.g., after a schema change).
 
     Attributes:
-      database: str: required: Path to sqlite3 database.
+      maxsize: int: Number of statements cached on the connection.
+      hits: int: Number of statements executed without being prepared.
+      misses: int: Number of statements prepared to be executed.
 
     Methods:
-      connect(): Open and return a connection to the database.
-      dump(): Dump the database to an ASCII text file.
-      execute(sql): Execute SQL statement(s).
-      test(): Run a test SQL query against the database.
-      #cache(): Load database into memory with shared cache.
-      #replicate(): Replicate in-memory database across mutliple processes.
- 
+      record(prepared): Record an execution, returning True on a hit.
+
     """
 
-    def __init__(self, database=None):
-        """ Initializes SQLite3DB object.
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+
+
+    def record(self, prepared):
+        """ Record an execution, returning True on a hit. """
+
+        if prepared:
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+
+# Arguments that make SQLite's date and time functions read the clock.
+_NOW = re.compile(r"'now'|\b(?:date|time|datetime|julianday|unixepoch)"
+                  r"\s*\(\s*\)", re.IGNORECASE)
+
+
+class TableTracker(object):
+    """Records the tables a statement reads and writes as it is prepared.
+
+    An instance's authorize() method is installed as the authorizer 
+    callback of a connection. SQLite invokes the callback only while a 
+    statement is being prepared, so a statement reused from the 
+    connection's statement cache leaves prepared False. Transaction 
+    control statements (e.g., the BEGIN issued implicitly by the 
+    sqlite3 module) are ignored.
+
+    Attributes:
+      prepared: bool: A statement was prepared since the last reset().
+      reads: set: Names of tables read by the statement.
+      columns: set: (table, column) pairs read by the statement.
+      writes: set: Names of tables written by the statement.
+      other: bool: The statement does something other than read and 
+          write table rows, e.g., change the schema or a PRAGMA.
+      volatile: bool: The statement calls a function whose result can 
+          differ between calls with the same arguments, e.g., random().
+      dated: bool: The statement calls a date and time function, whose 
+          result differs between calls if it is given 'now'.
+
+    Methods:
+      authorize(action, arg1, arg2, database, source): Authorizer 
+          callback.
+      reset(): Forget everything recorded so far.
+
+    """
+
+    _WRITES = (sqlite3.SQLITE_INSERT, sqlite3.SQLITE_UPDATE,
+               sqlite3.SQLITE_DELETE)
+    _IGNORED = (sqlite3.SQLITE_TRANSACTION, sqlite3.SQLITE_SAVEPOINT)
+    _HARMLESS = (sqlite3.SQLITE_SELECT, sqlite3.SQLITE_FUNCTION,
+                 sqlite3.SQLITE_RECURSIVE)
+    _VOLATILE = frozenset(('random', 'randomblob', 'changes', 
+                           'total_changes', 'last_insert_rowid',
+                           'current_date', 'current_time', 
+                           'current_timestamp'))
+    _DATED = frozenset(('date', 'time', 'datetime', 'julianday', 
+                        'unixepoch', 'strftime', 'timediff'))
+
+    def __init__(self):
+        self.reset()
+
+
+    def authorize(self, action, arg1, arg2, database, source):
+        """ Record the table touched by action and allow it. """
+
+        if action in self._IGNORED:
+            return sqlite3.SQLITE_OK
+        self.prepared = True
+        if action == sqlite3.SQLITE_READ:
+            self.reads.add(arg1)
+            self.columns.add((arg1, arg2))
+        elif action in self._WRITES:
+            self.writes.add(arg1)
+        elif action == sqlite3.SQLITE_FUNCTION:
+            name = arg2.lower()
+            if name in self._VOLATILE:
+                self.volatile = True
+            elif name in self._DATED:
+                self.dated = True
+        elif action not in self._HARMLESS:
+            self.other = True
+        return sqlite3.SQLITE_OK
+
+
+    def reset(self):
+        """ Forget everything recorded so far. """
+
+        self.prepared = False
+        self.reads = set()
+        self.columns = set()
+        self.writes = set()
+        self.other = False
+        self.volatile = False
+        self.dated = False
+
+
+ColumnInfo = collections.namedtuple(
+    'ColumnInfo', ['name', 'type', 'notnull', 'default', 'primary_key'])
+
+IndexInfo = collections.namedtuple(
+    'IndexInfo', ['name', 'columns', 'unique', 'origin'])
+
+ForeignKeyInfo = collections.namedtuple(
+    'ForeignKeyInfo', ['columns', 'table', 'references', 'on_update',
+                       'on_delete'])
+
+TableInfo = collections.namedtuple(
+    'TableInfo', ['name', 'columns', 'indexes', 'foreign_keys'])
+
+
+class SchemaCatalog(object):
+    """A snapshot of a database's schema.
+
+    Catalogs are loaded with load() and are never changed afterwards, 
+    so one may be shared between threads. A catalog describes the 
+    schema as of its version, the value of PRAGMA schema_version when 
+    it was loaded, which SQLite changes whenever the schema changes.
+
+    Attributes:
+      version: int: PRAGMA schema_version of the schema described.
+      tables: dict: Maps each table name to a TableInfo with its 
+          columns (ColumnInfo), indexes (IndexInfo) and foreign keys 
+          (ForeignKeyInfo), each in the order SQLite reports them.
+      views: tuple: Names of the views.
+
+    Methods:
+      load(connection): Load the catalog of a connection's database.
+      table(name): Look up a table by name, ignoring case.
+      indexed_columns(name): Columns of a table that lead an index.
+
+    """
+
+    def __init__(self, version, tables, views):
+        self.version = version
+        self.tables = tables
+        self.views = views
+        self._names = {name.lower(): name for name in tables}
+
+
+    @classmethod
+    def load(cls, connection):
+        """ Load the catalog of the database open on connection. 
+
+        The schema is read again if it changes while it is being read.
+
+        """
+
+        while True:
+            version, = connection.execute(
+                'PRAGMA schema_version;').fetchone()
+            tables = {}
+            views = []
+            for name, kind in connection.execute(
+                    """ SELECT name, type FROM sqlite_master
+                        WHERE type IN ('table', 'view') 
+                          AND name NOT LIKE 'sqlite_%'
+                        ORDER BY name; """).fetchall():
+                if kind == 'view':
+                    views.append(name)
+                    continue
+                quoted = _quote(name)
+                columns = tuple(
+                    ColumnInfo(row[1], row[2], bool(row[3]), row[4], row[5])
+                    for row in connection.execute(
+                        'PRAGMA table_info({});'.format(quoted)))
+                indexes = tuple(
+                    IndexInfo(row[1], tuple(
+                        info[2] for info in connection.execute(
+                            'PRAGMA index_info({});'.format(
+                                _quote(row[1])))),
+                              bool(row[2]), row[3])
+                    for row in connection.execute(
+                        'PRAGMA index_list({});'.format(quoted)).fetchall())
+                keys = collections.OrderedDict()
+                for row in connection.execute(
+                        'PRAGMA foreign_key_list({});'.format(quoted)):
+                    keys.setdefault(row[0], []).append(row)
+                foreign_keys = tuple(
+                    ForeignKeyInfo(tuple(row[3] for row in rows), rows[0][2],
+                                   tuple(row[4] for row in rows), 
+                                   rows[0][5], rows[0][6])
+                    for rows in keys.values())
+                tables[name] = TableInfo(name, columns, indexes, 
+                                         foreign_keys)
+            if connection.execute(
+                    'PRAGMA schema_version;').fetchone()[0] == version:
+                return cls(version, tables, tuple(views))
+
+
+    def table(self, name):
+        """ Return the TableInfo of the table called name, or None. """
+
+        name = self._names.get(name.lower())
+        return None if name is None else self.tables[name]
+
+
+    def indexed_columns(self, name):
+        """ Return the (lower case) names of the columns of a table that
+        lead an index, including an INTEGER PRIMARY KEY. """
+
+        table = self.table(name)
+        if table is None:
+            return set()
+        keys = [column for column in table.columns if column.primary_key]
+        columns = {index.columns[0].lower() for index in table.indexes
+                   if index.columns and index.columns[0] is not None}
+        if len(keys) == 1 and keys[0].type.upper() == 'INTEGER':
+            columns.add(keys[0].name.lower())
+        return columns
+
+
+class Connection(sqlite3.Connection):
+    """A sqlite3 connection that carries its own statement cache. 
+
+    Attributes:
+      statements: StatementCache: Counts the use of the connection's 
+          cache of prepared statements.
+      pragmas: dict: PRAGMA settings in effect on the connection, as 
+          reported by SQLite after they were applied.
+      tables: TableTracker: Records the tables touched by statements 
+          prepared on the connection, as its authorizer.
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pragmas = {}
+        self.tables = TableTracker()
+        self.statements = StatementCache(kwargs.get('cached_statements',
+                                                    128))
+
+
+class SQLBlob(object):
+    """A BLOB opened for incremental I/O with SQL, where SQLite's own 
+    incremental BLOB I/O (Connection.blobopen()) is not available.
+
+    Behaves like sqlite3.Blob: the BLOB cannot change size, and reads 
+    and writes move a position within it. Each read fetches only the 
+    bytes asked for, with substr(). Each write, however, rewrites the 
+    whole BLOB, so writing a large BLOB in small chunks is slow.
+
+    Methods:
+      read(length): Read up to length bytes, or the rest of the BLOB.
+      write(data): Write data, which must fit in the BLOB.
+      seek(offset, origin): Move the position (os.SEEK_SET, SEEK_CUR or
+          SEEK_END).
+      tell(): Return the position.
+      close(): Close the BLOB.
+
+    """
+
+    def __init__(self, connection, table, column, rowid, readonly=True):
+        self._connection = connection
+        self._readonly = readonly
+        self._table = _quote(table)
+        self._column = _quote(column)
+        self._where = 'FROM {} WHERE rowid = ?'.format(self._table)
+        self._rowid = rowid
+        row = connection.execute('SELECT length({}) {};'.format(
+            self._column, self._where), (rowid,)).fetchone()
+        if row is None:
+            raise sqlite3.OperationalError('no such rowid: {}'.format(rowid))
+        self._length = row[0] or 0
+        self._position = 0
+
+
+    def __len__(self):
+        return self._length
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+    def read(self, length=-1):
+        """ Read up to length bytes, or the rest of the BLOB. """
+
+        if length < 0 or self._position + length > self._length:
+            length = self._length - self._position
+        if length <= 0:
+            return b''
+        data, = self._connection.execute(
+            'SELECT substr({}, ?, ?) {};'.format(self._column, self._where),
+            (self._position + 1, length, self._rowid)).fetchone()
+        self._position += len(data)
+        return bytes(data)
+
+
+    def write(self, data):
+        """ Write data at the position. It must fit in the BLOB. """
+
+        if self._readonly:
+            raise sqlite3.OperationalError('BLOB is OPENED READ ONLY.')
+        data = memoryview(data).cast('B')
+        if self._position + len(data) > self._length:
+            raise ValueError('data DOES NOT FIT in the BLOB.')
+        self._connection.execute(
+            ('UPDATE {0} SET {1} = CAST(substr({1}, 1, ?) || ? || '
+             'substr({1}, ?) AS BLOB) WHERE rowid = ?;').format(
+                 self._table, self._column),
+            (self._position, data, self._position + len(data) + 1, 
+             self._rowid))
+        self._position += len(data)
+
+
+    def seek(self, offset, origin=os.SEEK_SET):
+        """ Move the position within the BLOB. """
+
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self._position,
+                os.SEEK_END: self._length}[origin]
+        if not 0 <= base + offset <= self._length:
+            raise ValueError('offset is OUT OF BOUNDS.')
+        self._position = base + offset
+
+
+    def tell(self):
+        """ Return the position within the BLOB. """
+
+        return self._position
+
+
+    def close(self):
+        """ Close the BLOB. """
+
+        self._connection = None
+
+
+class ConnectionPool(object):
+    """A bounded, thread-safe pool of sqlite3 database connections.
+
+    Connections are created on demand by the connect callable, up to a
+    maximum of max_size connections, and are returned to the pool for 
+    reuse once released. This allows the cost of opening a connection 
+    and applying any per-connection setup (e.g., PRAGMA statements) to 
+    be paid once per connection, rather than once per SQL statement.
+
+    Idle connections in excess of min_size are evicted after they have 
+    been idle for idle_timeout seconds. Connections that have been idle
+    for more than health_check_interval seconds are checked with a 
+    trivial query before they are handed out again. Calling reset() 
+    retires every connection open at the time of the call, e.g., after
+    the target of the connect callable has changed.
+
+    Attributes:
+      min_size: int: Number of connections to keep open while idle.
+      max_size: int: Maximum number of connections open at one time.
+      idle_timeout: float: Seconds an idle connection may live.
+      health_check_interval: float: Seconds of idleness after which a 
+          connection is checked before reuse.
+
+    Methods:
+      acquire(timeout): Check out a connection from the pool.
+      release(connection): Return a connection to the pool.
+      connection(timeout): Context manager that acquires and releases.
+      reset(): Retire all connections currently open.
+      close(): Close all connections and shut down the pool.
+
+    """
+
+    def __init__(self, connect, min_size=0, max_size=5, idle_timeout=300.0,
+                 health_check_interval=30.0):
+        """ Initializes ConnectionPool object.
 
         Arguments:
-          database: str: required: Path to sqlite3 database.
+          connect: callable: required: Returns a new sqlite3.Connection.
+          min_size: int: optional: Connections kept open while idle.
+          max_size: int: optional: Maximum number of open connections.
+          idle_timeout: float: optional: Seconds an idle connection 
+              beyond min_size may live before it is closed.
+          health_check_interval: float: optional: Seconds of idleness 
+              after which a connection is checked before reuse.
 
         Returns:
           None
 
         Raises:
-          TypeError: database argument is NOT A STRING.
-          ValueError: database argument string is EMPTY.
+          ValueError: Pool sizes are NOT VALID.
 
         """
 
-        # Start initialization of SQLite3DB object.
-        logging.info(('Initializing SQLite3DB object: '
-                      '{}').format(self.__repr__()))
+        if max_size < 1 or not 0 <= min_size <= max_size:
+            raise ValueError(('connection pool sizes are NOT VALID: '
+                              'min_size={}, max_size={}').format(
+                                  min_size, max_size))
+
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self._connect = connect
+        self._condition = threading.Condition()
+        self._idle = collections.deque()
+        self._size = 0
+        self._closed = False
+        self._generation = 0
+        self._generations = {}
+
+        for _ in range(min_size):
+            connection = self._connect()
+            self._generations[connection] = self._generation
+            self._idle.append((connection, time.monotonic()))
+            self._size += 1
+
+
+    def acquire(self, timeout=None):
+        """ Check out a connection from the pool.
+
+        Arguments:
+          timeout: float: optional: Seconds to wait for a connection to 
+              become available when the pool is exhausted. Waits 
+              forever if None.
+
+        Returns:
+          connection: sqlite3.Connection: A connection to the database.
+
+        Raises:
+          sqlite3.ProgrammingError: Cannot operate on a closed pool.
+          TimeoutError: No connection became available in time.
+
+        """
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            generation = self._generation
+            while True:
+                if self._closed:
+                    raise sqlite3.ProgrammingError('Cannot operate on a '
+                                                   'closed connection pool.')
+                self._evict()
+                if self._idle:
+                    connection, last_used = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    connection, last_used = None, None
+                    break
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(('No connection available in '
+                                            'pool after {} seconds.').format(
+                                                timeout))
+                self._condition.wait(remaining)
+
+        if connection is not None:
+            idle_time = time.monotonic() - last_used
+            if (idle_time < self.health_check_interval or
+                    self._healthy(connection)):
+                return connection
+            logging.warning('Discarding unhealthy pooled connection: %s',
+                         connection)
+            with self._condition:
+                self._generations.pop(connection, None)
+            self._close_quietly(connection)
 
-        # Check if database argument is a string. If it is not a string, 
-        # then throw an exception.
-        logging.info('Type checking database argument ...')
         try:
-            if not isinstance(database, str):
-                raise TypeError(('database argument is NOT A STRING: '
-                                 '{}').format(type(database)))
-        except TypeError as e:
-            logging.exception(e)
-            logging.debug('database argument MUST BE A STRING.')
+            connection = self._connect()
+        except Exception:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
             raise
-        else:
-            logging.info(('database argument is of type: '
-                          '{}').format(type(database)))
+        with self._condition:
+            self._generations[connection] = generation
+        return connection
 
-        # Check if database argument string is empty. If the string is 
-        # empty, then throw an exception.
-        logging.info('Checking if database argument string is empty ...')
+
+    def release(self, connection):
+        """ Return a connection to the pool.
+
+        Any transaction left open on the connection is rolled back 
+        before the connection is made available for reuse.
+
+        Arguments:
+          connection: sqlite3.Connection: required: A connection that 
+              was previously checked out with acquire().
+
+        Returns:
+          None
+
+        Raises:
+          None
+
+        """
+
+        reusable = True
         try:
-            if not database:
-                raise ValueError('database argument string is EMPTY.')
-        except ValueError as e:
+            if connection.in_transaction:
+                connection.rollback()
+        except sqlite3.Error as e:
             logging.exception(e)
-            logging.debug('database argument string CANNOT BE EMPTY.')
-            raise
-        else:
-            logging.info(('database argument string is not empty: '
-                          '{}').format(database))
+            reusable = False
 
-        # Check if database argument string is a path to an existing 
-        # file. If the file does not exist, then throw a warning. In 
-        # either case, assign class instance variable self.database the 
-        # absolute path of the file indicated by the database argument 
-        # string.
-        logging.info('Checking if database argument string is a path '
-                     'to an existing file ...')
+        with self._condition:
+            if (self._closed or not reusable or
+                    self._generations.get(connection) != self._generation):
+                self._discard(connection)
+            else:
+                self._idle.append((connection, time.monotonic()))
+            self._condition.notify()
+
+
+    @contextlib.contextmanager
+    def connection(self, timeout=None):
+        """ Context manager that checks out and returns a connection.
+
+        Arguments:
+          timeout: float: optional: See acquire().
+
+        Returns:
+          connection: sqlite3.Connection: A connection to the database.
+
+        Raises:
+          See acquire().
+
+        """
+
+        connection = self.acquire(timeout)
         try:
-            if not os.path.isfile(database):
-                raise FileNotFoundError(('database argument string is '
-                                         'NOT A PATH TO AN EXISTING '
-                                         'FILE: {}'.format(database)))
-        except FileNotFoundError as w:
-            logging.warn(w)
-            logging.debug('If database file does not exist prior to '
-                          'instantiation of the SQLite3DB object, an '
-                          'empty sqlite3 database file will be created '
-                          'at the path specified by the database '
-                          'argument string upon the first connection '
-                          'established to the database.')
-        else:
-            logging.info('database argument string is a path to an '
-                         'existing file.')
+            yield connection
         finally:
-            self.database = os.path.abspath(database)
-            logging.info(('Absolute path to database file is: '
-                          '{}'.format(self.database)))
+            self.release(connection)
 
-        # End initialization of SQLite3DB object.
-        logging.info(('SQLite3DB object initialized: '
-                      '{}').format(self.__repr__()))
 
+    def close(self):
+        """ Close all idle connections and shut down the pool. 
 
-    def connect(self):
-        """ Open and return a connection to the database. 
+        Connections that are checked out when the pool is closed are 
+        closed as they are released.
 
         Arguments:
           None
 
         Returns:
-          connection: sqlite3.Connection: A connection to the database 
-              that enforces foreign key constraints.
-        
+          None
+
         Raises:
-          sqlite3.OperationalError: Unable to open database file.
-          sqlite3.ProgrammingError: Cannot operate on a closed cursor or database.
+          None
+
+        """
+
+        with self._condition:
+            self._closed = True
+            while self._idle:
+                connection, _ = self._idle.popleft()
+                self._discard(connection)
+            self._condition.notify_all()
+
+
+    def reset(self):
+        """ Retire all connections currently open.
+
+        Idle connections are closed immediately. Connections that are 
+        checked out when the pool is reset are closed as they are 
+        released, rather than being returned to the pool. New 
+        connections are created by the connect callable as needed.
+
+        Arguments:
+          None
+
+        Returns:
+          None
+
+        Raises:
+          None
+
+        """
+
+        with self._condition:
+            self._generation += 1
+            while self._idle:
+                connection, _ = self._idle.popleft()
+                self._discard(connection)
+            self._condition.notify_all()
+
+
+    def _evict(self):
+        """ Close connections that have been idle for too long. 
+
+        Must be called with the pool's condition held. Idle connections 
+        are stored oldest first, so eviction stops at the first 
+        connection that has not yet timed out.
+
+        """
+
+        now = time.monotonic()
+        while (self._idle and self._size > self.min_size and
+               now - self._idle[0][1] > self.idle_timeout):
+            connection, _ = self._idle.popleft()
+            self._discard(connection)
+
+
+    def _discard(self, connection):
+        """ Close connection and free its slot in the pool. 
+
+        Must be called with the pool's condition held.
+
+        """
+
+        self._size -= 1
+        self._generations.pop(connection, None)
+        self._close_quietly(connection)
+
+
+    @staticmethod
+    def _healthy(connection):
+        """ Return True if a trivial query succeeds on connection. """
+
+        try:
+            connection.execute('SELECT 1;').fetchone()
+        except sqlite3.Error:
+            return False
+        return True
+
+
+    @staticmethod
+    def _close_quietly(connection):
+        """ Close connection, logging rather than raising errors. """
+
+        try:
+            connection.close()
+        except sqlite3.Error as e:
+            logging.exception(e)
+
+
+
+ResultCacheInfo = collections.namedtuple(
+    'ResultCacheInfo', ['hits', 'misses', 'evictions', 'invalidations',
+                        'maxsize', 'currsize', 'nbytes'])
+
+
+class ResultCache(object):
+    """A thread-safe LRU/TTL cache of query results.
+
+    Results are cached under a key made from the SQL statement and its 
+    parameters, along with the names of the tables the statement read,
+    so that a write to a table invalidates only the results that depend
+    on it. The least recently used results are evicted once there are 
+    more than maxsize of them, or once their estimated total size 
+    exceeds max_bytes.
+
+    A result computed while an invalidation is in progress may already 
+    be stale, so put() drops any result whose computation started 
+    before the most recent invalidation.
+
+    Attributes:
+      maxsize: int: Maximum number of cached results.
+      ttl: float: Seconds a result may be served from the cache.
+      max_bytes: int: Maximum estimated size of all cached results.
+
+    Methods:
+      epoch(): Return a token to pass to put().
+      get(key): Return cached rows for key, or None.
+      put(key, rows, tables, epoch): Cache rows for key.
+      invalidate(tables): Drop results that read any of tables.
+      clear(): Drop all results.
+      info(): Report cache use.
+
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, max_bytes=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._results = collections.OrderedDict()
+        self._nbytes = 0
+        self._epoch = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+
+    def epoch(self):
+        """ Return a token to pass to put(). """
+
+        with self._lock:
+            return self._epoch
+
+
+    def get(self, key):
+        """ Return cached rows for key, or None. """
+
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is not None:
+                rows, tables, nbytes, expires = entry
+                if expires is None or expires > time.monotonic():
+                    self._results.move_to_end(key)
+                    self._hits += 1
+                    return rows
+                self._drop(key)
+            self._misses += 1
+            return None
+
+
+    def put(self, key, rows, tables, epoch):
+        """ Cache rows for key unless invalidated since epoch. """
+
+        nbytes = _sizeof(rows)
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            if epoch != self._epoch:
+                return
+            if self.max_bytes is not None and nbytes > self.max_bytes:
+                return
+            if key in self._results:
+                self._drop(key)
+            self._results[key] = (rows, frozenset(tables), nbytes, expires)
+            self._nbytes += nbytes
+            while (len(self._results) > self.maxsize or
+                   (self.max_bytes is not None and 
+                    self._nbytes > self.max_bytes)):
+                self._drop(next(iter(self._results)))
+                self._evictions += 1
+
+
+    def invalidate(self, tables):
+        """ Drop results that read any of tables. """
+
+        tables = set(tables)
+        with self._lock:
+            self._epoch += 1
+            for key in [key for key, entry in self._results.items()
+                        if not tables.isdisjoint(entry[1])]:
+                self._drop(key)
+                self._invalidations += 1
+
+
+    def clear(self):
+        """ Drop all results. """
+
+        with self._lock:
+            self._epoch += 1
+            self._invalidations += len(self._results)
+            self._results.clear()
+            self._nbytes = 0
+
+
+    def info(self):
+        """ Report cache use as a ResultCacheInfo. """
+
+        with self._lock:
+            return ResultCacheInfo(self._hits, self._misses, 
+                                   self._evictions, self._invalidations,
+                                   self.maxsize, len(self._results),
+                                   self._nbytes)
+
+
+    def _drop(self, key):
+        """ Remove key. Must be called with the lock held. """
+
+        self._nbytes -= self._results.pop(key)[2]
+
+
+class Metrics(object):
+    """Thread-safe counters and histograms of database work.
+
+    Statement executions are counted, timed and tallied by execution 
+    mode, both in aggregate and per distinct SQL statement, along with
+    the rows they return and the rows they change. The time taken to 
+    open connections is kept apart from the time taken to execute 
+    statements. Statements that take at least slow_query_time seconds 
+    are also kept, with their query plans, in a bounded slow query log.
+    Scripts are tallied (and logged) under their path, not their text.
+
+    Attributes:
+      buckets: tuple: Upper bounds, in seconds, of the histogram 
+          buckets.
+      slow_query_time: float: Seconds from which a statement is slow. 
+          No statement is slow if None.
+      max_statements: int: Maximum number of distinct SQL statements 
+          tallied one by one. Any others are tallied together under 
+          '<other>'.
+
+    Methods:
+      observe(sql, mode, seconds, rows, changes, parameters): Record 
+          a statement.
+      observe_connect(seconds): Record a new connection.
+      log_slow(record): Add a record to the slow query log.
+      slow_queries(): Return the slow query log.
+      snapshot(): Return all counters and histograms.
+      workload(): Return each distinct statement recorded, with the 
+          parameters it was last executed with.
+      prometheus(): Return all counters and histograms in Prometheus 
+          text format.
+      reset(): Zero all counters and histograms.
+
+    """
+
+    BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0,
+               5.0, 10.0)
+
+    def __init__(self, slow_query_time=None, slow_query_log_size=100,
+                 max_statements=1000, buckets=BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.slow_query_time = slow_query_time
+        self.max_statements = max_statements
+        self._slow = collections.deque(maxlen=slow_query_log_size)
+        self._lock = threading.Lock()
+        self.reset()
+
+
+    def observe(self, sql, mode, seconds, rows, changes, 
+                parameters=None):
+        """ Record a statement execution. Returns True if it was slow. """
+
+        slow = (self.slow_query_time is not None 
+                and seconds >= self.slow_query_time)
+        with self._lock:
+            self._observe(self._statements, seconds)
+            self._modes[mode] = self._modes.get(mode, 0) + 1
+            self._rows += rows
+            self._changes += changes
+            if (sql not in self._by_statement 
+                    and len(self._by_statement) >= self.max_statements):
+                sql = '<other>'
+            tally = self._by_statement.get(sql)
+            if tally is None:
+                tally = self._by_statement[sql] = {
+                    'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0, 
+                    'rows': 0, 'changes': 0, 'slow': 0}
+            tally['calls'] += 1
+            tally['seconds'] += seconds
+            tally['max_seconds'] = max(tally['max_seconds'], seconds)
+            tally['rows'] += rows
+            tally['changes'] += changes
+            tally['slow'] += slow
+            if sql != '<other>' and mode != 'SCRIPT':
+                self._workload[sql] = parameters
+        return slow
+
+
+    def observe_connect(self, seconds):
+        """ Record the time taken to open a connection. """
+
+        with self._lock:
+            self._observe(self._connects, seconds)
+
+
+    def log_slow(self, record):
+        """ Add a record (a dict) to the slow query log. """
+
+        with self._lock:
+            self._slow.append(record)
+            self._slow_total += 1
+
+
+    def slow_queries(self):
+        """ Return the slow query log, oldest first. """
+
+        with self._lock:
+            return list(self._slow)
+
+
+    def workload(self):
+        """ Return a list of (sql, parameters) for each distinct SQL 
+        statement recorded, other than scripts. """
+
+        with self._lock:
+            return list(self._workload.items())
+
+
+    def snapshot(self):
+        """ Return all counters and histograms as a dict. """
+
+        with self._lock:
+            return {
+                'statements': self._histogram(self._statements),
+                'modes': dict(self._modes),
+                'rows': self._rows,
+                'changes': self._changes,
+                'connections': self._histogram(self._connects),
+                'slow_queries': self._slow_total,
+                'by_statement': {sql: dict(tally) for sql, tally 
+                                 in self._by_statement.items()},
+            }
+
+
+    def prometheus(self, prefix='sqlite3db'):
+        """ Return all counters and histograms in Prometheus text format.
+        """
+
+        stats = self.snapshot()
+        lines = []
+
+        def metric(name, kind, description):
+            lines.append('# HELP {}_{} {}'.format(prefix, name, 
+                                                   description))
+            lines.append('# TYPE {}_{} {}'.format(prefix, name, kind))
+
+        def histogram(name, description, values):
+            metric(name, 'histogram', description)
+            for bound, count in values['buckets']:
+                lines.append('{}_{}_bucket{{le="{}"}} {}'.format(
+                    prefix, name, bound, count))
+            lines.append('{}_{}_bucket{{le="+Inf"}} {}'.format(
+                prefix, name, values['count']))
+            lines.append('{}_{}_sum {!r}'.format(prefix, name, 
+                                                values['seconds']))
+            lines.append('{}_{}_count {}'.format(prefix, name, 
+                                                values['count']))
+
+        histogram('statement_seconds', 'Time spent executing SQL '
+                  'statements.', stats['statements'])
+        histogram('connect_seconds', 'Time spent opening connections.',
+                  stats['connections'])
+        metric('statements_total', 'counter', 'SQL statements executed, '
+               'by execution mode.')
+        for mode, count in sorted(stats['modes'].items()):
+            lines.append('{}_statements_total{{mode="{}"}} {}'.format(
+                prefix, mode, count))
+        for name, description in (
+                ('rows', 'Rows returned by SQL statements.'),
+                ('changes', 'Rows modified, inserted or deleted by SQL '
+                            'statements.'),
+                ('slow_queries', 'SQL statements slower than the slow '
+                                 'query time.')):
+            metric(name + '_total', 'counter', description)
+            lines.append('{}_{}_total {}'.format(prefix, name, 
+                                                 stats[name]))
+        for name, key, description in (
+                ('statement_calls', 'calls', 'Executions of each SQL '
+                 'statement.'),
+                ('statement_seconds_total', 'seconds', 'Time spent '
+                 'executing each SQL statement.'),
+                ('statement_rows', 'rows', 'Rows returned by each SQL '
+                 'statement.'),
+                ('statement_changes', 'changes', 'Rows changed by each '
+                 'SQL statement.')):
+            if not name.endswith('_total'):
+                name += '_total'
+            metric(name, 'counter', description)
+            for sql, tally in stats['by_statement'].items():
+                lines.append('{}_{}{{sql="{}"}} {!r}'.format(
+                    prefix, name, _label(sql), tally[key]))
+        return '\n'.join(lines) + '\n'
+
+
+    def reset(self):
+        """ Zero all counters and histograms and empty the slow query 
+        log. """
+
+        with self._lock:
+            self._statements = [0] * (len(self.buckets) + 1) + [0.0]
+            self._connects = [0] * (len(self.buckets) + 1) + [0.0]
+            self._modes = {}
+            self._rows = 0
+            self._changes = 0
+            self._by_statement = {}
+            self._workload = {}
+            self._slow.clear()
+            self._slow_total = 0
+
+
+    def _observe(self, histogram, seconds):
+        """ Add seconds to a histogram: bucket counts, count and sum. """
+
+        for index, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                histogram[index] += 1
+                break
+        histogram[-2] += 1
+        histogram[-1] += seconds
+
+
+    def _histogram(self, histogram):
+        """ Return a histogram with cumulative bucket counts. """
+
+        buckets = []
+        count = 0
+        for bound, bucket in zip(self.buckets, histogram):
+            count += bucket
+            buckets.append((bound, count))
+        return {'count': histogram[-2], 'seconds': histogram[-1],
+                'buckets': buckets}
+
+
+def _label(text):
+    """ Escape text for use as a Prometheus label value. """
+
+    text = ' '.join(text.split())
+    return text.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def _explain(connection, sql, parameters=()):
+    """ Return the query plan of sql as indented lines of text. 
+
+    The plan is reported by EXPLAIN QUERY PLAN, and indented by depth 
+    as in the sqlite3 shell. None is returned if sql cannot be 
+    explained, e.g., because it changes the schema.
+
+    """
+
+    # EXPLAIN QUERY PLAN never reads the database, so a cached prepared
+    # statement would go on reporting the plan for an older schema. 
+    # Tagging it with the schema version gives each schema its own. Nor
+    # does it notice a schema changed by another connection, so a table
+    # is read first, which makes the connection load the new schema.
+    try:
+        connection.execute('SELECT 1 FROM sqlite_master LIMIT 1;').fetchall()
+        version, = connection.execute('PRAGMA schema_version;').fetchone()
+        plan = connection.execute(
+            'EXPLAIN QUERY PLAN /* schema version {} */ {}'.format(
+                version, sql), parameters or ()).fetchall()
+    except (sqlite3.Error, ValueError) as e:
+        logging.debug('Cannot explain SQL statement: %s', e)
+        return None
+    depths = {0: -1}
+    lines = []
+    for node, parent, _, detail in plan:
+        depths[node] = depths.get(parent, -1) + 1
+        lines.append('  ' * depths[node] + detail)
+    return lines
+
+
+def _data_version(connection):
+    """ Return connection's PRAGMA data_version.
+
+    The data version changes whenever another connection commits a 
+    change to the database, but not when connection itself does.
+
+    """
+
+    return connection.execute('PRAGMA data_version;').fetchall()[0][0]
+
+
+def _schema_copy(connection):
+    """ Return an in-memory database with the schema of connection's.
+
+    Tables, indexes and views are copied, without their rows, along 
+    with any planner statistics gathered by ANALYZE, so that the query 
+    planner makes much the same choices on the copy as on the original.
+    Indexes can then be tried out on the copy at no cost.
+
+    """
+
+    copy = sqlite3.connect(':memory:')
+    objects = connection.execute(
+        """ SELECT sql FROM sqlite_master
+            WHERE type IN ('table', 'index', 'view') AND sql NOT NULL
+              AND name NOT LIKE 'sqlite_%'
+            ORDER BY CASE type WHEN 'table' THEN 0 
+                               WHEN 'index' THEN 1 ELSE 2 END; """)
+    for sql, in objects:
+        copy.execute(sql)
+    if connection.execute(""" SELECT 1 FROM sqlite_master 
+                              WHERE name = 'sqlite_stat1'; """).fetchone():
+        copy.execute('ANALYZE;')
+        copy.execute('DELETE FROM sqlite_stat1;')
+        copy.executemany('INSERT INTO sqlite_stat1 VALUES (?, ?, ?);',
+                         connection.execute('SELECT * FROM sqlite_stat1;'))
+        copy.commit()
+        copy.execute('ANALYZE sqlite_master;')
+    return copy
+
+
+def _scans(plan):
+    """ Return the lines of a query plan that read whole tables, either
+    by scanning them or by building automatic indexes on them. """
+
+    return [line for line in plan or () 
+            if line.lstrip().startswith('SCAN ') 
+            and not line.lstrip().startswith(('SCAN CONSTANT ROW', 
+                                              'SCAN SUBQUERY'))
+            or 'AUTOMATIC' in line]
+
+
+class WriteQueue(object):
+    """Serializes writes through a single connection with group commit.
+
+    When many threads write to a SQLite database at once, each on its 
+    own connection, they contend for the database's single write lock 
+    and pay for a commit (and a sync to disk) each. A WriteQueue 
+    instead hands all write requests to one writer thread, which holds 
+    the only writing connection. The writer drains the queue in groups
+    of up to batch_size requests, waiting at most max_latency seconds 
+    for a group to fill, and commits each group in one transaction. By
+    default, it does not wait at all: requests that arrive while a 
+    group is being committed simply form the next group.
+
+    Each request runs inside its own savepoint, so a request that fails
+    is rolled back on its own, without affecting the rest of the group.
+    Results and errors are delivered through concurrent.futures.Future
+    objects, but only once the group has been committed.
+
+    If the writer cannot open its connection, the queue is broken: every
+    queued request fails with the error raised, and so does every later
+    call to submit().
+
+    Attributes:
+      batch_size: int: Maximum number of requests committed together.
+      max_latency: float: Maximum seconds to wait for a group to fill.
+
+    Methods:
+      submit(sql, parameters): Queue a write, returning a Future.
+      close(): Finish all queued writes and stop the writer.
+
+    """
+
+    _STOP = object()
+
+    def __init__(self, connect, batch_size=100, max_latency=0.0,
+                 track=None, settle=None, observe=None):
+        """ Initializes WriteQueue object.
+
+        Arguments:
+          connect: callable: required: Returns a new sqlite3.Connection
+              for the writer.
+          batch_size: int: optional: Maximum number of requests 
+              committed together.
+          max_latency: float: optional: Maximum seconds to wait for a 
+              group to fill before committing it.
+          track: callable: optional: Called by the writer after each 
+              request as track(connection, sql). Its return values for 
+              the requests that succeeded are passed on to settle.
+          settle: callable: optional: Called by the writer after each 
+              commit as settle(tracked), with the list of values 
+              returned by track.
+          observe: callable: optional: Called by the writer after each 
+              commit, for each request that succeeded, as 
+              observe(connection, sql, parameters, 'NORMAL', seconds, 
+              rows, changes).
+
+        Returns:
+          None
+
+        Raises:
+          ValueError: batch_size argument is NOT A POSITIVE INTEGER.
+
+        """
+
+        if not isinstance(batch_size, int) or batch_size < 1:
+            raise ValueError(('batch_size argument is NOT A POSITIVE '
+                              'INTEGER: {}').format(batch_size))
+
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self._connect = connect
+        self._track = track
+        self._settle = settle
+        self._observe = observe
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._error = None
+        self._thread = threading.Thread(target=self._run,
+                                        name='sqlite3db-writer', daemon=True)
+        self._thread.start()
+
+
+    def submit(self, sql, parameters=None):
+        """ Queue a write, returning a Future.
+
+        Arguments:
+          sql: str: required: SQL statement to be executed.
+          parameters: tuple/list/dict: optional: Values bound to the 
+              placeholders of the SQL statement.
+
+        Returns:
+          future: concurrent.futures.Future: Resolves to the number of 
+              rows changed and the rows returned by the statement, once 
+              committed, or to the error it raised.
+
+        Raises:
+          sqlite3.ProgrammingError: Cannot operate on a closed queue.
+          Exception: The writer could not open its connection.
+
+        """
+
+        future = concurrent.futures.Future()
+        with self._lock:
+            if self._error is not None:
+                raise self._error
+            if self._closed:
+                raise sqlite3.ProgrammingError('Cannot operate on a '
+                                               'closed write queue.')
+            self._queue.put((sql, () if parameters is None else parameters,
+                             future))
+        return future
+
+
+    def close(self):
+        """ Finish all queued writes and stop the writer. """
+
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(self._STOP)
+        self._thread.join()
+
+
+    def _run(self):
+        """ Drain the queue in groups until told to stop. """
+
+        try:
+            connection = self._connect()
+            connection.isolation_level = None
+        except Exception as e:
+            logging.exception(e)
+            self._fail(e)
+            return
+        try:
+            stopping = False
+            while not stopping:
+                request = self._queue.get()
+                if request is self._STOP:
+                    break
+                group = [request]
+                deadline = time.monotonic() + self.max_latency
+                while len(group) < self.batch_size:
+                    try:
+                        request = self._queue.get(
+                            timeout=max(0.0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                    if request is self._STOP:
+                        stopping = True
+                        break
+                    group.append(request)
+                self._commit(connection, group)
+        finally:
+            connection.close()
+
+
+    def _fail(self, error):
+        """ Break the queue, failing every queued request with error. """
+
+        with self._lock:
+            self._error = error
+            self._closed = True
+        while True:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is not self._STOP:
+                future = request[2]
+                if future.set_running_or_notify_cancel():
+                    future.set_exception(error)
+
+
+    def _commit(self, connection, group):
+        """ Execute a group of requests and commit them together. """
+
+        outcomes = []
+        observed = []
+        try:
+            connection.execute('BEGIN IMMEDIATE;')
+            for sql, parameters, future in group:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                total_changes = connection.total_changes
+                connection.execute('SAVEPOINT sqlite3db_write;')
+                start = time.perf_counter()
+                try:
+                    cursor = connection.execute(sql, parameters)
+                    rows = cursor.fetchall()
+                    cursor.close()
+                except Exception as e:
+                    connection.execute('ROLLBACK TO sqlite3db_write;')
+                    connection.execute('RELEASE sqlite3db_write;')
+                    if self._track is not None:
+                        self._track(connection, sql)
+                    outcomes.append((future, None, e, False))
+                else:
+                    seconds = time.perf_counter() - start
+                    connection.execute('RELEASE sqlite3db_write;')
+                    tracked = None
+                    if self._track is not None:
+                        tracked = self._track(connection, sql)
+                    changes = connection.total_changes - total_changes
+                    outcomes.append((future, (changes, rows), None, tracked))
+                    observed.append((sql, parameters, seconds, len(rows),
+                                     changes))
+            connection.execute('COMMIT;')
+        except Exception as e:
+            logging.exception(e)
+            if connection.in_transaction:
+                connection.execute('ROLLBACK;')
+            for _, _, future in group:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        logging.info('Committed group of %s writes.', len(outcomes))
+        if self._settle is not None:
+            self._settle([tracked for _, _, error, tracked in outcomes
+                          if error is None])
+        if self._observe is not None:
+            for sql, parameters, seconds, rows, changes in observed:
+                self._observe(connection, sql, parameters, 'NORMAL', 
+                              seconds, rows, changes)
+        for future, result, error, _ in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+# Compressed file formats supported by dump(), dump_tables() and 
+# restore(), and the file extensions they are known by.
+_OPENERS = {'gzip': gzip.open, 'bz2': bz2.open, 'xz': lzma.open}
+_SUFFIXES = {'gzip': '.gz', 'bz2': '.bz2', 'xz': '.xz'}
+
+
+def _open_file(path, mode, compression=None):
+    """ Open a possibly compressed file in text ('t') or binary mode.
+
+    If compression is None, then it is implied by the extension of 
+    path, if any. Text is always encoded as UTF-8.
+
+    """
+
+    if compression is None:
+        for name, suffix in _SUFFIXES.items():
+            if path.endswith(suffix):
+                compression = name
+    if compression is not None and compression not in _OPENERS:
+        raise ValueError(('compression argument is NOT SUPPORTED: {}'
+                          ).format(compression))
+    opener = _OPENERS.get(compression, open)
+    if 't' in mode:
+        return opener(path, mode, encoding='utf-8')
+    return opener(path, mode)
+
+
+def _write_lines(sql_file, lines, batch):
+    """ Write lines to sql_file, batch lines at a time. """
+
+    buffer = []
+    for line in lines:
+        buffer.append(line)
+        if len(buffer) >= batch:
+            buffer.append('')
+            sql_file.write('\n'.join(buffer))
+            buffer = []
+    if buffer:
+        buffer.append('')
+        sql_file.write('\n'.join(buffer))
+
+
+def _iterstatements(sql_file, offset=0):
+    """ Yield each SQL statement in a binary file, with its end offset.
+
+    Lines are read from sql_file, starting at byte offset, until they 
+    form a complete SQL statement. The statement is yielded along with
+    the offset of the byte just past the line it ends on, from which 
+    reading may later be resumed. Several statements that end on the
+    same line are yielded one by one, with the same offset.
+
+    """
+
+    if offset:
+        sql_file.seek(offset)
+    lines = []
+    for line in sql_file:
+        offset += len(line)
+        lines.append(line)
+        if b';' in line:
+            text = b''.join(lines).decode('utf-8')
+            if sqlite3.complete_statement(text):
+                lines = []
+                for statement in _split_statements(text):
+                    yield statement, offset
+    if not _only_comments(b''.join(lines).decode('utf-8')):
+        raise ValueError('sql_file ends with an INCOMPLETE SQL '
+                         'STATEMENT.')
+
+
+def _only_comments(text):
+    """ Return True if text is made only of whitespace and comments. 
+
+    A block comment left open runs to the end of text, as in SQLite.
+
+    """
+
+    text = text.lstrip()
+    while text:
+        if text.startswith('--'):
+            end = text.find('\n')
+        elif text.startswith('/*'):
+            end = text.find('*/', 2)
+            end = end + 1 if end != -1 else end
+        else:
+            return False
+        if end == -1:
+            return True
+        text = text[end + 1:].lstrip()
+    return True
+
+
+def _split_statements(text):
+    """ Split text made of complete SQL statements into statements. """
+
+    if text.count(';') == 1:
+        return [text]
+    statements = []
+    start = 0
+    end = text.find(';')
+    while end != -1:
+        if sqlite3.complete_statement(text[start:end + 1]):
+            statements.append(text[start:end + 1])
+            start = end + 1
+        end = text.find(';', end + 1)
+    statements[-1] += text[start:]
+    return statements
+
+
+def _statement_kind(statement):
+    """ Classify a statement from a dump for restore(). 
+
+    Returns 'TRANSACTION' for transaction control statements, which 
+    restore() replaces with its own, 'DEFERRED' for statements that 
+    create indexes, triggers and views, and None otherwise.
+
+    """
+
+    words = statement.split(None, 3)[:3]
+    words = [word.upper().rstrip(';') for word in words]
+    if words[0] in ('BEGIN', 'COMMIT', 'END'):
+        return 'TRANSACTION'
+    if words[0] == 'CREATE':
+        kind = words[2] if words[1] in ('UNIQUE', 'TEMP', 'TEMPORARY') \
+            else words[1]
+        if kind in ('INDEX', 'TRIGGER', 'VIEW'):
+            return 'DEFERRED'
+    return None
+
+
+def _quote(name):
+    """ Quote a SQL identifier. """
+
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def _dump_table(database, table, path, compression, batch):
+    """ Dump one table (or view) of database to path. 
+
+    Rows are turned into INSERT statements by SQLite itself, with 
+    quote(), just as Connection.iterdump() does.
+
+    """
+
+    with contextlib.closing(sqlite3.connect(database)) as connection:
+        objects = connection.execute(
+            """ SELECT type, sql FROM sqlite_master
+                WHERE tbl_name = ? AND sql NOT NULL
+                ORDER BY type = 'table' DESC, type = 'index' DESC; """,
+            (table,)).fetchall()
+        with _open_file(path, 'wt', compression) as sql_file:
+            sql_file.write('BEGIN TRANSACTION;\n')
+            kind, sql = objects[0]
+            sql_file.write('{};\n'.format(sql))
+            if kind == 'table':
+                columns = [row[1] for row in connection.execute(
+                    'PRAGMA table_info({});'.format(_quote(table)))]
+                select = 'SELECT {} FROM {};'.format(
+                    " || ',' || ".join('quote({})'.format(_quote(column))
+                                       for column in columns),
+                    _quote(table))
+                prefix = 'INSERT INTO {} VALUES('.format(_quote(table))
+                _write_lines(sql_file, (prefix + values + ');' for values, 
+                                        in connection.execute(select)),
+                             batch)
+                has_sequence = connection.execute(
+                    """ SELECT 1 FROM sqlite_master
+                        WHERE name = 'sqlite_sequence'; """).fetchone()
+                if has_sequence:
+                    for sequence, in connection.execute(
+                            """ SELECT seq FROM sqlite_sequence
+                                WHERE name = ?; """, (table,)):
+                        sql_file.write(
+                            ("DELETE FROM sqlite_sequence WHERE name = "
+                             "'{0}';\nINSERT INTO sqlite_sequence "
+                             "VALUES('{0}',{1});\n").format(
+                                 table.replace("'", "''"), sequence))
+            for kind, sql in objects[1:]:
+                sql_file.write('{};\n'.format(sql))
+            sql_file.write('COMMIT;\n')
+
+
+def _typecode(decltype):
+    """ Return the array typecode for a declared column type, if any.
+
+    SQLite's rules for column affinity are followed: INTEGER affinity 
+    maps to 'q' (64-bit integers), REAL and NUMERIC affinity to 'd' 
+    (doubles). Columns with TEXT or BLOB affinity have no typecode.
+
+    """
+
+    decltype = decltype.upper()
+    if 'INT' in decltype:
+        return 'q'
+    if any(name in decltype for name in ('CHAR', 'CLOB', 'TEXT', 'BLOB')):
+        return None
+    if decltype:
+        return 'd'
+    return None
+
+
+def _is_double(value):
+    """ Return True if a double can hold value exactly (NULL as NaN). """
+
+    if value is None or isinstance(value, float):
+        return True
+    return isinstance(value, int) and -2 ** 53 <= value <= 2 ** 53
+
+
+def _extend_column(column, values):
+    """ Append values to column, widening its type as needed.
+
+    An integer column that meets a float or NULL becomes a column of 
+    doubles, with NULL stored as NaN, unless it holds an integer that a
+    double cannot represent exactly. Any array that meets a value it 
+    cannot hold, including an integer out of its range, becomes a list.
+    Returns the column.
+
+    """
+
+    if isinstance(column, list):
+        column.extend(values)
+        return column
+    size = len(column)
+    try:
+        column.extend(values)
+    except (TypeError, OverflowError):
+        del column[size:]
+        if (all(_is_double(value) for value in values) and 
+                (column.typecode == 'd' 
+                 or all(_is_double(value) for value in column))):
+            if column.typecode == 'q':
+                column = array.array('d', column)
+            column.extend(float('nan') if value is None else value 
+                          for value in values)
+        else:
+            column = column.tolist()
+            column.extend(values)
+    return column
+
+
+def _sizeof(rows):
+    """ Estimate the memory used by a list of rows, in bytes. """
+
+    nbytes = sys.getsizeof(rows)
+    for row in rows:
+        nbytes += sys.getsizeof(row)
+        for value in row:
+            nbytes += sys.getsizeof(value)
+    return nbytes
+
+
+def _sort_key(value):
+    """ Return a key that sorts values as SQLite does: NULL first, then
+    integers and reals by value, then text, then blobs. """
+
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    return (3, bytes(value))
+
+
+def _freeze(parameters):
+    """ Return a hashable form of parameters, or None. 
+
+    Each value is paired with its type, since values that compare equal
+    (e.g., 1, 1.0 and True) may give different results (e.g., with 
+    typeof()).
+
+    """
+
+    if parameters is None:
+        return ()
+    if isinstance(parameters, dict):
+        frozen = tuple(sorted((name, (type(value), value))
+                              for name, value in parameters.items()))
+    else:
+        frozen = tuple((type(value), value) for value in parameters)
+    try:
+        hash(frozen)
+    except TypeError:
+        return None
+    return frozen
+
+
+class SQLite3DB(object):
+    """A simple wrapper class for working with sqlite3 databases.
+
+    This wrapper class is intended to help simplify your programmatic
+    interactions with sqlite3 databases in Python. It'll allow you to 
+    quickly create a database object and begin executing SQL 
+    statement(s) against it. There is no need to worry about opening
+    connections to the database, creating database cursors on those 
+    connections, or tracking what connections and/or cursors are opened
+    or closed at any given time. All of this boilerplate housekeeping
+    code is handled by the class' methods for you. The aim here is to 
+    simply get you working with your database sooner rather than later.
+
+    Behind the scenes, connections are kept in a bounded ConnectionPool
+    owned by the object, so the cost of opening a connection and setting
+    it up is paid once per connection rather than once per statement. 
+    Call close(), or use the object as a context manager, to close the 
+    pooled connections when you are done with the database.
+
+    Check out the example database interactions in the class' main 
+    function below.
+
+    Attributes:
+      database: str: required: Path to sqlite3 database.
+
+    Methods:
+      advise(queries, create): Propose indexes for foreign keys and for
+          a query workload.
+      analyze(): Gather statistics for the query planner.
+      backup(target, pages, pause, progress): Copy the database online.
+      blob(table, column, rowid): Open a BLOB for incremental I/O.
+      cache(flush_interval): Load database into memory with shared cache.
+      close(): Close all pooled connections to the database.
+      columns(sql, parameters): Return query results as one array per
+          column.
+      connect(): Open and return a connection to the database.
+      dump(target, compression): Dump the database to an ASCII text 
+          file.
+      dump_tables(directory, tables): Dump each table to its own file,
+          in parallel.
+      execute(sql, parameters, mode): Execute SQL statement(s).
+      execute_many(sql, parameters): Fast path for MANY mode.
+      execute_script(path): Fast path for SCRIPT mode.
+      flush(): Write the in-memory database back to disk.
+      iterblob(table, column, rowid): Iterate over a BLOB a chunk at a 
+          time.
+      iterquery(sql, parameters, size): Iterate lazily over query rows.
+      load(sql, rows): Bulk load rows from any iterable.
+      load_csv(sql, path): Bulk load rows from a CSV or TSV file.
+      metrics_text(): Report metrics in Prometheus text format.
+      query(sql, parameters): Fast path for NORMAL mode.
+      restore(source): Restore a dump written by dump() or 
+          dump_tables().
+      result_cache_info(): Report result cache use.
+      replicate(processes): Replicate in-memory database across 
+          multiple processes.
+      reset_stats(): Zero all metrics.
+      run_script(path, batch_size, offset): Execute a SQL script of 
+          any size, statement by statement, in batches.
+      scatter(queries): Run read queries in parallel on the replicas.
+      schema(): Describe the tables, columns, indexes and foreign keys.
+      settings(): Report the PRAGMA settings in effect.
+      slow_queries(): Return the most recent slow SQL statements.
+      statement_cache_info(): Report prepared statement cache use.
+      stats(): Report statement and connection timings.
+      submit(sql, parameters): Queue a write for group commit.
+      test(): Run a test SQL query against the database.
+      transaction(mode): Run work in one transaction.
+      uncache(): Flush and return to working with the database on disk.
+      unreplicate(): Shut down the replicas.
+      write(sql, parameters, timeout): Queue a write and wait for it.
+      write_blob(table, column, rowid, data): Replace a BLOB, writing 
+          it a chunk at a time.
+ 
+    """
+
+    def __init__(self, database=None, pool_min_size=0, pool_max_size=5,
+                 pool_idle_timeout=300.0, pool_health_check_interval=30.0,
+                 pool_timeout=None, profile=None, statement_cache_size=128,
+                 result_cache_size=0, result_cache_ttl=None,
+                 result_cache_bytes=None, result_cache_external=False,
+                 write_batch_size=100, write_max_latency=0.0,
+                 metrics=False, slow_query_time=None, trace_callback=None,
+                 progress_handler=None, progress_interval=1000):
+        """ Initializes SQLite3DB object.
+
+        Arguments:
+          database: str: required: Path to sqlite3 database.
+          pool_min_size: int: optional: Number of pooled connections 
+              kept open while idle.
+          pool_max_size: int: optional: Maximum number of pooled 
+              connections open at one time.
+          pool_idle_timeout: float: optional: Seconds an idle pooled 
+              connection beyond pool_min_size may live.
+          pool_health_check_interval: float: optional: Seconds of 
+              idleness after which a pooled connection is checked 
+              before reuse.
+          pool_timeout: float: optional: Seconds to wait for a pooled
+              connection when all are in use. Waits forever if None.
+          profile: str/dict: optional: Name of a set of PRAGMA settings
+              in PROFILES, or a dict of PRAGMA settings, to apply to 
+              each connection. Names must be in PRAGMAS, and values 
+              integers or keywords in PRAGMA_KEYWORDS.
+          result_cache_size: int: optional: Maximum number of query 
+              results to cache. Results are not cached if 0.
+          result_cache_ttl: float: optional: Seconds a cached result 
+              may be served. Results do not expire if None.
+          result_cache_bytes: int: optional: Maximum estimated size of 
+              all cached results, in bytes. Unlimited if None.
+          result_cache_external: bool: optional: Also watch for changes
+              made to the database by other processes and connections.
+              Any such change empties the whole result cache.
+          write_batch_size: int: optional: Maximum number of writes 
+              submitted with submit() that are committed together.
+          write_max_latency: float: optional: Maximum seconds a write 
+              submitted with submit() waits for others to join it.
+          statement_cache_size: int: optional: Number of prepared 
+              statements cached on each connection.
+          metrics: bool: optional: Time each SQL statement and each new
+              connection, and count the rows they return and change. 
+              Covers execute() and its fast paths, iterquery() (time 
+              spent in SQLite only), load() and load_csv() (per chunk),
+              scripts (by path) and writes made with submit(). See 
+              stats().
+          slow_query_time: float: optional: Seconds from which a SQL 
+              statement is logged as slow, with its query plan. Implies
+              metrics. See slow_queries().
+          trace_callback: callable: optional: Installed on each 
+              connection with set_trace_callback(). Called with the 
+              text of each SQL statement SQLite runs.
+          progress_handler: callable: optional: Installed on each 
+              connection with set_progress_handler(). Called every 
+              progress_interval SQLite virtual machine instructions; if
+              it returns a true value, then the running statement is 
+              interrupted.
+          progress_interval: int: optional: See progress_handler.
+
+        Returns:
+          None
+
+        Raises:
+          TypeError: database argument is NOT A STRING.
+          ValueError: database argument string is EMPTY.
+          ValueError: Pool sizes are NOT VALID.
+          ValueError: profile argument is NOT A KNOWN PROFILE.
+          ValueError: profile argument has an UNKNOWN PRAGMA NAME.
+          ValueError: profile argument has an INVALID PRAGMA VALUE.
+
+        """
+
+        # Start initialization of SQLite3DB object.
+        logging.info('Initializing SQLite3DB object: %s', self)
+
+        # Check if database argument is a string. If it is not a string, 
+        # then throw an exception.
+        logging.info('Type checking database argument ...')
+        try:
+            if not isinstance(database, str):
+                raise TypeError(('database argument is NOT A STRING: '
+                                 '{}').format(type(database)))
+        except TypeError as e:
+            logging.exception(e)
+            logging.debug('database argument MUST BE A STRING.')
+            raise
+        else:
+            logging.info('database argument is of type: %s', type(database))
+
+        # Check if database argument string is empty. If the string is 
+        # empty, then throw an exception.
+        logging.info('Checking if database argument string is empty ...')
+        try:
+            if not database:
+                raise ValueError('database argument string is EMPTY.')
+        except ValueError as e:
+            logging.exception(e)
+            logging.debug('database argument string CANNOT BE EMPTY.')
+            raise
+        else:
+            logging.info('database argument string is not empty: %s', database)
+
+        # Check if database argument string is a path to an existing 
+        # file. If the file does not exist, then throw a warning. In 
+        # either case, assign class instance variable self.database the 
+        # absolute path of the file indicated by the database argument 
+        # string.
+        logging.info('Checking if database argument string is a path '
+                     'to an existing file ...')
+        try:
+            if not os.path.isfile(database):
+                raise FileNotFoundError(('database argument string is '
+                                         'NOT A PATH TO AN EXISTING '
+                                         'FILE: {}'.format(database)))
+        except FileNotFoundError as w:
+            logging.warning(w)
+            logging.debug('If database file does not exist prior to '
+                          'instantiation of the SQLite3DB object, an '
+                          'empty sqlite3 database file will be created '
+                          'at the path specified by the database '
+                          'argument string upon the first connection '
+                          'established to the database.')
+        else:
+            logging.info('database argument string is a path to an '
+                         'existing file.')
+        finally:
+            self.database = os.path.abspath(database)
+            logging.info('Absolute path to database file is: %s',
+                         self.database)
+
+        # Look up the PRAGMA settings to apply to each connection.
+        logging.info('Checking profile argument ...')
+        try:
+            if profile is None:
+                self.profile = {}
+            elif isinstance(profile, dict):
+                self.profile = dict(profile)
+            elif profile in PROFILES:
+                self.profile = dict(PROFILES[profile])
+            else:
+                raise ValueError(('profile argument is NOT A KNOWN '
+                                  'PROFILE: {}').format(profile))
+            # Settings are formatted into PRAGMA statements, which cannot
+            # take parameters, so only known names and values are let in.
+            for pragma, value in self.profile.items():
+                if pragma not in PRAGMAS:
+                    raise ValueError(('profile argument has an UNKNOWN '
+                                      'PRAGMA NAME: {}').format(pragma))
+                if isinstance(value, bool):
+                    self.profile[pragma] = int(value)
+                elif not (isinstance(value, int) or isinstance(value, str)
+                          and value.upper() in PRAGMA_KEYWORDS):
+                    raise ValueError(('profile argument has an INVALID '
+                                      'PRAGMA VALUE: {} = {!r}').format(
+                                          pragma, value))
+        except ValueError as e:
+            logging.exception(e)
+            logging.debug('profile argument MUST BE ONE OF: %s',
+                          sorted(PROFILES))
+            raise
+        else:
+            logging.info('PRAGMA settings are: %s', self.profile)
+
+        # Keep count of prepared statement cache use across all of the 
+        # connections to the database.
+        self.statement_cache_size = statement_cache_size
+        self._statement_cache_lock = threading.Lock()
+        self._statement_cache_hits = 0
+        self._statement_cache_misses = 0
+
+        # Cache the rows returned by queries, if requested. Results are
+        # invalidated by table, based on the tables each statement reads
+        # and writes as recorded when the statement is prepared.
+        self._result_cache = None
+        if result_cache_size > 0:
+            self._result_cache = ResultCache(result_cache_size,
+                                             result_cache_ttl,
+                                             result_cache_bytes)
+        self._statement_tables = {}
+        self._statement_columns = {}
+        self._result_cache_external = result_cache_external
+
+        # The schema is described by a catalog loaded on first use, and
+        # loaded again only once the schema version changes.
+        self._schema = None
+        self._schema_lock = threading.Lock()
+        self._watcher = None
+        self._watcher_lock = threading.Lock()
+        self._data_version = None
+
+        # Time statements and connections, if requested, and install 
+        # any tracing hooks on each new connection.
+        self._metrics = None
+        if metrics or slow_query_time is not None:
+            self._metrics = Metrics(slow_query_time)
+        self.trace_callback = trace_callback
+        self.progress_handler = progress_handler
+        self.progress_interval = progress_interval
+
+        # The database is worked with on disk until it is cached in 
+        # memory with cache().
+        self._memory = None
+        self._keeper = None
+        self._disk = None
+        self._disk_version = None
+        self._flusher = None
+        self._flusher_stop = threading.Event()
+        self._flush_lock = threading.Lock()
+
+        # Read replicas are started on demand with replicate().
+        self._replicas = None
+        self._snapshot = None
+
+        # A thread may pin a connection for its own use, in which case 
+        # it is used in place of a pooled connection.
+        self._local = threading.local()
+
+        # Writes submitted with submit() are queued for a single writer
+        # connection, which is started on demand.
+        self.write_batch_size = write_batch_size
+        self.write_max_latency = write_max_latency
+        self._writer = None
+        self._writer_lock = threading.Lock()
+
+        # Create the pool of connections to the database. Connections 
+        # are opened lazily, unless a minimum pool size is requested.
+        logging.info('Creating connection pool ...')
+        self.pool_timeout = pool_timeout
+        self._pool = ConnectionPool(
+            self.connect, min_size=pool_min_size, max_size=pool_max_size,
+            idle_timeout=pool_idle_timeout,
+            health_check_interval=pool_health_check_interval)
+        logging.info('connection pool created: %s', self._pool)
+
+        # End initialization of SQLite3DB object.
+        logging.info('SQLite3DB object initialized: %s', self)
+
+
+    def connect(self):
+        """ Open and return a connection to the database. 
+
+        If the database has been cached in memory with cache(), then the
+        connection is made to the in-memory database.
+
+        Arguments:
+          None
+
+        Returns:
+          connection: sqlite3.Connection: A connection to the database 
+              that enforces foreign key constraints. The connection may
+              be shared between threads, but not used concurrently.
+        
+        Raises:
+          sqlite3.OperationalError: Unable to open database file.
+          sqlite3.ProgrammingError: Cannot operate on a closed cursor or database.
+
+        """
+
+        # Establish a connection to the database.
+        logging.info('Attempting to establish a connection to the '
+                     'database ...')
+        start = time.perf_counter()
+        try:
+            if self._memory is None:
+                connection = sqlite3.connect(
+                    self.database, check_same_thread=False,
+                    factory=Connection,
+                    cached_statements=self.statement_cache_size)
+            else:
+                connection = sqlite3.connect(
+                    self._memory, uri=True, check_same_thread=False,
+                    factory=Connection,
+                    cached_statements=self.statement_cache_size)
+        except sqlite3.OperationalError as e:
+            logging.exception(e)
+            logging.debug('Check permissions on the database file. '
+                          'database file must be readable to establish '
+                          'a connection.')
+            raise
+        else:
+            logging.info('connection established: %s', connection)
+
+        # Create a database cursor on the connection.
+        logging.info('Creating a database cursor on the connection ...')
+        try:
+            cursor = connection.cursor()
+        except sqlite3.ProgrammingError as e:
+            logging.exception(e)
+            raise
+        else:
+            logging.info('cursor created: %s', cursor)
+
+        # Enable foreign key constraints on database connection.
+        logging.info('Enabling foreign key constraints ... ')
+        try:
+            cursor.execute('PRAGMA foreign_keys = ON;')
+        except Exception as e:
+            logging.exception(e)
+            raise
+        else:
+            cursor.execute('PRAGMA foreign_keys;')
+            connection.pragmas['foreign_keys'] = cursor.fetchone()[0]
+            if connection.pragmas['foreign_keys'] == 1:
+                logging.info('Foreign key constraints enabled.')
+
+        # Apply the PRAGMA settings of the profile to the connection. 
+        # Read each setting back, since SQLite may not honor a request 
+        # (e.g., WAL journaling is not available to in-memory 
+        # databases).
+        if self.profile:
+            logging.info('Applying PRAGMA settings ...')
+        try:
+            for pragma, value in self.profile.items():
+                cursor.execute('PRAGMA {} = {};'.format(pragma, value))
+                cursor.fetchall()
+                cursor.execute('PRAGMA {};'.format(pragma))
+                row = cursor.fetchone()
+                connection.pragmas[pragma] = row[0] if row else None
+        except Exception as e:
+            logging.exception(e)
+            connection.close()
+            raise
+        else:
+            if self.profile:
+                logging.info('PRAGMA settings in effect: %s',
+                             connection.pragmas)
+
+        # Record the tables touched by each statement prepared on the 
+        # connection, so that the result cache can be kept up to date,
+        # columns() can type its results, and statement cache hits can 
+        # be told from misses. The authorizer is only called while a 
+        # statement is prepared, so it costs nothing on a cache hit.
+        # Installing an authorizer expires all prepared statements, so 
+        # it is never changed afterwards.
+        connection.set_authorizer(connection.tables.authorize)
+
+        # Install any tracing hooks.
+        if self.trace_callback is not None:
+            connection.set_trace_callback(self.trace_callback)
+        if self.progress_handler is not None:
+            connection.set_progress_handler(self.progress_handler,
+                                            self.progress_interval)
+
+        # Close database cursor.
+        logging.info('Closing database cursor ...')
+        try:
+            cursor.close()
+        except Exception as e:
+            logging.exception(e)
+            raise
+        else:
+            logging.info('cursor closed: %s', cursor)
+
+        if self._metrics is not None:
+            self._metrics.observe_connect(time.perf_counter() - start)
+
+        # Return database connection.
+        logging.info('Returning database connection: %s', connection)
+
+        return connection
+
+
+    def close(self):
+        """ Close all pooled connections to the database.
+
+        Any writes queued with submit() are committed first, and if the
+        database is cached in memory, then it is flushed back to disk. 
+        Any replicas are shut down.
+
+        If the file on disk was changed by another connection while the
+        database was cached, then nothing is closed and the database 
+        stays cached; call uncache(force=True) or close() again after 
+        resolving the conflict.
+
+        Arguments:
+          None
+
+        Returns:
+          None
+
+        Raises:
+          sqlite3.OperationalError: database file was CHANGED BY ANOTHER
+              CONNECTION while cached in memory.
+
+        """
+
+        self._stop_writer()
+        if self._replicas is not None:
+            self.unreplicate()
+        if self._memory is not None:
+            self.uncache()
+        self._reset_result_cache()
+        logging.info('Closing connection pool ...')
+        self._pool.close()
+        logging.info('connection pool closed: %s', self._pool)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+    def settings(self):
+        """ Report the PRAGMA settings in effect.
+
+        Arguments:
+          None
+
+        Returns:
+          settings: dict: The value of each PRAGMA setting in SETTINGS,
+              and in the profile, as reported by a pooled connection.
+
+        Raises:
+          sqlite3.OperationalError: Unable to open database file.
+
+        """
+
+        settings = {}
+        with self._connection() as connection:
+            with contextlib.closing(connection.cursor()) as cursor:
+                for pragma in SETTINGS + tuple(self.profile):
+                    cursor.execute('PRAGMA {};'.format(pragma))
+                    row = cursor.fetchone()
+                    settings[pragma] = row[0] if row else None
+        return settings
+
+
+    def statement_cache_info(self):
+        """ Report prepared statement cache use.
+
+        Arguments:
+          None
+
+        Returns:
+          info: StatementCacheInfo: Number of SQL statements executed 
+              across all connections that were taken from the prepared
+              statement cache (hits) and that had to be prepared 
+              (misses), and the size of the cache on each connection. 
+              Statements run by execute() in SCRIPT mode, by scripts, 
+              and for the object's own purposes are not counted.
+
+        Raises:
+          None
+
+        """
+
+        with self._statement_cache_lock:
+            return StatementCacheInfo(self._statement_cache_hits,
+                                      self._statement_cache_misses,
+                                      self.statement_cache_size)
+
+
+    def result_cache_info(self):
+        """ Report result cache use.
+
+        Arguments:
+          None
+
+        Returns:
+          info: ResultCacheInfo: Number of result cache hits, misses, 
+              evictions and invalidations, and the size of the cache. 
+              None if results are not cached.
+
+        Raises:
+          None
+
+        """
+
+        if self._result_cache is None:
+            return None
+        return self._result_cache.info()
+
+
+    def schema(self):
+        """ Describe the schema of the database.
+
+        The catalog is loaded once, then reused for as long as PRAGMA 
+        schema_version stays the same, so that checking it costs only 
+        that one PRAGMA.
+
+        Arguments:
+          None
+
+        Returns:
+          catalog: SchemaCatalog: The database's tables, with their 
+              columns, declared types, indexes and foreign keys, and its
+              views.
+
+        Raises:
+          sqlite3.OperationalError: Unable to open database file.
+
+        """
+
+        with self._connection() as connection:
+            return self._catalog(connection)
+
+
+    def _catalog(self, connection):
+        """ Return the schema catalog, checked on connection. 
+
+        A catalog read inside a transaction that has not been committed
+        may describe changes that will be rolled back, so it is not 
+        kept.
+
+        """
+
+        version, = connection.execute('PRAGMA schema_version;').fetchone()
+        cached = self._schema
+        if cached is not None and cached[0] == (self._memory, version):
+            return cached[1]
+        with self._schema_lock:
+            catalog = SchemaCatalog.load(connection)
+            if not connection.in_transaction:
+                self._schema = ((self._memory, catalog.version), catalog)
+        logging.info('Schema catalog loaded, version: %s', catalog.version)
+        return catalog
+
+
+    def stats(self):
+        """ Report the time spent executing SQL statements and opening 
+        connections.
+
+        Arguments:
+          None
+
+        Returns:
+          stats: dict: Histograms of statement and connection times, 
+              counts of statements by execution mode, of rows returned
+              and changed, and of slow queries, and the same per 
+              distinct SQL statement (under 'by_statement'). None if 
+              metrics are not enabled.
+
+        Raises:
+          None
+
+        """
+
+        if self._metrics is None:
+            return None
+        return self._metrics.snapshot()
+
+
+    def metrics_text(self):
+        """ Report the same as stats() in Prometheus text format.
+
+        Statement cache and result cache use are reported as well.
+
+        Arguments:
+          None
+
+        Returns:
+          text: str: Metrics in Prometheus text exposition format. None
+              if metrics are not enabled.
+
+        Raises:
+          None
+
+        """
+
+        if self._metrics is None:
+            return None
+        lines = [self._metrics.prometheus()]
+        caches = [('statement_cache', self.statement_cache_info())]
+        if self._result_cache is not None:
+            caches.append(('result_cache', self.result_cache_info()))
+        for name, info in caches:
+            for field in ('hits', 'misses'):
+                lines.append(('# TYPE sqlite3db_{0}_{1}_total counter\n'
+                              'sqlite3db_{0}_{1}_total {2}\n').format(
+                                  name, field, getattr(info, field)))
+        return ''.join(lines)
+
+
+    def slow_queries(self):
+        """ Return the most recent slow SQL statements.
+
+        Arguments:
+          None
+
+        Returns:
+          records: list: One dict per slow statement, oldest first, 
+              with its 'sql', execution 'mode', 'seconds', 'rows', 
+              'changes', the 'time' it finished, and its query 'plan' 
+              as a list of lines (None if it could not be explained).
+
+        Raises:
+          None
+
+        """
+
+        if self._metrics is None:
+            return []
+        return self._metrics.slow_queries()
+
+
+    def analyze(self, full=True):
+        """ Gather statistics for the query planner.
+
+        Runs ANALYZE, which scans every table and index, and then 
+        PRAGMA optimize, which also keeps the statistics up to date 
+        later on. With full False, only PRAGMA optimize is run, which 
+        analyzes only the tables whose statistics look stale.
+
+        Arguments:
+          full: bool: optional: Run ANALYZE first.
+
+        Returns:
+          seconds: float: Time taken.
+
+        Raises:
+          sqlite3.OperationalError: database is locked.
+
+        """
+
+        logging.info('Gathering statistics for the query planner ...')
+        start = time.perf_counter()
+        try:
+            with self._connection() as connection:
+                with self._scope(connection):
+                    if full:
+                        connection.execute('ANALYZE;')
+                    connection.execute('PRAGMA optimize;')
+        except Exception as e:
+            logging.exception(e)
+            raise
+        seconds = time.perf_counter() - start
+        logging.info('Statistics gathered in %.3f s.', seconds)
+        return seconds
+
+
+    def advise(self, queries=None, create=False, analyze=True, repeat=3):
+        """ Propose indexes for foreign keys and for a query workload.
+
+        An index on the columns of every foreign key that do not lead 
+        an index is proposed (one index for all of the columns of a 
+        composite key), since without one each join on it, and each ON
+        DELETE or ON UPDATE action, reads the whole child table. Each 
+        query of the workload whose plan (from EXPLAIN QUERY PLAN) scans
+        a table, or builds an automatic index on it, is then tried 
+        against a copy of the schema with an index on each unindexed 
+        column it reads, and the most selective index that the planner 
+        would use to search rather than scan is proposed too.
+
+        The estimated speedup of an index is the number of distinct 
+        values in its columns, i.e., the factor by which it cuts the 
+        rows read by a lookup on one value. If create is True, then the
+        indexes are created, and kept only if the planner then uses them
+        for a query of the workload or, for a foreign key, for a lookup
+        of the child rows of one parent row; the others are dropped 
+        again. The speedup of each query of the workload that only reads
+        is measured, as the ratio of its best times out of repeat runs 
+        before and after, and an index proposed for scans that makes 
+        every query that uses it slower is dropped too.
+
+        Arguments:
+          queries: list: optional: SQL statements, or (sql, parameters)
+              pairs, making up the workload. Defaults to the statements
+              recorded by the metrics (see stats()), if enabled.
+          create: bool: optional: Create the proposed indexes.
+          analyze: bool: optional: Once the indexes are created, run 
+              analyze() so that the planner knows about them.
+          repeat: int: optional: Number of timed runs of each query.
+
+        Returns:
+          advice: dict: The proposed 'indexes', each a dict with the 
+              'table', its 'columns', the 'sql' to create it, the 
+              'reasons' for it, its 'estimated_speedup', whether it was
+              'created' (and kept) and whether the planner 'used' it 
+              (None unless create is True); and the workload 'queries',
+              each a dict with its 'sql', 
+              its 'plan' (and 'plan_after', 'seconds_before', 
+              'seconds_after' and 'speedup' if indexes were created).
+
+        Raises:
+          sqlite3.OperationalError: database is locked.
+
+        """
+
+        if queries is None:
+            queries = self._metrics.workload() if self._metrics else []
+        workload = [(query, ()) if isinstance(query, str) else 
+                    (query[0], query[1] if query[1] is not None else ())
+                    for query in queries]
+
+        logging.info('Looking for missing indexes ...')
+        proposals = {}
+
+        def propose(table, columns, reason):
+            key = (table.lower(), tuple(column.lower() for column in columns))
+            if key not in proposals:
+                name = '_'.join((table,) + tuple(columns) + ('idx',))
+                proposals[key] = {
+                    'table': table, 'columns': list(columns), 
+                    'name': name,
+                    'sql': 'CREATE INDEX IF NOT EXISTS {} ON {} ({});'
+                           .format(_quote(name), _quote(table), 
+                                   ', '.join(_quote(column) 
+                                             for column in columns)),
+                    'reasons': [], 'estimated_speedup': None, 
+                    'created': False, 'used': None, 'lookup': None}
+            if reason not in proposals[key]['reasons']:
+                proposals[key]['reasons'].append(reason)
+            return proposals[key]
+
+        @functools.lru_cache(maxsize=None)
+        def distinct(table, columns):
+            # fetchall() finishes the statement, so that it does not hold
+            # a read transaction open on a stale snapshot of the schema.
+            return reader.execute(
+                'SELECT count(*) FROM (SELECT DISTINCT {} FROM {});'.format(
+                    ', '.join(_quote(column) for column in columns),
+                    _quote(table))).fetchall()[0][0]
+
+        def covered(table, columns):
+            if len(columns) == 1:
+                return (columns[0].lower() 
+                        in catalog.indexed_columns(table.name))
+            wanted = {column.lower() for column in columns}
+            return any({(column or '').lower() for column 
+                        in index.columns[:len(columns)]} == wanted
+                       for index in table.indexes)
+
+        # Time the queries on a connection of their own that cannot 
+        # write, so that no statement of the workload changes anything.
+        reader = self.connect()
+        try:
+            reader.execute('PRAGMA query_only = ON;')
+            catalog = self._catalog(reader)
+
+            # Foreign keys without indexes.
+            for table in catalog.tables.values():
+                for key in table.foreign_keys:
+                    if not covered(table, key.columns):
+                        proposal = propose(
+                            table.name, tuple(key.columns), 
+                            'foreign key to {}({})'.format(
+                                key.table, ', '.join(
+                                    column or 'rowid' 
+                                    for column in key.references)))
+                        # The lookup SQLite makes for the child rows of 
+                        # a parent row when enforcing the key.
+                        proposal['lookup'] = 'SELECT 1 FROM {} WHERE {};' \
+                            .format(_quote(table.name), ' AND '.join(
+                                '{} = ?'.format(_quote(column)) 
+                                for column in key.columns))
+
+            # Scans in the workload, tried out on a copy of the schema.
+            results = []
+            # The copy has the foreign key indexes already proposed, so 
+            # that scans they would remove are not looked into.
+            copy = _schema_copy(reader)
+            try:
+                for proposal in proposals.values():
+                    copy.execute(proposal['sql'])
+                for sql, parameters in workload:
+                    plan = _explain(reader, sql, parameters)
+                    result = {'sql': sql, 'plan': plan}
+                    results.append((result, parameters))
+                    if not _scans(plan) or not _scans(
+                            _explain(copy, sql, parameters)):
+                        continue
+                    reads = set()
+
+                    def authorize(action, table, column, *args):
+                        if action == sqlite3.SQLITE_READ and column:
+                            reads.add((table, column))
+                        return sqlite3.SQLITE_OK
+
+                    copy.set_authorizer(authorize)
+                    _explain(copy, sql, parameters)
+                    copy.set_authorizer(None)
+
+                    # Of the indexes the planner would search, propose 
+                    # the most selective.
+                    useful = []
+                    for table, column in sorted(reads):
+                        if column.lower() in catalog.indexed_columns(
+                                table) or any(
+                                    key[0] == table.lower() 
+                                    and key[1][0] == column.lower() 
+                                    for key in proposals):
+                            continue
+                        name = 'sqlite3db_advise_idx'
+                        copy.execute('CREATE INDEX {} ON {} ({});'.format(
+                            name, _quote(table), _quote(column)))
+                        trial = _explain(copy, sql, parameters) or []
+                        copy.execute('DROP INDEX {};'.format(name))
+                        if any('SEARCH' in line and name in line 
+                               for line in trial):
+                            useful.append((distinct(table, (column,)), 
+                                           table, column))
+                    if useful:
+                        _, table, column = max(useful)
+                        propose(table, (column,), 'scan in: {}'.format(
+                            ' '.join(sql.split())))
+            finally:
+                copy.close()
+
+            for proposal in proposals.values():
+                proposal['estimated_speedup'] = float(max(distinct(
+                    proposal['table'], tuple(proposal['columns'])), 1))
+            logging.info('%s indexes proposed.', len(proposals))
+
+            if create and proposals:
+                for result, parameters in results:
+                    result['seconds_before'] = self._time_query(
+                        reader, result['sql'], parameters, repeat)
+                logging.info('Creating indexes ...')
+                with self._connection() as connection:
+                    with self._scope(connection):
+                        for proposal in proposals.values():
+                            exists = connection.execute(
+                                """ SELECT 1 FROM sqlite_master 
+                                    WHERE type = 'index' AND name = ?; """,
+                                (proposal['name'],)).fetchone()
+                            connection.execute(proposal['sql'])
+                            proposal['created'] = not exists
+                if analyze:
+                    self.analyze()
+
+                def measure():
+                    for result, parameters in results:
+                        result['plan_after'] = _explain(
+                            reader, result['sql'], parameters)
+                        result['seconds_after'] = self._time_query(
+                            reader, result['sql'], parameters, repeat)
+                        result['speedup'] = None
+                        if result['seconds_before'] and \
+                                result['seconds_after']:
+                            result['speedup'] = (result['seconds_before'] /
+                                                 result['seconds_after'])
+
+                def drop(unused, why):
+                    logging.info('Dropping %s %s indexes ...', len(unused),
+                                 why)
+                    with self._connection() as connection:
+                        with self._scope(connection):
+                            for proposal in unused:
+                                connection.execute('DROP INDEX IF EXISTS '
+                                                   '{};'.format(_quote(
+                                                       proposal['name'])))
+                                proposal['created'] = False
+                                proposal['used'] = False
+
+                # Drop the indexes that the planner does not use, for the
+                # workload or for the lookups of foreign keys.
+                measure()
+                for proposal in proposals.values():
+                    used = set()
+                    plans = [result['plan_after'] for result, _ in results]
+                    if proposal['lookup'] is not None:
+                        plans.append(_explain(
+                            reader, proposal['lookup'], 
+                            (None,) * len(proposal['columns'])))
+                    for line in itertools.chain.from_iterable(
+                            plan or [] for plan in plans):
+                        used.update(line.split())
+                    proposal['used'] = proposal['name'] in used
+                unused = [proposal for proposal in proposals.values() 
+                          if proposal['created'] and not proposal['used']]
+                if unused:
+                    drop(unused, 'unused')
+
+                # Drop the indexes proposed for scans that made every 
+                # query using them slower.
+                slower = []
+                for proposal in proposals.values():
+                    if not proposal['created'] or proposal['lookup']:
+                        continue
+                    speedups = [result['speedup'] for result, _ in results
+                                if any(proposal['name'] in line.split() 
+                                       for line in result['plan_after'] 
+                                       or [])]
+                    if speedups and all(speedup is not None and speedup < 1
+                                        for speedup in speedups):
+                        slower.append(proposal)
+                if slower:
+                    drop(slower, 'ineffective')
+                if unused or slower:
+                    if analyze:
+                        self.analyze()
+                    measure()
+        finally:
+            reader.close()
+
+        for proposal in proposals.values():
+            del proposal['name'], proposal['lookup']
+        return {'indexes': list(proposals.values()), 
+                'queries': [result for result, _ in results]}
+
+
+    @staticmethod
+    def _time_query(connection, sql, parameters, repeat):
+        """ Return the best time of repeat runs of a query, or None if 
+        it cannot be run on the (read only) connection. """
+
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            try:
+                connection.execute(sql, parameters).fetchall()
+            except (sqlite3.Error, ValueError) as e:
+                logging.debug('Cannot time SQL statement: %s', e)
+                return None
+            seconds = time.perf_counter() - start
+            best = seconds if best is None else min(best, seconds)
+        return best
+
+
+    def reset_stats(self):
+        """ Zero all metrics and empty the slow query log. """
+
+        if self._metrics is not None:
+            self._metrics.reset()
+
+
+    def _observe(self, connection, sql, parameters, mode, seconds, rows,
+                 changes):
+        """ Record the execution of sql in the metrics.
+
+        If the statement was slow, then its query plan is captured on 
+        the connection it ran on and it is added to the slow query log.
+        For a script, sql is the path to the script.
+
+        """
+
+        if not self._metrics.observe(sql, mode, seconds, rows, changes,
+                                     parameters):
+            return
+        plan = None
+        if mode != 'SCRIPT':
+            plan = _explain(connection, sql, parameters)
+        self._metrics.log_slow({'sql': sql, 'mode': mode, 
+                                'seconds': seconds, 'rows': rows, 
+                                'changes': changes, 'time': time.time(),
+                                'plan': plan})
+        logging.warning('Slow SQL %s (%.3f s): %s\n%s', 'script' if mode 
+                        == 'SCRIPT' else 'statement', seconds,
+                        ' '.join(sql.split()), 
+                        '\n'.join(plan or ['(no query plan)']))
+
+
+    def _cached(self, sql, parameters):
+        """ Return the cache key and any cached rows for a query. 
+
+        The key is None if the parameters cannot be hashed, in which 
+        case the result is never cached.
+
+        """
+
+        if self._result_cache_external:
+            self._check_data_version()
+        frozen = _freeze(parameters)
+        if frozen is None:
+            return None, None
+        key = (sql, frozen)
+        rows = self._result_cache.get(key)
+        return key, rows
+
+
+    def _settle(self, connection, sql, key=None, rows=None, epoch=None):
+        """ Update the result cache after executing sql on connection.
+
+        If the statement wrote to any tables, then cached results that 
+        read from them are invalidated. Otherwise, if a key is given, 
+        then the rows returned by the statement are cached, unless it 
+        read no tables or its result can change without any table 
+        changing (e.g., SELECT random(); or SELECT date('now');), in
+        which case the rows are not cached. If it is not
+        known which tables the statement touched, or the statement did 
+        anything other than read and write rows, then the result cache 
+        is emptied. Inside a transaction(), nothing is cached, and 
+        invalidation is put off until the transaction is committed.
+
+        """
+
+        tables = self._tables(connection, sql)
+        if self._in_transaction():
+            self._local.pending.append(tables)
+            return
+        if tables is None or tables[2]:
+            self._result_cache.clear()
+        elif tables[1]:
+            self._result_cache.invalidate(tables[1])
+        elif (key is not None and not connection.in_transaction
+              and tables[0] and not tables[3]):
+            self._result_cache.put(key, tuple(rows), tables[0], epoch)
+
+
+    def _tables(self, connection, sql):
+        """ Return the tables touched by executing sql on connection.
+
+        Returns a tuple of the set of tables read, the set of tables 
+        written, whether the statement did anything else, and whether 
+        its result is non-deterministic, or None if this is not known. 
+        The connection's TableTracker is reset.
+
+        """
+
+        tracker = connection.tables
+        if sql is None:
+            tables = None
+        elif tracker.prepared:
+            tables = (frozenset(tracker.reads), frozenset(tracker.writes),
+                      tracker.other, tracker.volatile or (
+                          tracker.dated and _NOW.search(sql) is not None))
+            if len(self._statement_tables) >= 4096:
+                self._statement_tables.clear()
+            self._statement_tables[sql] = tables
+        else:
+            tables = self._statement_tables.get(sql)
+        tracker.reset()
+        return tables
+
+
+    def _typecodes(self, connection, sql, parameters, names):
+        """ Return the array typecodes of the columns named names.
+
+        The statement must just have been executed on connection. The 
+        table columns it reads are noted when it is prepared, and 
+        remembered, since a statement found in the connection's prepared 
+        statement cache is not prepared again. A column is typed from the declared type of the table columns of 
+        that name that sql read, if they all map to one typecode, and 
+        no other column of the result, and no alias (AS name) in sql, 
+        has the same name. Otherwise, its typecode is False, and it is 
+        returned as a list. A column that matches no table column read,
+        e.g., an aggregate, has a typecode of None, to be guessed from 
+        its values.
+
+        """
+
+        tracker = connection.tables
+        read = None
+        if tracker.prepared:
+            read = frozenset(tracker.columns)
+        elif sql not in self._statement_columns:
+            # The statement was prepared by a call that did not note the
+            # columns it reads. EXPLAIN prepares it again without 
+            # running it.
+            tracker.reset()
+            try:
+                connection.execute('EXPLAIN ' + sql, parameters).close()
+            except sqlite3.Error as e:
+                logging.debug('Cannot explain SQL statement: %s', e)
+            if tracker.prepared:
+                read = frozenset(tracker.columns)
+        if read is not None:
+            if len(self._statement_columns) >= 4096:
+                self._statement_columns.clear()
+            self._statement_columns[sql] = read
+        read = self._statement_columns.get(sql)
+        self._tables(connection, sql)
+        if read is None:
+            return [False] * len(names)
+        catalog = self._catalog(connection)
+        declared = {}
+        for table, name in read:
+            info = catalog.table(table)
+            for column in (info.columns if info else ()):
+                if column.name.lower() == name.lower():
+                    declared.setdefault(name.lower(), set()).add(
+                        _typecode(column.type))
+        counts = collections.Counter(name.lower() for name in names)
+        typecodes = []
+        for name in names:
+            found = declared.get(name.lower())
+            if found is None:
+                typecodes.append(None)
+            elif (len(found) == 1 and counts[name.lower()] == 1 and not
+                  re.search(r'\bAS\s+[\[`"\']?{}\b'.format(re.escape(name)),
+                            sql, re.IGNORECASE)):
+                typecodes.append(next(iter(found)) or False)
+            else:
+                typecodes.append(False)
+        return typecodes
+
+
+    @staticmethod
+    def _guess_typecodes(typecodes, chunk):
+        """ Fill in typecodes of None from the first values of chunk. """
+
+        guessed = []
+        for typecode, values in zip(typecodes, chunk):
+            if typecode is None:
+                value = next((value for value in values 
+                              if value is not None), None)
+                if isinstance(value, int):
+                    typecode = 'q'
+                elif isinstance(value, float):
+                    typecode = 'd'
+            guessed.append(typecode)
+        return guessed
+
+
+    def _invalidate(self, tables):
+        """ Invalidate cached results after a group of writes. 
+
+        tables is a list of values returned by _tables().
+
+        """
+
+        if any(touched is None or touched[2] for touched in tables):
+            self._result_cache.clear()
+            return
+        writes = set()
+        for touched in tables:
+            writes.update(touched[1])
+        if writes:
+            self._result_cache.invalidate(writes)
+
+
+    def _check_data_version(self):
+        """ Empty the result cache if the database has changed.
+
+        PRAGMA data_version changes whenever a change to the database 
+        is committed by any connection other than the one it is read 
+        on, so it is read on a connection kept aside for that purpose.
+
+        """
+
+        with self._watcher_lock:
+            if self._watcher is None:
+                self._watcher = self.connect()
+            version = _data_version(self._watcher)
+            if version != self._data_version:
+                if self._data_version is not None:
+                    self._result_cache.clear()
+                self._data_version = version
+
+
+    def _reset_result_cache(self):
+        """ Empty the result cache and close the watcher connection. """
+
+        if self._result_cache is None:
+            return
+        self._result_cache.clear()
+        self._statement_tables.clear()
+        with self._watcher_lock:
+            if self._watcher is not None:
+                self._watcher.close()
+                self._watcher = None
+            self._data_version = None
+
+
+    def _count_statement(self, connection):
+        """ Record whether the statement just executed on connection 
+        was taken from its prepared statement cache. """
+
+        hit = connection.statements.record(connection.tables.prepared)
+        with self._statement_cache_lock:
+            if hit:
+                self._statement_cache_hits += 1
+            else:
+                self._statement_cache_misses += 1
+
+
+    def cache(self, flush_interval=None):
+        """ Load database into memory with shared cache.
+
+        This method copies the database on disk into an in-memory 
+        database using SQLite's online backup API. The in-memory 
+        database is opened with a shared cache, so that all of the 
+        pooled connections work with the same copy of the database in 
+        RAM. Changes are NOT written back to disk until flush() is 
+        called, either explicitly, every flush_interval seconds, or by
+        uncache() or close().
+
+        While the database is cached, other processes and connections 
+        to the file on disk do NOT see changes made in memory, and the 
+        cache does NOT see changes they make to the file. flush() 
+        refuses to overwrite such changes unless forced.
+
+        Note that connections to a shared cache use table-level locks,
+        so a write may fail with 'database table is locked' while 
+        another connection is reading from the same table.
+
+        Arguments:
+          flush_interval: float: optional: If given, then flush the 
+              in-memory database back to disk every flush_interval 
+              seconds from a background thread.
+
+        Returns:
+          None
+
+        Raises:
+          sqlite3.OperationalError: Unable to open database file.
+
+        """
+
+        if self._memory is not None:
+            logging.warning('database is already cached in memory.')
+            return
+        self._stop_writer()
+
+        # Copy the database into a shared-cache in-memory database. The 
+        # in-memory database lives as long as at least one connection to 
+        # it remains open, so one connection is kept aside for that.
+        memory = 'file:sqlite3db-{}-{}?mode=memory&cache=shared'.format(
+            os.getpid(), id(self))
+        logging.info('Loading database into memory: %s', memory)
+        keeper = sqlite3.connect(memory, uri=True, check_same_thread=False)
+
+        # One connection to the file on disk is kept open as well, and 
+        # its data version is noted before the copy is taken, so that 
+        # flush() can tell whether anybody else has written to the file
+        # since.
+        disk = sqlite3.connect(self.database, check_same_thread=False)
+        try:
+            data_version = _data_version(disk)
+            with self._connection() as connection:
+                connection.backup(keeper)
+        except Exception as e:
+            logging.exception(e)
+            keeper.close()
+            disk.close()
+            raise
+        self._keeper = keeper
+        self._disk = disk
+        self._disk_version = data_version
+        self._memory = memory
+
+        # Retire pooled connections to the database on disk.
+        self._pool.reset()
+        self._reset_result_cache()
+        logging.info('database loaded into memory.')
+
+        if flush_interval is not None:
+            self._flusher_stop.clear()
+            self._flusher = threading.Thread(
+                target=self._flush_periodically, args=(flush_interval,),
+                name='sqlite3db-flusher', daemon=True)
+            self._flusher.start()
+
+
+    def flush(self, force=False):
+        """ Write the in-memory database back to disk.
+
+        The whole file on disk is replaced by the in-memory database. 
+        If another process or connection has written to the file since 
+        it was cached with cache() or last flushed, then those writes 
+        would be lost, so they are detected with SQLite's 
+        PRAGMA data_version and the flush is refused, unless forced.
+
+        Arguments:
+          force: bool: optional: If True, then overwrite the file on 
+              disk even if it was changed by somebody else while cached.
+
+        Returns:
+          None
+
+        Raises:
+          sqlite3.OperationalError: Unable to open database file.
+          sqlite3.OperationalError: database file was CHANGED BY ANOTHER
+              CONNECTION while cached in memory.
+
+        """
+
+        with self._flush_lock:
+            if self._memory is None:
+                logging.info('database is not cached in memory; nothing '
+                             'to flush.')
+                return
+            if _data_version(self._disk) != self._disk_version:
+                if not force:
+                    raise sqlite3.OperationalError(
+                        ('database file was CHANGED BY ANOTHER CONNECTION '
+                         'while cached in memory; flush(force=True) '
+                         'overwrites the changes: {}').format(self.database))
+                logging.warning('database file was changed by another '
+                                'connection while cached in memory; '
+                                'overwriting the changes: %s', self.database)
+            logging.info('Flushing in-memory database to disk: %s',
+                         self.database)
+            with self._connection() as connection:
+                connection.backup(self._disk)
+            self._disk_version = _data_version(self._disk)
+            logging.info('Flush complete.')
+
+
+    def uncache(self, force=False):
+        """ Flush and return to working with the database on disk.
+
+        If the flush is refused because the file on disk was changed by
+        another connection while cached, then the database stays cached,
+        so that nothing is lost.
+
+        Arguments:
+          force: bool: optional: If True, then overwrite the file on 
+              disk even if it was changed by somebody else while cached.
+
+        Returns:
+          None
+
+        Raises:
+          sqlite3.OperationalError: Unable to open database file.
+          sqlite3.OperationalError: database file was CHANGED BY ANOTHER
+              CONNECTION while cached in memory.
+
+        """
+
+        if self._memory is None:
+            return
+
+        self._stop_writer()
+        if self._flusher is not None:
+            self._flusher_stop.set()
+            self._flusher.join()
+            self._flusher = None
+        self.flush(force)
+
+        logging.info('Returning to database on disk ...')
+        self._memory = None
+        self._pool.reset()
+        self._reset_result_cache()
+        self._keeper.close()
+        self._keeper = None
+        self._disk.close()
+        self._disk = None
+        self._disk_version = None
+
+
+    def _flush_periodically(self, interval):
+        """ Call flush() every interval seconds until stopped. """
+
+        while not self._flusher_stop.wait(interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logging.exception(e)
+
+
+    def replicate(self, processes=None):
+        """ Replicate in-memory database across multiple processes.
+
+        This method takes a consistent snapshot of the database with 
+        SQLite's online backup API and starts a pool of worker 
+        processes, each of which loads the snapshot into its own private
+        in-memory, read-only database. Independent read queries can then
+        be fanned out across the replicas with scatter(), so that they 
+        run on multiple cores at once rather than on one.
+
+        Replicas do NOT see changes made to the database after they are
+        started. Call replicate() again to refresh them from a new 
+        snapshot after writes.
+
+        Arguments:
+          processes: int: optional: Number of replicas. Defaults to the
+              number of CPUs.
+
+        Returns:
+          None
+
+        Raises:
+          sqlite3.OperationalError: Unable to open database file.
+
+        """
+
+        if self._replicas is not None:
+            logging.info('Refreshing replicas ...')
+            self.unreplicate()
+
+        # Take a snapshot of the database. The snapshot is taken from a
+        # pooled connection, so it includes changes made to a database 
+        # cached in memory that have not yet been flushed to disk.
+        descriptor, snapshot = tempfile.mkstemp(prefix='sqlite3db-',
+                                                suffix='.db')
+        os.close(descriptor)
+        logging.info('Taking snapshot of database: %s', snapshot)
+        try:
+            with self._connection() as connection:
+                with contextlib.closing(sqlite3.connect(snapshot)) as target:
+                    connection.backup(target)
+        except Exception as e:
+            logging.exception(e)
+            os.remove(snapshot)
+            raise
+
+        # Make sure the snapshot loads here before starting the replicas, 
+        # so that a failure is raised to the caller rather than by each 
+        # replica.
+        try:
+            _load_replica(snapshot).close()
+        except Exception as e:
+            logging.exception(e)
+            os.remove(snapshot)
+            raise
+
+        # Start the replicas. A fresh interpreter is spawned for each 
+        # one, rather than forked, since this process may be running 
+        # threads (e.g., a periodic flush) that do not survive a fork.
+        logging.info('Starting replicas ...')
+        context = multiprocessing.get_context('spawn')
+        self._replicas = context.Pool(processes, _replica_initializer,
+                                      (snapshot,))
+        self._snapshot = snapshot
+        logging.info('Replicas started: %s', self._replicas)
+
+
+    def scatter(self, queries=None):
+        """ Run read queries in parallel on the replicas.
+
+        Arguments:
+          queries: list: required: SQL statements to execute. Each item
+              is either a string or a tuple of a string and the 
+              parameters to bind to it.
+
+        Returns:
+          results: list: The list of rows returned by each query, in the
+              same order as the queries.
+
+        Raises:
+          sqlite3.ProgrammingError: Database has not been replicated.
+          sqlite3.OperationalError: attempt to write a readonly database.
+
+        """
+
+        if self._replicas is None:
+            raise sqlite3.ProgrammingError('database has NOT BEEN '
+                                           'REPLICATED; call replicate() '
+                                           'first.')
+        queries = [(query, ()) if isinstance(query, str) else query
+                   for query in queries]
+        logging.info('Scattering %s queries across replicas '
+                     '...', len(queries))
+        return self._replicas.map(_replica_query, queries)
+
+
+    def unreplicate(self):
+        """ Shut down the replicas.
+
+        Arguments:
+          None
+
+        Returns:
+          None
+
+        Raises:
+          None
+
+        """
+
+        if self._replicas is None:
+            return
+        logging.info('Shutting down replicas ...')
+        self._replicas.terminate()
+        self._replicas.join()
+        self._replicas = None
+        os.remove(self._snapshot)
+        self._snapshot = None
+
+
+    def _connection(self):
+        """ Return a context manager over a pooled connection. 
+
+        If the calling thread has pinned a connection with _pin(), then
+        that connection is used instead.
+
+        """
+
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            return contextlib.nullcontext(connection)
+        return self._pool.connection(self.pool_timeout)
+
+
+    @contextlib.contextmanager
+    def transaction(self, mode='DEFERRED'):
+        """ Run all work done by the calling thread in one transaction.
+
+        Use as: with db.transaction(): ...
+
+        On entry, a pooled connection is pinned to the calling thread 
+        and a transaction is begun on it. All SQL statement(s) executed
+        by the thread until the block exits then share that connection 
+        and that transaction. The transaction is committed when the 
+        block exits normally, and rolled back if it exits with an 
+        exception. Transactions may be nested, in which case the inner 
+        ones are savepoints that are released or rolled back on their
+        own. 
+
+        SCRIPT mode and execute_script() may not be used inside a 
+        transaction, since executing a script commits any pending 
+        transaction. Writes queued with submit() are NOT part of the 
+        transaction.
+
+        Arguments:
+          mode: str: optional: How the outermost transaction begins: 
+              'DEFERRED' (locks are taken as needed), 'IMMEDIATE' (the 
+              write lock is taken at once) or 'EXCLUSIVE' (readers in 
+              other processes are locked out, too).
+
+        Returns:
+          connection: sqlite3.Connection: The pinned connection.
+
+        Raises:
+          ValueError: mode argument is NOT A VALID TRANSACTION MODE.
+
+        """
+
+        mode = str(mode).upper()
+        if mode not in ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE'):
+            raise ValueError(('mode argument is NOT A VALID TRANSACTION '
+                              'MODE: {}').format(mode))
+
+        depth = getattr(self._local, 'depth', 0)
+        if depth:
+            connection = self._local.connection
+            savepoint = 'sqlite3db_{}'.format(depth)
+            logging.info('Creating savepoint: %s', savepoint)
+            connection.execute('SAVEPOINT {};'.format(savepoint))
+            self._local.depth += 1
+            try:
+                yield connection
+            except BaseException:
+                logging.info('Rolling back to savepoint: %s', savepoint)
+                connection.execute('ROLLBACK TO {};'.format(savepoint))
+                connection.execute('RELEASE {};'.format(savepoint))
+                raise
+            else:
+                connection.execute('RELEASE {};'.format(savepoint))
+            finally:
+                self._local.depth -= 1
+            return
+
+        with self._connection() as connection, self._pin(connection):
+            logging.info('Beginning %s transaction ...', mode)
+            connection.execute('BEGIN {};'.format(mode))
+            self._local.depth = 1
+            self._local.pending = []
+            try:
+                yield connection
+            except BaseException:
+                logging.info('Rolling back transaction ...')
+                connection.rollback()
+                raise
+            else:
+                logging.info('Committing transaction ...')
+                connection.commit()
+                if self._result_cache is not None:
+                    self._invalidate(self._local.pending)
+            finally:
+                self._local.depth = 0
+                self._local.pending = []
+
+
+    def _in_transaction(self):
+        """ Return True if the calling thread is in a transaction(). """
+
+        return getattr(self._local, 'depth', 0) > 0
+
+
+    def _scope(self, connection):
+        """ Return a context manager that commits work on connection.
+
+        Inside a transaction(), work is left for the transaction to 
+        commit instead.
+
+        """
+
+        if self._in_transaction():
+            return contextlib.nullcontext(connection)
+        return connection
+
+
+    def _check_script(self):
+        """ Raise an error if a script would end a transaction(). """
+
+        if self._in_transaction():
+            raise sqlite3.ProgrammingError('SQL scripts CANNOT BE '
+                                           'EXECUTED INSIDE A '
+                                           'TRANSACTION.')
+
+
+    @contextlib.contextmanager
+    def _pin(self, connection):
+        """ Use connection for all work done by the calling thread. """
+
+        previous = getattr(self._local, 'connection', None)
+        self._local.connection = connection
+        try:
+            yield connection
+        finally:
+            self._local.connection = previous
+
+
+    def backup(self, target=None, pages=256, pause=0.0, progress=None):
+        """ Copy the database online with SQLite's backup API.
+
+        The database is copied page by page, pages at a time. The 
+        source database is only locked while each step is copied, so 
+        other connections may keep reading and writing between steps; a
+        pause between steps gives them more room to do so. If the 
+        database is changed by another connection during the backup, 
+        then SQLite restarts the copy. Unlike dump(), the copy is itself
+        a sqlite3 database, the same size as the original.
+
+        Arguments:
+          target: str/sqlite3.Connection: optional: Path to the backup
+              file, ':memory:' for a new in-memory database, or a 
+              connection to back up into. Defaults to the path to the 
+              database with '.bak' appended.
+          pages: int: optional: Number of pages copied per step. If 0 or
+              negative, then the whole database is copied in one step.
+          pause: float: optional: Seconds to sleep between steps.
+          progress: callable: optional: Called after each step as 
+              progress(copied, total), with the number of pages copied
+              so far and the total number of pages.
+
+        Returns:
+          target: str/sqlite3.Connection: Path to the backup file, or 
+              the connection to the in-memory backup or given target.
+
+        Raises:
+          sqlite3.OperationalError: Unable to open database file.
+
+        """
+
+        if target is None:
+            target = self.database + '.bak'
+
+        def step(status, remaining, total):
+            if progress is not None:
+                progress(total - remaining, total)
+            if pause > 0 and remaining > 0:
+                time.sleep(pause)
+
+        logging.info('Backing up database to: %s', target)
+        start = time.monotonic()
+        with self._connection() as connection:
+            if isinstance(target, sqlite3.Connection):
+                connection.backup(target, pages=pages, progress=step)
+            elif target == ':memory:':
+                target = sqlite3.connect(':memory:', check_same_thread=False)
+                connection.backup(target, pages=pages, progress=step)
+            else:
+                with contextlib.closing(sqlite3.connect(target)) as copy:
+                    connection.backup(copy, pages=pages, progress=step)
+        logging.info('Backup complete in %.3f seconds.',
+                     time.monotonic() - start)
+        return target
+
+
+    def dump(self, target=None, compression=None, batch=1000):
+        """ Dump the database to an ASCII text file.
+
+        This method provides the same capabilities as the .dump command
+        in the sqlite3 shell. To copy the database quickly, rather than 
+        to produce SQL text, use backup() instead. To dump each table 
+        to its own file in parallel, use dump_tables(). Dumps are read
+        back with restore().
+
+        The dump is streamed to the file, batch lines at a time, and 
+        may be compressed on the way.
+ 
+        Arguments:
+          target: str/file: optional: Path to the dump file, or a text 
+              file object to write to. Defaults to the path to the 
+              database with '.sql' appended, plus the extension for 
+              the compression, if any.
+          compression: str: optional: One of 'gzip', 'bz2' or 'xz'. 
+              Defaults to the one implied by the extension of a target 
+              path ('.gz', '.bz2' or '.xz'), if any.
+          batch: int: optional: Number of lines written to the file at
+              a time.
+
+        Returns:
+          target: str/file: Path to the dump file, or the file object.
+
+        Raises:
+          ValueError: compression argument is NOT SUPPORTED.
+          Exception: Catch-all exception used until specific exceptions
+              that may occur while dumping the database out to a file 
+              are known.
+
+        """
+
+        if target is None:
+            target = self.database + '.sql' + _SUFFIXES.get(compression, '')
+
+        # Dump the database to an ASCII text file.
+        logging.info('Dumping database to an ASCII text file ...')
+        try:
+            with self._connection() as connection:
+                with self._scope(connection):
+                    logging.info('Opening file ...')
+                    if isinstance(target, str):
+                        sql_file = _open_file(target, 'wt', compression)
+                    else:
+                        sql_file = contextlib.nullcontext(target)
+                    with sql_file as sql_file:
+                        logging.info('file open: %s', sql_file)
+                        sql_dump = connection.iterdump()
+                        logging.info('Dumping database ...') 
+                        _write_lines(sql_file, sql_dump, batch)
+                        logging.info('Dump complete.')
+                        logging.info('Closing file ...')
+                    logging.info('file closed: %s', sql_file)
+                logging.info('Returning database connection to pool ...')
+            logging.info('connection returned: %s', connection)
+        except Exception as e:
+            logging.exception(e)
+            raise
+        else:
+            logging.info('database dumped to ASCII text file: %s', target)
+
+        return target
+
+
+    def dump_tables(self, directory=None, tables=None, compression=None,
+                    workers=4, batch=1000):
+        """ Dump each table to its own ASCII text file, in parallel.
+
+        A consistent snapshot of the database is first taken with 
+        backup(), so the database is only locked while the snapshot is 
+        copied, step by step. Each table is then dumped from the 
+        snapshot on one of workers threads, to a file named after the 
+        table. Each file holds the table's schema, its rows, its 
+        AUTOINCREMENT counter, and then its indexes and triggers. Views
+        are dumped to files of their own. Read them back with restore().
+
+        Arguments:
+          directory: str: optional: Directory to write the files to. 
+              Defaults to the path to the database with '.dump' 
+              appended.
+          tables: list: optional: Names of the tables to dump. Defaults
+              to all tables and views.
+          compression: str: optional: One of 'gzip', 'bz2' or 'xz'.
+          workers: int: optional: Number of tables dumped at once.
+          batch: int: optional: Number of lines written to each file at
+              a time.
+
+        Returns:
+          paths: list: Paths to the files written, one per table.
+
+        Raises:
+          ValueError: compression argument is NOT SUPPORTED.
+          sqlite3.OperationalError: no such table.
+
+        """
+
+        if directory is None:
+            directory = self.database + '.dump'
+        os.makedirs(directory, exist_ok=True)
+        suffix = '.sql' + _SUFFIXES.get(compression, '')
+
+        descriptor, snapshot = tempfile.mkstemp(prefix='sqlite3db-',
+                                                suffix='.db')
+        os.close(descriptor)
+        try:
+            self.backup(snapshot)
+            with contextlib.closing(sqlite3.connect(snapshot)) as connection:
+                names = [name for name, in connection.execute(
+                    """ SELECT name FROM sqlite_master 
+                        WHERE type IN ('table', 'view')
+                          AND name NOT LIKE 'sqlite_%'
+                        ORDER BY name; """)]
+            if tables is not None:
+                missing = set(tables) - set(names)
+                if missing:
+                    raise sqlite3.OperationalError(('no such table: '
+                                                    '{}').format(
+                                                        sorted(missing)))
+                names = list(tables)
+
+            logging.info('Dumping %s tables with %s workers ...',
+                         len(names), workers)
+            paths = [os.path.join(directory, name + suffix)
+                     for name in names]
+            with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+                list(pool.map(_dump_table, [snapshot] * len(names), names,
+                              paths, [compression] * len(names),
+                              [batch] * len(names)))
+        finally:
+            os.remove(snapshot)
+
+        logging.info('Tables dumped to: %s', directory)
+        return paths
+
+
+    def restore(self, source=None, compression=None, batch_size=10000,
+                progress=None):
+        """ Restore a dump written by dump() or dump_tables().
+
+        The dump is read and executed statement by statement, so it is 
+        never held in memory as a whole. Statements are committed 
+        batch_size at a time in large transactions, and foreign key 
+        constraints are not enforced during the restore. Indexes, 
+        triggers and views are created only after all of the rows have 
+        been inserted, which is much faster than keeping indexes up to 
+        date row by row.
+
+        Arguments:
+          source: str: required: Path to a dump file, or to a directory
+              of dump files written by dump_tables().
+          compression: str: optional: One of 'gzip', 'bz2' or 'xz'. 
+              Defaults to the one implied by the extension of each 
+              file, if any.
+          batch_size: int: optional: Number of statements per 
+              transaction.
+          progress: callable: optional: Called after each commit as 
+              progress(statements), with the number of statements 
+              executed so far.
+
+        Returns:
+          statements: int: The number of statements executed.
+
+        Raises:
+          sqlite3.ProgrammingError: Cannot restore inside a transaction.
+          sqlite3.IntegrityError: UNIQUE constraint failed.
+          sqlite3.OperationalError: table already exists.
+
+        """
+
+        if os.path.isdir(source):
+            paths = sorted(os.path.join(source, name)
+                           for name in os.listdir(source))
+        else:
+            paths = [source]
+        self._check_script()
+
+        logging.info('Restoring database from: %s', source)
+        count = 0
+        deferred = []
+        with self._connection() as connection:
+            foreign_keys, = connection.execute(
+                'PRAGMA foreign_keys;').fetchone()
+            connection.execute('PRAGMA foreign_keys = OFF;')
+            try:
+                connection.execute('BEGIN;')
+                for path in paths:
+                    with _open_file(path, 'rb', compression) as sql_file:
+                        for statement, _ in _iterstatements(sql_file):
+                            kind = _statement_kind(statement)
+                            if kind == 'TRANSACTION':
+                                continue
+                            if kind == 'DEFERRED':
+                                deferred.append(statement)
+                                continue
+                            connection.execute(statement)
+                            count += 1
+                            if count % batch_size == 0:
+                                connection.commit()
+                                connection.execute('BEGIN;')
+                                if progress is not None:
+                                    progress(count)
+                logging.info('Creating %s indexes, triggers and views '
+                             '...', len(deferred))
+                for statement in deferred:
+                    connection.execute(statement)
+                    count += 1
+                connection.commit()
+            except Exception as e:
+                logging.exception(e)
+                connection.rollback()
+                raise
+            finally:
+                connection.execute('PRAGMA foreign_keys = {};'.format(
+                    foreign_keys))
+        if self._result_cache is not None:
+            self._result_cache.clear()
+        if progress is not None:
+            progress(count)
+
+        logging.info('Restore complete: %s statements executed.', count)
+        return count
+
+
+    def execute(self, sql=None, parameters=None, mode=None):
+        """ Executes SQL statement(s).
+
+        This method executes SQL statement(s) against the database using
+        one of three different possible modes of operation:
+
+          NORMAL: Executes a SQL statement from a string provided as 
+                  the input sql argument. Values may be bound to the
+                  statement's ? or :name placeholders with the 
+                  parameters argument, which allows the statement to be
+                  prepared once and then re-bound on later calls.
+
+          SCRIPT: Executes all SQL statements found in a file whose
+                  relative or absolute path is provided as the input 
+                  sql argument.
+
+            MANY: Executes a SQL statement from a string found at the
+                  top of a list provided as the input sql argument. It
+                  is executed against all parameters or mapping found
+                  in the list of tuples that follow the string.
+
+        Unless the mode argument is given, the execution mode is 
+        determined from the sql argument, which involves checking the 
+        filesystem for a file at the path given by any string. Callers
+        that know the mode up front should pass it, or use one of 
+        query(), execute_many() or execute_script(), which also skip 
+        the remaining checks on their arguments.
+
+        Arguments:
+          sql: str/list: required: SQL statement(s) to be executed. 
+          parameters: tuple/list/dict: optional: Values bound to the 
+              placeholders of a NORMAL mode SQL statement.
+          mode: str: optional: Execution mode, one of 'NORMAL', 
+              'SCRIPT' or 'MANY'.
+
+        Returns:
+          changes: 
+          rows: 
+
+        Raises:
+          TypeError: sql argument must be either a string or a list.
+          TypeError: parameters argument must be a tuple, list or dict.
+          TypeError: parameters argument is only valid in NORMAL mode.
+          ValueError: mode argument must be a valid execution mode for
+              the sql argument.
+          ValueError: sql_statement string must be a complete SQL statement.
+          TypeError: If sql argument is a list, then items following
+              sql_statement in the list must be tuples.
+          sqlite3.IntegrityError: NOT NULL constraint failed.
+          sqlite3.IntegrityError: UNIQUE constraint failed.
+          sqlite3.OperationalError: no such column or table.
+          sqlite3.ProgrammingError: Cannot operate on a closed cursor or database.
+          sqlite3.Warning: You can only execute one statement at a time.
+          sqlite3.DatabaseError: File is encrypted or is not a database.
+
+        """
+
+        # Each step is logged at INFO level. Formatting the messages, 
+        # some of which hold whole SQL scripts, is wasted work when they
+        # are not going to be logged, so check that once up front.
+        verbose = logging.getLogger().isEnabledFor(logging.INFO)
+
+        # Start execution of SQL statement(s).
+        if verbose:
+            logging.info('Starting execution of SQL statement(s) from '
+                         'sql argument: %s : %s', id(sql), sql)
+
+        # Check if sql argument is a string or a list. If sql argument 
+        # is neither a string nor a list, then throw an exception. 
+        if verbose:
+            logging.info('Type checking sql argument ...')
+        try:
+            if not (isinstance(sql, str) or isinstance(sql, list)):
+                raise TypeError(('sql argument is NOT A STRING OR A '
+                                 'LIST: {}').format(type(sql)))
+        except TypeError as e:
+            logging.exception(e)
+            logging.debug('sql argument MUST BE A STRING OR A LIST.')
+            raise
+        else:
+            if verbose:
+                logging.info('sql argument is of type: %s', type(sql))
+
+        # Check if parameters argument, if given, is a tuple, a list or
+        # a dict. If it is not, then throw an exception.
+        if parameters is not None:
+            if verbose:
+                logging.info('Type checking parameters argument ...')
+            try:
+                if not isinstance(parameters, (tuple, list, dict)):
+                    raise TypeError(('parameters argument is NOT A TUPLE, '
+                                     'LIST OR DICT: {}').format(
+                                         type(parameters)))
+                if not isinstance(sql, str):
+                    raise TypeError('parameters argument is ONLY VALID '
+                                    'IN NORMAL MODE.')
+            except TypeError as e:
+                logging.exception(e)
+                raise
+            else:
+                if verbose:
+                    logging.info('parameters argument is of type: %s',
+                                 type(parameters))
+
+        # Determine execution mode for SQL statement(s). A string given
+        # with parameters is always a SQL statement, never a file.
+        if verbose:
+            logging.info('Determining execution mode for SQL '
+                         'statement(s) ...')
+        if mode is not None:
+            try:
+                if mode not in (('NORMAL', 'SCRIPT') if isinstance(sql, str)
+                                else ('MANY',)):
+                    raise ValueError(('mode argument is NOT A VALID '
+                                      'EXECUTION MODE FOR THE sql '
+                                      'ARGUMENT: {}').format(mode))
+            except ValueError as e:
+                logging.exception(e)
+                raise
+            execution_mode = mode
+        elif isinstance(sql, str):
+            if parameters is None and os.path.isfile(sql):
+                execution_mode = 'SCRIPT' 
+            else:
+                execution_mode = 'NORMAL'
+        elif isinstance(sql, list):
+            execution_mode = 'MANY' 
+        if verbose:
+            logging.info('Execution mode is: %s', execution_mode)
+
+        # Prepare SQL statement(s) based on execution mode.
+        if execution_mode == 'NORMAL':
+            if verbose:
+                logging.info('Copying SQL statement from string ...')
+            sql_statement = sql
+        elif execution_mode == 'MANY':
+            if verbose:
+                logging.info('Copying SQL statement from top of list ...')
+            sql_statement = sql[0]
+        elif execution_mode == 'SCRIPT':
+            if verbose:
+                logging.info('Reading in SQL statement(s) from file ...')
+            try:
+                with open(sql, 'r') as sql_file:
+                    sql_statement = sql_file.read()
+            except Exception as e:
+                logging.exception(e)
+                raise
+            else:
+                if verbose:
+                    logging.info('SQL statement(s) have been read in from '
+                                 'file: %s', sql)
+
+        # Check if sql_statement string is empty. If sql_statement
+        # string is empty, then throw a warning.
+        if verbose:
+            logging.info('Checking if sql_statement string is empty ...')
+        try:
+            if not sql_statement:
+                raise ValueError('sql_statement string is EMPTY.')
+        except ValueError as w:
+            logging.warning(w)
+        else:
+            if verbose:
+                logging.info('sql_statement string is not empty: %s',
+                             sql_statement)
+
+        # Check if sql_statement string is a complete SQL statement. If
+        # sql_statement string is not a complete SQL statement, then 
+        # throw an exception.
+        if verbose:
+            logging.info('Checking if sql_statement string is a complete '
+                         'SQL statement ...')
+        try:
+            if not sqlite3.complete_statement(sql_statement):
+                raise ValueError('sql_statement string is NOT A '
+                                 'COMPLETE SQL STATEMENT.')
+        except ValueError as e:
+            logging.exception(e)
+            logging.debug('Check if the sql_statement string is '
+                          'terminated by a semi-colon.')
+            raise
+        else:
+            if verbose:
+                logging.info('sql_statement string is a complete SQL '
+                             'statement.')
+
+        # Perform execution mode-based checks on SQL statement(s) prior
+        # to execution. For example, if execution mode is 'MANY', then 
+        # before executing many SQL statements, check if all items 
+        # following the SQL statement in the sql argument list are 
+        # tuples. The list itself is left untouched.
+        if execution_mode == 'MANY':
+            if verbose:
+                logging.info('Type checking items remaining in the sql '
+                             'argument list ...')
+            try:
+                for item in itertools.islice(sql, 1, None):
+                    if not isinstance(item, tuple):
+                        raise TypeError(('At least one item in the sql '
+                                         'argument list is not a tuple: '
+                                         '{}').format(type(item)))
+            except TypeError as e:
+                logging.exception(e)
+                logging.debug('All items remaining in the sql argument '
+                              'list should be a set of tuples that '
+                              'represent the sequence of parameters to '
+                              'execute against the SQL statement.')
+                raise
+            else:
+                if verbose:
+                    logging.info('All items remaining in the sql argument '
+                                 'list are tuples.')
+
+        # If the rows returned by a NORMAL mode SQL statement are in the
+        # result cache, then return them without touching the database.
+        key = epoch = None
+        if self._result_cache is not None and not self._in_transaction():
+            epoch = self._result_cache.epoch()
+            if execution_mode == 'NORMAL':
+                key, cached = self._cached(sql_statement, parameters)
+                if cached is not None:
+                    if verbose:
+                        logging.info('Returning rows from result cache.')
+                    return 0, list(cached)
+
+        # Check out a connection to database from the pool, create a 
+        # cursor on this connection, and then execute the SQL 
+        # statement(s).
+        try:
+            with self._connection() as connection:
+                start = time.perf_counter()
+                total_changes = connection.total_changes
+                connection.tables.reset()
+                with self._scope(connection):
+                    if verbose:
+                        logging.info('Creating a database cursor on the '
+                                     'connection ...')
+                    with contextlib.closing(connection.cursor()) as cursor:
+                        if verbose:
+                            logging.info('cursor created: %s', cursor)
+                        if verbose:
+                            logging.info('Executing SQL statement(s) ...')
+                        if execution_mode == 'NORMAL':
+                            if parameters is None:
+                                cursor.execute(sql_statement)
+                            else:
+                                cursor.execute(sql_statement, parameters)
+                            self._count_statement(connection)
+                        elif execution_mode == 'MANY':
+                            cursor.executemany(sql_statement,
+                                               itertools.islice(sql, 1, None))
+                            self._count_statement(connection)
+                        elif execution_mode == 'SCRIPT':
+                            self._check_script()
+                            cursor.executescript(sql_statement)
+                        if verbose:
+                            logging.info('SQL statement(s) executed.')
+                        if verbose:
+                            logging.info('Fetching any returned rows ... ')
+                        rows = cursor.fetchall()
+                        if verbose:
+                            logging.info('Fetch complete.')
+                        if verbose:
+                            logging.info('Closing database cursor ...')
+                    if verbose:
+                        logging.info('cursor closed: %s', cursor)
+                elapsed = time.perf_counter() - start
+                if verbose:
+                    logging.info('Saving the total number of database '
+                                 'rows that were modified, inserted, '
+                                 'and/or deleted during SQL statement '
+                                 'execution ...')
+                changes = connection.total_changes - total_changes
+                if self._result_cache is not None:
+                    if verbose:
+                        logging.info('Updating result cache ...')
+                    self._settle(connection, None if execution_mode == 
+                                 'SCRIPT' else sql_statement, key, rows,
+                                 epoch)
+                if self._metrics is not None:
+                    self._observe(connection, sql if execution_mode ==
+                                  'SCRIPT' else sql_statement, 
+                                  sql[1] if execution_mode == 'MANY' 
+                                  and len(sql) > 1 else parameters,
+                                  execution_mode, elapsed, len(rows),
+                                  changes)
+                if verbose:
+                    logging.info('Returning database connection to pool ...')
+            if verbose:
+                logging.info('connection returned: %s', connection)
+        except Exception as e:
+            logging.exception(e)
+            raise
+        else:
+            if verbose:
+                logging.info('Execution of SQL statement(s) complete: %s',
+                             id(sql))
+
+        # Return the total number of database rows that were modified, 
+        # inserted, and/or deleted by executing the SQL statement(s) 
+        # AND any rows fetched from the database.
+        return changes, rows
+
+
+    def query(self, sql, parameters=()):
+        """ Execute a SQL statement without any checks on its arguments.
+
+        This is the fast path of NORMAL mode in execute(). The 
+        statement is passed straight to SQLite, which reports any 
+        problems with it, and nothing is logged unless an error occurs.
+
+        Arguments:
+          sql: str: required: SQL statement to be executed.
+          parameters: tuple/list/dict: optional: Values bound to the 
+              placeholders of the SQL statement.
+
+        Returns:
+          changes: int: Number of rows modified, inserted or deleted.
+          rows: list: Rows returned by the SQL statement.
+
+        Raises:
+          See execute().
+
+        """
+
+        key = epoch = None
+        if self._result_cache is not None and not self._in_transaction():
+            epoch = self._result_cache.epoch()
+            key, cached = self._cached(sql, parameters)
+            if cached is not None:
+                return 0, list(cached)
+
+        try:
+            with self._connection() as connection:
+                start = time.perf_counter()
+                total_changes = connection.total_changes
+                connection.tables.reset()
+                with self._scope(connection):
+                    cursor = connection.execute(sql, parameters)
+                    self._count_statement(connection)
+                    rows = cursor.fetchall()
+                    cursor.close()
+                elapsed = time.perf_counter() - start
+                changes = connection.total_changes - total_changes
+                if self._result_cache is not None:
+                    self._settle(connection, sql, key, rows, epoch)
+                if self._metrics is not None:
+                    self._observe(connection, sql, parameters, 'NORMAL',
+                                  elapsed, len(rows), changes)
+                return changes, rows
+        except Exception as e:
+            logging.exception(e)
+            raise
+
+
+    def columns(self, sql, parameters=(), chunk_size=10000, 
+                as_numpy=None):
+        """ Execute a query and return its results column by column.
+
+        Rather than as a list of row tuples, the results are returned 
+        as one array per column, filled chunk_size rows at a time, which
+        takes far less memory and is ready for analytics. Columns read 
+        straight from a table are typed from their declared type, e.g.,
+        product.price REAL gives an array of doubles ('d') and 
+        order_item.quantity INTEGER an array of 64-bit integers ('q'), 
+        provided that the mapping is unambiguous: columns that share a
+        name, or that are aliased to the name of a column read, are 
+        returned as lists. Other columns, e.g., aggregates, are typed 
+        from their first value. NULLs in numeric columns become NaN, 
+        integers too large for a column's type make it a list, and text
+        and blob columns are returned as lists. The result cache is not
+        used.
+
+        Arguments:
+          sql: str: required: SQL query to be executed.
+          parameters: tuple/list/dict: optional: Values bound to the 
+              placeholders of the SQL query.
+          chunk_size: int: optional: Number of rows fetched at a time.
+          as_numpy: bool: optional: Return NumPy arrays rather than 
+              array.array objects and lists. Defaults to True if NumPy
+              is installed.
+
+        Returns:
+          columns: dict: Maps each column name to its array, in the 
+              order of the query's columns.
+
+        Raises:
+          ImportError: as_numpy is True and NumPy is NOT INSTALLED.
+          See execute().
+
+        """
+
+        if as_numpy is None:
+            as_numpy = numpy is not None
+        elif as_numpy and numpy is None:
+            raise ImportError('as_numpy is True and NumPy is NOT '
+                              'INSTALLED.')
+
+        try:
+            with self._connection() as connection:
+                start = time.perf_counter()
+                connection.tables.reset()
+                with self._scope(connection):
+                    cursor = connection.execute(sql, parameters)
+                    self._count_statement(connection)
+                    names = [column[0] for column in cursor.description]
+                    typecodes = self._typecodes(connection, sql, 
+                                                parameters, names)
+                    columns = None
+                    rows = cursor.fetchmany(chunk_size)
+                    while rows:
+                        chunk = list(zip(*rows))
+                        if columns is None:
+                            typecodes = self._guess_typecodes(typecodes,
+                                                              chunk)
+                            columns = [array.array(typecode) if typecode
+                                       else [] for typecode in typecodes]
+                        columns = [_extend_column(column, values)
+                                   for column, values in zip(columns, chunk)]
+                        rows = cursor.fetchmany(chunk_size)
+                    cursor.close()
+                    if columns is None:
+                        columns = [array.array(typecode) if typecode else []
+                                   for typecode in typecodes]
+                if self._metrics is not None:
+                    self._observe(connection, sql, parameters, 'NORMAL',
+                                  time.perf_counter() - start, 
+                                  len(columns[0]) if columns else 0, 0)
+        except Exception as e:
+            logging.exception(e)
+            raise
+
+        if as_numpy:
+            columns = [numpy.frombuffer(column, dtype=column.typecode)
+                       if isinstance(column, array.array) 
+                       else numpy.array(column, dtype=object)
+                       for column in columns]
+        return dict(zip(names, columns))
+
+
+    @contextlib.contextmanager
+    def blob(self, table, column, rowid, readonly=True):
+        """ Open a BLOB for incremental I/O.
+
+        Use as: with db.blob(table, column, rowid) as blob: ...
+
+        The BLOB in the given column of the row of table with the given
+        rowid is opened with SQLite's incremental BLOB I/O, so that it 
+        can be read and written a piece at a time, without ever being 
+        held in memory whole. The BLOB keeps a connection checked out of
+        the pool while it is open. Changes are committed when the block
+        is left, unless inside a transaction(). The size of a BLOB 
+        cannot be changed this way; see write_blob().
+
+        Arguments:
+          table: str: required: Name of the table.
+          column: str: required: Name of the BLOB column.
+          rowid: int: required: rowid of the row.
+          readonly: bool: optional: Open the BLOB for reading only.
+
+        Returns:
+          blob: sqlite3.Blob: The open BLOB, or an equivalent SQLBlob 
+              if Connection.blobopen() is not available (before 
+              Python 3.11).
+
+        Raises:
+          sqlite3.OperationalError: no such table, column or rowid.
+
+        """
+
+        with self._connection() as connection:
+            with self._scope(connection):
+                if hasattr(connection, 'blobopen'):
+                    opened = connection.blobopen(table, column, rowid,
+                                                 readonly=readonly)
+                else:
+                    opened = SQLBlob(connection, table, column, rowid,
+                                     readonly=readonly)
+                with opened:
+                    yield opened
+            if not readonly and self._result_cache is not None:
+                if self._in_transaction():
+                    self._local.pending.append(
+                        (frozenset(), frozenset((table,)), False))
+                else:
+                    self._result_cache.invalidate({table})
+
+
+    def iterblob(self, table, column, rowid, chunk_size=65536):
+        """ Iterate over a BLOB a chunk at a time.
+
+        Use as: for chunk in db.iterblob(table, column, rowid): ...
+
+        Each chunk is returned as a memoryview of the bytes read, so 
+        that it can be written out, e.g., to a file or socket, without 
+        another copy. Only one chunk is held in memory at a time.
+
+        Arguments:
+          table: str: required: Name of the table.
+          column: str: required: Name of the BLOB column.
+          rowid: int: required: rowid of the row.
+          chunk_size: int: optional: Number of bytes read at a time.
+
+        Returns:
+          chunks: generator: memoryview of each chunk of the BLOB.
+
+        Raises:
+          sqlite3.OperationalError: no such table, column or rowid.
+
+        """
+
+        with self.blob(table, column, rowid) as blob:
+            while True:
+                chunk = blob.read(chunk_size)
+                if not chunk:
+                    break
+                yield memoryview(chunk)
+
+
+    def write_blob(self, table, column, rowid, data, size=None,
+                   chunk_size=65536):
+        """ Replace a BLOB, writing it a chunk at a time.
+
+        The BLOB is first resized with zeroblob(), and then filled in 
+        from data, chunk_size bytes at a time, in the same transaction,
+        so a large value never needs to be held in memory whole.
+
+        Arguments:
+          table: str: required: Name of the table.
+          column: str: required: Name of the BLOB column.
+          rowid: int: required: rowid of the row, which must exist.
+          data: bytes/file/iterable: required: A bytes-like object, a 
+              binary file object, or an iterable of bytes-like chunks.
+          size: int: optional: Size of the BLOB in bytes. Required if 
+              data is an iterable or a file object that is not 
+              seekable; otherwise taken from data (for a file object, 
+              the bytes from its current position to its end).
+          chunk_size: int: optional: Number of bytes written at a time 
+              from a file object.
+
+        Returns:
+          size: int: Number of bytes written.
+
+        Raises:
+          ValueError: size argument is REQUIRED for an iterable.
+          ValueError: size argument is REQUIRED for a file object that 
+              is NOT SEEKABLE.
+          ValueError: data DOES NOT MATCH size.
+          sqlite3.OperationalError: no such table, column or rowid.
+
+        """
+
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            data = memoryview(data).cast('B')
+            size = len(data)
+            chunks = (data[start:start + chunk_size] 
+                      for start in range(0, size, chunk_size))
+        elif hasattr(data, 'read'):
+            if size is None:
+                if not (hasattr(data, 'seekable') and data.seekable()):
+                    raise ValueError('size argument is REQUIRED for a file '
+                                     'object that is NOT SEEKABLE.')
+                position = data.tell()
+                size = data.seek(0, os.SEEK_END) - position
+                data.seek(position)
+            chunks = iter(functools.partial(data.read, chunk_size), b'')
+        elif size is None:
+            raise ValueError('size argument is REQUIRED for an iterable.')
+        else:
+            chunks = iter(data)
+
+        sql = 'UPDATE {} SET {} = zeroblob(?) WHERE rowid = ?;'.format(
+            _quote(table), _quote(column))
+        try:
+            with self._connection() as connection:
+                connection.tables.reset()
+                with self._scope(connection):
+                    if connection.execute(sql, (size, rowid)).rowcount != 1:
+                        raise sqlite3.OperationalError(
+                            'no such rowid: {}'.format(rowid))
+                    if hasattr(connection, 'blobopen'):
+                        blob = connection.blobopen(table, column, rowid,
+                                                   readonly=False)
+                    else:
+                        blob = SQLBlob(connection, table, column, rowid,
+                                       readonly=False)
+                    with blob:
+                        written = 0
+                        for chunk in chunks:
+                            if written + len(chunk) > size:
+                                break
+                            blob.write(chunk)
+                            written += len(chunk)
+                        if written != size or next(chunks, None):
+                            raise ValueError(('data DOES NOT MATCH size: '
+                                              '{}').format(size))
+                if self._result_cache is not None:
+                    self._settle(connection, sql)
+        except Exception as e:
+            logging.exception(e)
+            raise
+        return size
+
+
+    def execute_many(self, sql, parameters):
+        """ Execute a SQL statement against many sets of parameters.
+
+        This is the fast path of MANY mode in execute(). The parameters
+        may be any iterable of sequences or mappings, and are neither 
+        copied nor type checked.
+
+        Arguments:
+          sql: str: required: SQL statement to be executed.
+          parameters: iterable: required: Values bound to the 
+              placeholders of the SQL statement on each execution.
+
+        Returns:
+          changes: int: Number of rows modified, inserted or deleted.
+          rows: list: Rows returned by the SQL statement.
+
+        Raises:
+          See execute().
+
+        """
+
+        try:
+            with self._connection() as connection:
+                start = time.perf_counter()
+                total_changes = connection.total_changes
+                connection.tables.reset()
+                with self._scope(connection):
+                    cursor = connection.executemany(sql, parameters)
+                    self._count_statement(connection)
+                    rows = cursor.fetchall()
+                    cursor.close()
+                elapsed = time.perf_counter() - start
+                changes = connection.total_changes - total_changes
+                if self._result_cache is not None:
+                    self._settle(connection, sql)
+                if self._metrics is not None:
+                    self._observe(connection, sql, None, 'MANY', elapsed,
+                                  len(rows), changes)
+                return changes, rows
+        except Exception as e:
+            logging.exception(e)
+            raise
+
+
+    def execute_script(self, path):
+        """ Execute all SQL statements found in a file.
+
+        This is the fast path of SCRIPT mode in execute(). The script is
+        not checked for completeness before it is executed. The whole 
+        script is read into memory; use run_script() for large scripts.
+
+        Arguments:
+          path: str: required: Path to a file of SQL statements.
+
+        Returns:
+          changes: int: Number of rows modified, inserted or deleted.
+          rows: list: Always empty.
+
+        Raises:
+          See execute().
+
+        """
+
+        try:
+            with open(path, 'r') as sql_file:
+                script = sql_file.read()
+            self._check_script()
+            with self._connection() as connection:
+                start = time.perf_counter()
+                total_changes = connection.total_changes
+                with self._scope(connection):
+                    connection.executescript(script).close()
+                elapsed = time.perf_counter() - start
+                changes = connection.total_changes - total_changes
+                if self._result_cache is not None:
+                    self._result_cache.clear()
+                if self._metrics is not None:
+                    self._observe(connection, path, None, 'SCRIPT', 
+                                  elapsed, 0, changes)
+                return changes, []
+        except Exception as e:
+            logging.exception(e)
+            raise
+
+
+    def run_script(self, path, batch_size=1000, offset=0, checkpoint=None,
+                   progress=None, compression=None):
+        """ Execute a SQL script of any size, statement by statement.
+
+        Unlike execute_script(), which reads the whole file into memory
+        and executes it at once, the script is read and executed one 
+        statement at a time, and committed batch_size statements at a 
+        time. Transaction control statements in the script itself 
+        (BEGIN, COMMIT, END) are skipped, so statements that cannot run
+        inside a transaction, like VACUUM, may not be used.
+
+        If a statement fails, then its batch is rolled back, and the 
+        script may be run again from the offset of the last commit, 
+        which is logged, or recorded in the checkpoint file if there is
+        one.
+
+        Arguments:
+          path: str: required: Path to a file of SQL statements, 
+              possibly compressed (see dump()).
+          batch_size: int: optional: Number of statements per 
+              transaction.
+          offset: int: optional: Byte offset in the file to start from.
+          checkpoint: str: optional: Path to a file in which the offset
+              of the last commit is recorded. If the file exists, then 
+              the script resumes from that offset instead of offset.
+              It is removed once the script is complete.
+          progress: callable: optional: Called after each commit as 
+              progress(statements, offset, rate), with the number of 
+              statements executed so far, the byte offset reached, and
+              the number of statements executed per second.
+          compression: str: optional: One of 'gzip', 'bz2' or 'xz'. 
+              Defaults to the one implied by the extension of path, if
+              any.
+
+        Returns:
+          statements: int: Number of statements executed.
+          offset: int: Byte offset of the end of the script.
+
+        Raises:
+          sqlite3.ProgrammingError: Cannot run a script inside a 
+              transaction.
+          ValueError: file ends with an INCOMPLETE SQL STATEMENT.
+          Exception: Any exception raised by a statement.
+
+        """
+
+        if checkpoint is not None and os.path.exists(checkpoint):
+            with open(checkpoint, 'r') as checkpoint_file:
+                offset = int(checkpoint_file.read() or 0)
+        self._check_script()
+
+        logging.info('Running SQL script: %s, from offset %s ...', path,
+                     offset)
+        count = 0
+        pending = 0
+        committed = end = offset
+        start = time.monotonic()
+        begin = time.perf_counter()
+
+        def commit():
+            nonlocal pending, committed
+            connection.commit()
+            pending = 0
+            committed = end
+            if self._result_cache is not None:
+                self._result_cache.clear()
+            if checkpoint is not None:
+                with open(checkpoint + '.tmp', 'w') as checkpoint_file:
+                    checkpoint_file.write(str(committed))
+                os.replace(checkpoint + '.tmp', checkpoint)
+            rate = count / max(time.monotonic() - start, 1e-9)
+            logging.info('%s statements committed, through byte %s (%.0f '
+                         'statements/sec).', count, committed, rate)
+            if progress is not None:
+                progress(count, committed, rate)
+
+        with self._connection() as connection:
+            total_changes = connection.total_changes
+            try:
+                with _open_file(path, 'rb', compression) as sql_file:
+                    for statement, offset in _iterstatements(sql_file, end):
+                        if _statement_kind(statement) == 'TRANSACTION':
+                            continue
+                        # Only commit between lines of the file, so that
+                        # the script may be resumed from the offset.
+                        if pending >= batch_size and offset != end:
+                            commit()
+                        if not connection.in_transaction:
+                            connection.execute('BEGIN;')
+                        connection.execute(statement)
+                        count += 1
+                        pending += 1
+                        end = offset
+                if connection.in_transaction:
+                    commit()
+            except Exception as e:
+                logging.exception(e)
+                connection.rollback()
+                logging.error('SQL script failed. Resume it from offset: '
+                              '%s', committed)
+                raise
+            if self._metrics is not None:
+                self._observe(connection, path, None, 'SCRIPT', 
+                              time.perf_counter() - begin, 0, 
+                              connection.total_changes - total_changes)
+
+        if checkpoint is not None and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        logging.info('SQL script complete: %s statements executed.', count)
+        return count, end
+
+
+    def submit(self, sql, parameters=None):
+        """ Queue a write for group commit.
+
+        Writes submitted from any number of threads are executed, in 
+        order, by a single writer connection, which commits them in 
+        groups of up to write_batch_size writes. This avoids contention
+        between writers for the database's write lock, and shares the 
+        cost of each commit across the group. Reads made with the other
+        methods continue to use their own pooled connections. See 
+        WriteQueue.
+
+        Arguments:
+          sql: str: required: SQL statement to be executed.
+          parameters: tuple/list/dict: optional: Values bound to the 
+              placeholders of the SQL statement.
+
+        Returns:
+          future: concurrent.futures.Future: Resolves to the number of 
+              rows changed and the rows returned by the statement, once 
+              committed, or to the error it raised.
+
+        Raises:
+          sqlite3.ProgrammingError: Cannot operate on a closed queue.
+          Exception: The writer could not open its connection.
+
+        """
+
+        with self._writer_lock:
+            if self._writer is None:
+                logging.info('Starting writer ...')
+                track = settle = observe = None
+                if self._result_cache is not None:
+                    track, settle = self._tables, self._invalidate
+                if self._metrics is not None:
+                    observe = self._observe
+                self._writer = WriteQueue(self.connect, self.write_batch_size,
+                                          self.write_max_latency, track,
+                                          settle, observe)
+            return self._writer.submit(sql, parameters)
+
+
+    def write(self, sql, parameters=None, timeout=None):
+        """ Queue a write for group commit and wait for it.
+
+        Arguments:
+          sql: str: required: SQL statement to be executed.
+          parameters: tuple/list/dict: optional: Values bound to the 
+              placeholders of the SQL statement.
+          timeout: float: optional: Seconds to wait for the write to be
+              committed. Waits forever if None.
+
+        Returns:
+          changes: int: Number of rows modified, inserted or deleted.
+          rows: list: Rows returned by the SQL statement.
+
+        Raises:
+          concurrent.futures.TimeoutError: Write not committed in time.
+          See execute().
+
+        """
+
+        return self.submit(sql, parameters).result(timeout)
+
+
+    def _stop_writer(self):
+        """ Commit any queued writes and stop the writer. """
+
+        with self._writer_lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            logging.info('Stopping writer ...')
+            writer.close()
+
+
+    def iterquery(self, sql=None, parameters=None, size=256):
+        """ Iterate lazily over the rows returned by a SQL statement.
+
+        Unlike execute(), which fetches all of the rows returned by a 
+        SQL statement before returning them, this method is a generator
+        that fetches rows from the database in batches of size rows and
+        yields them one at a time. Memory use is therefore bounded by 
+        the batch size rather than by the size of the result set, and 
+        the first row is available as soon as the first batch is 
+        fetched. A pooled connection is held for the lifetime of the 
+        iterator, so iterators should be exhausted or closed promptly.
+
+        Arguments:
+          sql: str: required: SQL statement to be executed.
+          parameters: tuple/list/dict: optional: Values bound to the 
+              placeholders of the SQL statement.
+          size: int: optional: Number of rows fetched per batch.
+
+        Returns:
+          rows: generator: Yields each row returned by the statement.
+
+        Raises:
+          TypeError: sql argument is NOT A STRING.
+          ValueError: size argument is NOT A POSITIVE INTEGER.
+          sqlite3.OperationalError: no such column or table.
+
+        """
+
+        for rows in self._iterbatches(sql, parameters, size):
+            yield from rows
+
+
+    def _iterbatches(self, sql, parameters, size):
+        """ Yield the rows returned by sql in lists of size rows. """
+
+        if not isinstance(sql, str):
+            raise TypeError(('sql argument is NOT A STRING: '
+                             '{}').format(type(sql)))
+        if not isinstance(size, int) or size < 1:
+            raise ValueError(('size argument is NOT A POSITIVE INTEGER: '
+                              '{}').format(size))
+
+        logging.info('Streaming rows from SQL statement in batches of '
+                     '%s rows: %s', size, sql)
+        with self._connection() as connection:
+            # Only time spent in SQLite is recorded, not time spent by 
+            # the caller between batches.
+            elapsed = 0.0
+            count = 0
+            total_changes = connection.total_changes
+            connection.tables.reset()
+            with self._scope(connection):
+                with contextlib.closing(connection.cursor()) as cursor:
+                    cursor.arraysize = size
+                    start = time.perf_counter()
+                    if parameters is None:
+                        cursor.execute(sql)
+                    else:
+                        cursor.execute(sql, parameters)
+                    self._count_statement(connection)
+                    while True:
+                        rows = cursor.fetchmany()
+                        elapsed += time.perf_counter() - start
+                        if not rows:
+                            break
+                        count += len(rows)
+                        yield rows
+                        start = time.perf_counter()
+            if self._result_cache is not None:
+                self._settle(connection, sql)
+            if self._metrics is not None:
+                self._observe(connection, sql, parameters, 'NORMAL', 
+                              elapsed, count, 
+                              connection.total_changes - total_changes)
+        logging.info('Streaming of rows complete.')
+
+
+    def load(self, sql=None, rows=None, chunk_size=10000, fast=False,
+             progress=None):
+        """ Bulk load rows from any iterable.
+
+        This method executes a SQL statement, typically an INSERT, 
+        against each sequence of parameters or mapping produced by the
+        rows iterable. Unlike MANY mode in execute(), rows may be any 
+        iterable, including a generator, and are consumed chunk_size 
+        rows at a time, so the full set of rows never needs to be held
+        in memory. Each chunk is loaded and committed in its own 
+        explicit transaction. If an error occurs, the failing chunk is
+        rolled back, while all previous chunks remain committed. Inside
+        a transaction(), all chunks are loaded in that transaction 
+        instead.
+
+        If fast is True, then synchronous writes (and, unless the 
+        database is in WAL mode, the on-disk rollback journal) are 
+        turned off on the loading connection for the duration of the 
+        load. This is much faster, but a crash or power loss during the
+        load may corrupt the database.
+
+        Arguments:
+          sql: str: required: SQL statement to execute for each row.
+          rows: iterable: required: Sequences of parameters or mappings.
+          chunk_size: int: optional: Number of rows per transaction.
+          fast: bool: optional: Relax journaling and syncing while 
+              loading.
+          progress: callable: optional: Called after each chunk is 
+              committed as progress(rows, rate), where rows is the 
+              number of rows loaded so far and rate is the average 
+              number of rows loaded per second.
+
+        Returns:
+          count: int: The number of rows loaded.
+
+        Raises:
+          TypeError: sql argument is NOT A STRING.
+          TypeError: rows argument is NOT ITERABLE.
+          ValueError: chunk_size argument is NOT A POSITIVE INTEGER.
+          sqlite3.IntegrityError: NOT NULL constraint failed.
+          sqlite3.IntegrityError: UNIQUE constraint failed.
+
+        """
+
+        if not isinstance(sql, str):
+            raise TypeError(('sql argument is NOT A STRING: '
+                             '{}').format(type(sql)))
+        try:
+            rows = iter(rows)
+        except TypeError:
+            raise TypeError(('rows argument is NOT ITERABLE: '
+                             '{}').format(type(rows))) from None
+        if not isinstance(chunk_size, int) or chunk_size < 1:
+            raise ValueError(('chunk_size argument is NOT A POSITIVE '
+                              'INTEGER: {}').format(chunk_size))
+
+        logging.info('Bulk loading rows in chunks of %s rows: %s',
+                     chunk_size, sql)
+        count = 0
+        start = time.monotonic()
+        nested = self._in_transaction()
+        if nested and fast:
+            logging.warning('fast argument is ignored inside a transaction.')
+            fast = False
+        with self._connection() as connection:
+            with contextlib.closing(connection.cursor()) as cursor:
+                if fast:
+                    pragmas = self._relax(cursor)
+                try:
+                    while True:
+                        chunk = list(itertools.islice(rows, chunk_size))
+                        if not chunk:
+                            break
+                        if not nested:
+                            cursor.execute('BEGIN;')
+                        connection.tables.reset()
+                        begin = time.perf_counter()
+                        total_changes = connection.total_changes
+                        try:
+                            cursor.executemany(sql, chunk)
+                        except Exception:
+                            if not nested:
+                                connection.rollback()
+                            raise
+                        self._count_statement(connection)
+                        if not nested:
+                            connection.commit()
+                        if self._result_cache is not None:
+                            self._settle(connection, sql)
+                        if self._metrics is not None:
+                            self._observe(connection, sql, chunk[0], 'MANY',
+                                          time.perf_counter() - begin, 0,
+                                          connection.total_changes - 
+                                          total_changes)
+                        count += len(chunk)
+                        elapsed = time.monotonic() - start
+                        rate = count / elapsed if elapsed > 0 else 0.0
+                        logging.info('Loaded %s rows (%.0f rows/sec).',
+                                     count, rate)
+                        if progress is not None:
+                            progress(count, rate)
+                except Exception as e:
+                    logging.exception(e)
+                    logging.debug('%s rows were loaded and committed '
+                                  'before the error.', count)
+                    raise
+                finally:
+                    if fast:
+                        self._restore(cursor, pragmas)
+
+        logging.info('Bulk load complete: %s rows in %.3f '
+                     'seconds.', count, time.monotonic() - start)
+        return count
+
+
+    def load_csv(self, sql=None, path=None, delimiter=None, header=True,
+                 encoding='utf-8', **kwargs):
+        """ Bulk load rows from a CSV or TSV file.
+
+        Rows are read from the file lazily and passed to load(), so the
+        file is never read into memory as a whole. Values are bound to
+        the SQL statement as strings; SQLite applies the declared 
+        column affinity on insert.
+
+        Arguments:
+          sql: str: required: SQL statement to execute for each row.
+          path: str/os.PathLike: required: Path to the CSV or TSV file.
+          delimiter: str: optional: Field delimiter. Defaults to a tab
+              for files ending in .tsv and to a comma otherwise.
+          header: bool: optional: Skip the first line of the file.
+          encoding: str: optional: Text encoding of the file.
+          **kwargs: optional: Passed on to load().
+
+        Returns:
+          count: int: The number of rows loaded.
+
+        Raises:
+          ValueError: path argument is NOT A PATH.
+          FileNotFoundError: path argument is NOT A PATH TO AN EXISTING
+              FILE.
+          See load().
+
+        """
+
+        if not isinstance(path, (str, os.PathLike)) or not os.fspath(path):
+            raise ValueError(('path argument is NOT A PATH: '
+                              '{!r}').format(path))
+        path = os.fspath(path)
+        if isinstance(path, bytes):
+            path = os.fsdecode(path)
+        if not os.path.isfile(path):
+            raise FileNotFoundError(('path argument is NOT A PATH TO AN '
+                                     'EXISTING FILE: {}').format(path))
+        if delimiter is None:
+            delimiter = '\t' if path.lower().endswith('.tsv') else ','
+
+        logging.info('Bulk loading rows from file: %s', path)
+        with open(path, 'r', newline='', encoding=encoding) as csv_file:
+            reader = csv.reader(csv_file, delimiter=delimiter)
+            if header:
+                next(reader, None)
+            return self.load(sql, reader, **kwargs)
+
+
+    @staticmethod
+    def _relax(cursor):
+        """ Turn off syncing and journaling, returning prior values. """
+
+        pragmas = {}
+        for pragma in ('synchronous', 'journal_mode'):
+            cursor.execute('PRAGMA {};'.format(pragma))
+            pragmas[pragma] = cursor.fetchone()[0]
+        cursor.execute('PRAGMA synchronous = OFF;')
+        if pragmas['journal_mode'].lower() != 'wal':
+            cursor.execute('PRAGMA journal_mode = MEMORY;')
+        return pragmas
+
+
+    @staticmethod
+    def _restore(cursor, pragmas):
+        """ Restore PRAGMA values returned by _relax(). """
+
+        for pragma, value in pragmas.items():
+            cursor.execute('PRAGMA {} = {};'.format(pragma, value))
+            cursor.fetchall()
+
+
+    def test(self):
+        """ Run a test SQL query against the database.
+
+        This method attempts to execute a test query against the 
+        database to fetch the names of the tables in the database. The 
+        names are taken from the schema catalog (see schema()), so the 
+        only query executed is the check of the schema version.
+
+        Arguments:
+          None
+
+        Returns:
+          True or False: bool: If test query executes successfully, then 
+              returns True. Otherwise, returns False.
+        
+        Raises:
+          None
+
+        """
+
+        logging.info('Attempting to execute test SQL query against '
+                     'database ...')
+        try:
+            table_names = list(self.schema().tables)
+        except Exception as e:
+            logging.exception(e)
+            return False
+        else:
+            logging.info('Test SQL query executed successfully.')
+            if not table_names:
+                logging.warning('database contains no tables.')
+                logging.debug('database needs a schema.')
+            else:
+                logging.info('database table names are: %s', table_names)
+            return True
+
+
+class AsyncSQLite3DB(object):
+    """An asyncio counterpart to SQLite3DB.
+
+    SQLite3DB's methods block until the database has done its work, 
+    which stalls an asyncio event loop. This class runs that work on a
+    pool of dedicated worker threads instead, and makes it awaitable. 
+    Each call takes a connection from the underlying SQLite3DB object's
+    pool, so that the workers follow it to and from an in-memory 
+    database with cache() and uncache(). At most 
+    concurrency calls are handed to the workers at once; any others 
+    wait on the event loop, where they may be cancelled cheaply. If a 
+    call is cancelled while a worker is running it, then the statement
+    running on the worker's connection is interrupted, and the call 
+    counts against concurrency until the worker is done with it.
+
+    Streaming iterators returned by iterquery() hold a pooled 
+    connection for their whole lifetime, rather than for each call.
+
+    Attributes:
+      db: SQLite3DB: The underlying, blocking database object.
+      workers: int: Number of worker threads.
+
+    Methods:
+      close(): Shut down the workers and close all connections.
+      columns(sql, parameters): Return query results by column.
+      dump(target, compression): Dump the database to an ASCII text 
+          file.
+      execute(sql, parameters, mode): Execute SQL statement(s).
+      execute_many(sql, parameters): Fast path for MANY mode.
+      iterquery(sql, parameters, size): Iterate lazily over query rows.
+      query(sql, parameters): Fast path for NORMAL mode.
+      test(): Run a test SQL query against the database.
+      write(sql, parameters): Queue a write for group commit.
+
+    """
+
+    def __init__(self, database=None, workers=4, concurrency=None, **kwargs):
+        """ Initializes AsyncSQLite3DB object.
+
+        Arguments:
+          database: str: required: Path to sqlite3 database.
+          workers: int: optional: Number of worker threads.
+          concurrency: int: optional: Maximum number of calls handed to
+              the workers at once. Defaults to workers.
+          **kwargs: optional: Passed on to SQLite3DB(). pool_max_size 
+              defaults to at least workers, so that no worker waits on 
+              the pool for a connection.
+
+        Returns:
+          None
+
+        Raises:
+          See SQLite3DB().
+
+        """
+
+        kwargs.setdefault('pool_max_size', max(5, workers))
+        self.db = SQLite3DB(database, **kwargs)
+        self.workers = workers
+        self._semaphore = asyncio.Semaphore(concurrency or workers)
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            workers, thread_name_prefix='sqlite3db-worker')
+
+
+    async def execute(self, sql=None, parameters=None, mode=None):
+        """ Execute SQL statement(s). See SQLite3DB.execute(). """
+
+        return await self._call(self.db.execute, sql, parameters, mode)
+
+
+    async def query(self, sql, parameters=()):
+        """ Fast path for NORMAL mode. See SQLite3DB.query(). """
+
+        return await self._call(self.db.query, sql, parameters)
+
+
+    async def columns(self, sql, parameters=(), chunk_size=10000, 
+                      as_numpy=None):
+        """ Return query results by column. See SQLite3DB.columns(). """
+
+        return await self._call(self.db.columns, sql, parameters, 
+                                chunk_size, as_numpy)
+
+
+    async def execute_many(self, sql, parameters):
+        """ Fast path for MANY mode. See SQLite3DB.execute_many(). """
+
+        return await self._call(self.db.execute_many, sql, parameters)
+
+
+    async def write(self, sql, parameters=None):
+        """ Queue a write for group commit. See SQLite3DB.submit(). """
+
+        return await asyncio.wrap_future(self.db.submit(sql, parameters))
+
+
+    async def dump(self, target=None, compression=None, batch=1000):
+        """ Dump the database to an ASCII text file. """
+
+        return await self._call(self.db.dump, target, compression, batch)
+
+
+    async def test(self):
+        """ Run a test SQL query against the database. """
+
+        return await self._call(self.db.test)
+
+
+    async def iterquery(self, sql=None, parameters=None, size=256):
+        """ Iterate lazily over the rows returned by a SQL statement.
+
+        Use as: async for row in db.iterquery(sql): ...
+
+        Each batch of size rows is fetched on a worker thread. See 
+        SQLite3DB.iterquery().
+
+        """
+
+        loop = asyncio.get_running_loop()
+        batches = self.db._iterbatches(sql, parameters, size)
+        try:
+            while True:
+                rows = await self._submit(next, batches, None)
+                if rows is None:
+                    break
+                for row in rows:
+                    yield row
+        finally:
+            await loop.run_in_executor(self._executor, batches.close)
+
+
+    async def close(self):
+        """ Shut down the workers and close all connections. """
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._executor.shutdown, True)
+        self.db.close()
+
+
+    async def __aenter__(self):
+        return self
+
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+    async def _call(self, function, *args):
+        """ Await function(*args) run on a pooled connection. 
+
+        running is shared with the worker for this call only. The 
+        worker records its connection there while the call runs, and 
+        removes it, under the lock, when the call is done, so that a 
+        cancelled call interrupts the connection only while it is still
+        running the call, and never a later call that uses it.
 
         """
 
-        # Establish a connection to the database.
-        logging.info('Attempting to establish a connection to the '
-                     'database ...')
+        running = {'lock': threading.Lock()}
         try:
-            connection = sqlite3.connect(self.database)
-        except sqlite3.OperationalError as e:
-            logging.exception(e)
-            logging.debug('Check permissions on the database file. '
-                          'database file must be readable to establish '
-                          'a connection.')
+            return await self._submit(self._run, running, function, args)
+        except asyncio.CancelledError:
+            with running['lock']:
+                connection = running.get('connection')
+                if connection is not None:
+                    logging.info('Interrupting cancelled SQL statement '
+                                 'on connection: %s', connection)
+                    connection.interrupt()
             raise
-        else:
-            logging.info(('connection established: '
-                          '{}').format(connection))
 
-        # Create a database cursor on the connection.
-        logging.info('Creating a database cursor on the connection ...')
-        try:
-            cursor = connection.cursor()
-        except sqlite3.ProgrammingError as e:
-            logging.exception(e)
-            raise
-        else:
-            logging.info(('cursor created: {}').format(cursor))
 
-        # Enable foreign key constraints on database connection.
-        logging.info('Enabling foreign key constraints ... ')
-        try:
-            cursor.execute('PRAGMA foreign_keys = ON;')
-        except Exception as e:
-            logging.exception(e)
-            raise
-        else:
-            cursor.execute('PRAGMA foreign_keys;')
-            if cursor.fetchone()[0] == 1:
-                logging.info('Foreign key constraints enabled.')
+    async def _submit(self, function, *args):
+        """ Await function(*args) run on a worker thread.
 
-        # Close database cursor.
-        logging.info('Closing database cursor ...')
+        The call holds one of the concurrency slots until the worker is
+        done with it, even if the call is cancelled, so no more than 
+        concurrency calls ever run at once.
+
+        """
+
+        loop = asyncio.get_running_loop()
+        await self._semaphore.acquire()
         try:
-            cursor.close()
-        except Exception as e:
-            logging.exception(e)
+            future = self._executor.submit(function, *args)
+        except BaseException:
+            self._semaphore.release()
             raise
-        else:
-            logging.info(('cursor closed: {}').format(cursor))
 
-        # Return database connection.
-        logging.info(('Returning database connection: '
-                      '{}').format(connection))
+        def release(future):
+            try:
+                loop.call_soon_threadsafe(self._semaphore.release)
+            except RuntimeError:
+                # The event loop is already closed.
+                pass
 
-        return connection
+        future.add_done_callback(release)
+        return await asyncio.wrap_future(future)
 
 
-    def dump(self):
-        """ Dump the database to an ASCII text file.
+    def _run(self, running, function, args):
+        """ Run function(*args) on a pooled connection. """
+
+        with self.db._connection() as connection, self.db._pin(connection):
+            with running['lock']:
+                running['connection'] = connection
+            try:
+                return function(*args)
+            finally:
+                with running['lock']:
+                    del running['connection']
+
+
+class ShardedSQLite3DB(object):
+    """Spreads a database across several SQLite database files.
+
+    Each file, or shard, is worked with through a SQLite3DB object of 
+    its own, and so has its own connections, and its own write lock. 
+    Rows of the partitioned tables (e.g., customer_order and order_item,
+    by customer) are kept on one shard each, chosen by a shard key: 
+    either by hashing the key, or by the range it falls in. Tables that
+    are not partitioned (e.g., country or product) are kept whole on 
+    every shard, so that each shard can join its rows to them.
+
+    Writes given a key go to the shard that owns it, so writes to 
+    different shards run in parallel, and write throughput grows with 
+    the number of shards. Writes given no key, e.g., to the schema or to
+    the tables kept on every shard, go to every shard. Changes made on 
+    several shards are committed on each separately, not atomically.
+    Each shard numbers its own rows, so ids assigned by SQLite (e.g., 
+    by AUTOINCREMENT) are unique only within a shard.
+    Reads given a key run on the owning shard. Reads given no key run 
+    on every shard in parallel, and their rows are gathered, and then 
+    optionally aggregated by group, ordered, and limited.
+
+    Attributes:
+      shards: list: The SQLite3DB object of each shard.
+      ranges: list: Upper bounds (exclusive) of the keys owned by each 
+          shard but the last, if partitioned by range. None if 
+          partitioned by hash.
+
+    Methods:
+      close(): Close all connections to all shards.
+      execute(sql, parameters, key): Execute a SQL statement on the 
+          owning shard, or on every shard.
+      execute_many(sql, parameters, key): Execute a SQL statement 
+          against many sets of parameters, each on its owning shard.
+      execute_script(path): Execute a file of SQL statements on every 
+          shard.
+      query(sql, parameters, key, group_by, aggregates, order_by, 
+          limit): Run a query on the owning shard, or on every shard and
+          merge the results.
+      shard(key): Return the SQLite3DB object of the owning shard.
+      shard_index(key): Return the index of the owning shard.
+      submit(sql, parameters, key): Queue a write for group commit on 
+          the owning shard.
+      test(): Run a test SQL query against every shard.
+
+    """
+
+    # Partial aggregates computed on each shard, and how to combine them.
+    _COMBINE = {
+        'count': lambda values: sum(value or 0 for value in values),
+        'sum': lambda values: sum(value for value in values 
+                                  if value is not None) 
+                              if any(value is not None for value in values)
+                              else None,
+        'min': lambda values: min((value for value in values 
+                                   if value is not None), default=None,
+                                  key=_sort_key),
+        'max': lambda values: max((value for value in values 
+                                   if value is not None), default=None,
+                                  key=_sort_key),
+    }
+
+    def __init__(self, databases=None, ranges=None, workers=None, **kwargs):
+        """ Initializes ShardedSQLite3DB object.
 
-        This method provides the same capabilities as the .dump command
-        in the sqlite3 shell.
- 
         Arguments:
-          None
+          databases: list: required: Paths to the sqlite3 database file
+              of each shard, in order.
+          ranges: list: optional: Partition by range rather than by 
+              hash. The ascending upper bounds (exclusive) of the keys 
+              owned by each shard but the last, one fewer than there 
+              are databases.
+          workers: int: optional: Number of threads that work on shards
+              in parallel. Defaults to the number of shards.
+          **kwargs: optional: Passed on to SQLite3DB() for each shard.
 
         Returns:
           None
 
         Raises:
-          Exception: Catch-all exception used until specific exceptions
-              that may occur while dumping the database out to a file 
-              are known.
+          TypeError: databases argument is NOT A LIST.
+          ValueError: databases argument list is EMPTY.
+          ValueError: ranges argument does NOT MATCH the databases.
+          See SQLite3DB().
 
         """
 
-        # Dump the database to an ASCII text file.
-        logging.info('Dumping database to an ASCII text file ...')
+        logging.info('Initializing ShardedSQLite3DB object: %s', self)
         try:
-            with contextlib.closing(self.connect()) as connection:
-                with connection:
-                    logging.info('Opening file ...')
-                    with open(self.database + '.sql', 'w') as sql_file:
-                        logging.info(('file open: {}').format(sql_file))
-                        sql_dump = connection.iterdump()
-                        logging.info('Dumping database ...') 
-                        for sql_line in sql_dump:
-                            sql_file.write(('{}\n').format(sql_line))
-                        logging.info('Dump complete.')
-                        logging.info('Closing file ...')
-                    logging.info(('file closed: {}').format(sql_file))
-                logging.info('Closing database connection ...')
-            logging.info(('connection closed: {}').format(connection))
-        except Exception as e:
+            if not isinstance(databases, (list, tuple)):
+                raise TypeError(('databases argument is NOT A LIST: '
+                                 '{}').format(type(databases)))
+            if not databases:
+                raise ValueError('databases argument list is EMPTY.')
+            if ranges is not None and (
+                    len(ranges) != len(databases) - 1 
+                    or list(ranges) != sorted(ranges)):
+                raise ValueError('ranges argument does NOT MATCH the '
+                                 'databases: it must hold one ascending '
+                                 'bound fewer than there are databases.')
+        except (TypeError, ValueError) as e:
             logging.exception(e)
             raise
-        else:
-            logging.info(('database dumped to ASCII text file: '
-                          '{}').format(self.database + '.sql'))
 
+        self.ranges = None if ranges is None else list(ranges)
+        self.shards = [SQLite3DB(database, **kwargs) 
+                       for database in databases]
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            workers or len(self.shards), thread_name_prefix='sqlite3db-shard')
+        logging.info('ShardedSQLite3DB object initialized with %s shards.',
+                     len(self.shards))
 
-    def execute(self, sql=None):
-        """ Executes SQL statement(s).
 
-        This method executes SQL statement(s) against the database using
-        one of three different possible modes of operation:
+    def __enter__(self):
+        return self
 
-          NORMAL: Executes a SQL statement from a string provided as 
-                  the input sql argument.
 
-          SCRIPT: Executes all SQL statements found in a file whose
-                  relative or absolute path is provided as the input 
-                  sql argument.
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
 
-            MANY: Executes a SQL statement from a string found at the
-                  top of a list provided as the input sql argument. It
-                  is executed against all parameters or mapping found
-                  in the list of tuples that follow the string.
+
+    def shard_index(self, key):
+        """ Return the index of the shard that owns key. 
+
+        Integer keys are hashed to themselves, so that consecutive keys
+        are spread evenly, and any other key to the CRC-32 of its text
+        (or of its bytes), which does not change between runs.
+
+        """
+
+        if self.ranges is not None:
+            return bisect.bisect_right(self.ranges, key)
+        if isinstance(key, int):
+            return key % len(self.shards)
+        if not isinstance(key, bytes):
+            key = str(key).encode('utf-8')
+        return zlib.crc32(key) % len(self.shards)
+
+
+    def shard(self, key):
+        """ Return the SQLite3DB object of the shard that owns key. """
+
+        return self.shards[self.shard_index(key)]
+
+
+    def execute(self, sql, parameters=None, key=None):
+        """ Execute a SQL statement on the owning shard, or on all.
 
         Arguments:
-          sql: str/list: required: SQL statement(s) to be executed. 
+          sql: str: required: SQL statement to be executed.
+          parameters: tuple/list/dict: optional: Values bound to the 
+              placeholders of the SQL statement.
+          key: optional: Shard key. If None, then the statement is 
+              executed on every shard, in parallel.
 
         Returns:
-          changes: 
-          rows: 
+          changes: int: Number of rows modified, inserted or deleted, 
+              on all shards.
+          rows: list: Rows returned, from all shards.
 
         Raises:
-          TypeError: sql argument must be either a string or a list.
-          ValueError: sql_statement string must be a complete SQL statement.
-          TypeError: If sql argument is a list, then items remaining in
-              list after removal of sql_statement must be tuples.
-          sqlite3.IntegrityError: NOT NULL constraint failed.
-          sqlite3.IntegrityError: UNIQUE constraint failed.
-          sqlite3.OperationalError: no such column or table.
-          sqlite3.ProgrammingError: Cannot operate on a closed cursor or database.
-          sqlite3.Warning: You can only execute one statement at a time.
-          sqlite3.DatabaseError: File is encrypted or is not a database.
+          See SQLite3DB.query().
 
         """
 
-        # Start execution of SQL statement(s).
-        logging.info(('Starting execution of SQL statement(s) from '
-                      'sql argument: {} : {}').format(id(sql),sql))
+        if parameters is None:
+            parameters = ()
+        if key is not None:
+            return self.shard(key).query(sql, parameters)
+        results = self._map(lambda shard: shard.query(sql, parameters))
+        return (sum(changes for changes, _ in results), 
+                [row for _, rows in results for row in rows])
 
-        # Check if sql argument is a string or a list. If sql argument 
-        # is neither a string nor a list, then throw an exception. 
-        logging.info('Type checking sql argument ...')
-        try:
-            if not (isinstance(sql, str) or isinstance(sql, list)):
-                raise TypeError(('sql argument is NOT A STRING OR A '
-                                 'LIST: {}').format(type(sql)))
-        except TypeError as e:
-            logging.exception(e)
-            logging.debug('sql argument MUST BE A STRING OR A LIST.')
-            raise
-        else:
-            logging.info(('sql argument is of type: '
-                          '{}').format(type(sql)))
-
-        # Determine execution mode for SQL statement(s). 
-        logging.info('Determining execution mode for SQL '
-                     'statement(s) ...')
-        if isinstance(sql, str):
-            if os.path.isfile(sql):
-                execution_mode = 'SCRIPT' 
-            else:
-                execution_mode = 'NORMAL'
-        elif isinstance(sql, list):
-            execution_mode = 'MANY' 
-        logging.info(('Execution mode is: {}').format(execution_mode))
 
-        # Prepare SQL statement(s) based on execution mode.
-        if execution_mode == 'NORMAL':
-            logging.info('Copying SQL statement from string ...')
-            sql_statement = sql
-        elif execution_mode == 'MANY':
-            logging.info('Removing SQL statement from list ...')
-            sql_statement = sql.pop(0)
-        elif execution_mode == 'SCRIPT':
-            logging.info('Reading in SQL statement(s) from file ...')
-            try:
-                with open(sql, 'r') as sql_file:
-                    sql_statement = sql_file.read()
-            except Exception as e:
-                logging.exception(e)
-                raise
-            else:
-                logging.info(('SQL statement(s) have been read in from '
-                              'file: {}'.format(sql)))
+    def execute_many(self, sql, parameters, key=None):
+        """ Execute a SQL statement against many sets of parameters.
 
-        # Check if sql_statement string is empty. If sql_statement
-        # string is empty, then throw a warning.
-        logging.info('Checking if sql_statement string is empty ...')
-        try:
-            if not sql_statement:
-                raise ValueError('sql_statement string is EMPTY.')
-        except ValueError as w:
-            logging.warn(w)
-        else:
-            logging.info(('sql_statement string is not empty: '
-                          '{}').format(sql_statement))
+        Arguments:
+          sql: str: required: SQL statement to be executed.
+          parameters: iterable: required: Sequences or mappings of 
+              values to bind to the statement.
+          key: callable: optional: Returns the shard key of a set of 
+              parameters. Each set is then executed on its owning shard
+              only, with the sets for each shard executed together, and
+              the shards worked on in parallel. If None, then every set
+              is executed on every shard.
 
-        # Check if sql_statement string is a complete SQL statement. If
-        # sql_statement string is not a complete SQL statement, then 
-        # throw an exception.
-        logging.info('Checking if sql_statement string is a complete '
-                     'SQL statement ...')
-        try:
-            if not sqlite3.complete_statement(sql_statement):
-                raise ValueError('sql_statement string is NOT A '
-                                 'COMPLETE SQL STATEMENT.')
-        except ValueError as e:
-            logging.exception(e)
-            logging.debug('Check if the sql_statement string is '
-                          'terminated by a semi-colon.')
-            raise
-        else:
-            logging.info('sql_statement string is a complete SQL '
-                         'statement.')
+        Returns:
+          changes: int: Number of rows modified, inserted or deleted, 
+              on all shards.
 
-        # Perform execution mode-based checks on SQL statement(s) prior
-        # to execution. For example, if execution mode is 'MANY', then 
-        # before executing many SQL statements, check if all items 
-        # remaining in the sql argument list are tuples.
-        if execution_mode == 'MANY':
-            logging.info('Type checking items remaining in the sql '
-                         'argument list ...')
-            try:
-                for item in sql:
-                    if not isinstance(item, tuple):
-                        raise TypeError(('At least one item in the sql '
-                                         'argument list is not a tuple: '
-                                         '{}').format(type(item)))
-            except TypeError as e:
-                logging.exception(e)
-                logging.debug('All items remaining in the sql argument '
-                              'list should be a set of tuples that '
-                              'represent the sequence of parameters to '
-                              'execute against the SQL statement.')
-                raise
-            else:
-                logging.info('All items remaining in the sql argument '
-                             'list are tuples.')
+        Raises:
+          See SQLite3DB.execute_many().
 
-        # Open a connection to database, create a cursor on this
-        # connection, and then execute the SQL statement(s).
-        try:
-            with contextlib.closing(self.connect()) as connection:
-                with connection:
-                    logging.info('Creating a database cursor on the '
-                                 'connection ...')
-                    with contextlib.closing(connection.cursor()) as cursor:
-                        logging.info(('cursor created: {}').format(cursor))
-                        logging.info('Executing SQL statement(s) ...')
-                        if execution_mode == 'NORMAL':
-                            cursor.execute(sql_statement)
-                        elif execution_mode == 'MANY':
-                            cursor.executemany(sql_statement, sql)
-                        elif execution_mode == 'SCRIPT':
-                            cursor.executescript(sql_statement)
-                        logging.info('SQL statement(s) executed.')
-                        logging.info('Fetching any returned rows ... ')
-                        rows = cursor.fetchall()
-                        logging.info('Fetch complete.')
-                        logging.info('Closing database cursor ...')
-                    logging.info(('cursor closed: {}').format(cursor))
-                logging.info('Saving the total number of database '
-                             'rows that were modified, inserted, '
-                             'and/or deleted during SQL statement '
-                             'execution ...')
-                changes = connection.total_changes
-                logging.info('Closing database connection ...')
-            logging.info(('connection closed: {}').format(connection))
-        except Exception as e:
-            logging.exception(e)
-            raise
+        """
+
+        if key is None:
+            parameters = list(parameters)
+            batches = [parameters] * len(self.shards)
         else:
-            logging.info(('Execution of SQL statement(s) complete: '
-                          '{}').format(id(sql)))
+            batches = [[] for _ in self.shards]
+            for values in parameters:
+                batches[self.shard_index(key(values))].append(values)
+        results = self._map(
+            lambda shard, batch: shard.execute_many(sql, batch) 
+            if batch else (0, []), batches)
+        return sum(changes for changes, _ in results)
 
-        # Return the total number of database rows that were modified, 
-        # inserted, and/or deleted by executing the SQL statement(s) 
-        # AND any rows fetched from the database.
-        return changes, rows
 
+    def execute_script(self, path):
+        """ Execute a file of SQL statements (e.g., the schema) on every
+        shard. Returns the number of rows changed on all shards. """
 
-    def test(self):
-        """ Run a test SQL query against the database.
+        results = self._map(lambda shard: shard.execute_script(path))
+        return sum(changes for changes, _ in results)
 
-        This method attempts to execute a test query against the 
-        database to SELECT and fetch the names of the tables in the 
-        database. 
+
+    def submit(self, sql, parameters=None, key=None):
+        """ Queue a write for group commit on the shard that owns key. 
+
+        See SQLite3DB.submit(). Writes to different shards are 
+        committed by different writers, in parallel.
+
+        """
+
+        return self.shard(key).submit(sql, parameters)
+
+
+    def query(self, sql, parameters=(), key=None, group_by=None,
+              aggregates=None, order_by=None, limit=None):
+        """ Run a query on the owning shard, or on every shard.
+
+        Run on every shard, the query's rows are gathered from each 
+        shard, and then merged in three optional steps:
+
+        1. Rows are grouped by the columns at the indexes in group_by,
+           and the partial aggregates in the other columns combined as 
+           aggregates says. For example, for SELECT status, count(*), 
+           sum(quantity) ... GROUP BY status, pass group_by=[0] and 
+           aggregates={1: 'count', 2: 'sum'}. Averages cannot be 
+           combined; select the sum and count instead. Columns that are 
+           neither grouped nor aggregated take their value from the 
+           group's first row.
+        2. Rows are ordered by order_by, a list of column indexes, each
+           optionally paired with True to sort in descending order, 
+           e.g., [(2, True), 0]. Values of different types sort as in 
+           SQLite: NULLs first, then numbers, then text, then blobs.
+        3. Only the first limit rows are kept. A query with a LIMIT 
+           should also have the same ORDER BY, so that each shard 
+           returns its own first rows.
 
         Arguments:
-          None
+          sql: str: required: SQL query to be executed.
+          parameters: tuple/list/dict: optional: Values bound to the 
+              placeholders of the SQL query.
+          key: optional: Shard key. If given, then the query runs on the
+              owning shard only, and its rows are returned as they are.
+          group_by: list: optional: Indexes of the columns to group by.
+          aggregates: dict: optional: Maps the index of a column to 
+              'count', 'sum', 'min' or 'max'.
+          order_by: list: optional: Indexes of the columns to order by,
+              or (index, descending) pairs.
+          limit: int: optional: Maximum number of rows returned.
 
         Returns:
-          True or False: bool: If test query executes successfully, then 
-              returns True. Otherwise, returns False.
-        
+          rows: list: Rows returned by the query.
+
         Raises:
-          None
+          ValueError: aggregates argument has an UNSUPPORTED AGGREGATE.
+          See SQLite3DB.query().
 
         """
 
-        logging.info('Attempting to execute test SQL query against '
-                     'database ...')
-        try:
-            changes, table_names = self.execute(
-                """ SELECT name
-                    FROM sqlite_master
-                    WHERE type='table'
-                    AND name!='sqlite_sequence'; """)
-        except Exception as e:
-            logging.exception(e)
-            return False
-        else:
-            logging.info('Test SQL query executed successfully.')
-            if not table_names:
-                logging.warn('database contains no tables.')
-                logging.debug('database needs a schema.')
-            else:
-                logging.info(('database table names are: '
-                              '{}').format(table_names))
-            return True
+        if key is not None:
+            return self.shard(key).query(sql, parameters)[1]
+
+        aggregates = dict(aggregates or {})
+        for function in aggregates.values():
+            if function not in self._COMBINE:
+                raise ValueError(('aggregates argument has an UNSUPPORTED '
+                                  'AGGREGATE: {}').format(function))
+
+        results = self._map(lambda shard: shard.query(sql, parameters)[1])
+        rows = [row for shard_rows in results for row in shard_rows]
+
+        if group_by is not None or aggregates:
+            rows = self._combine(rows, list(group_by or ()), aggregates)
+        if order_by:
+            for column in reversed(order_by):
+                index, descending = (column if isinstance(column, tuple)
+                                     else (column, False))
+                rows.sort(key=lambda row: _sort_key(row[index]),
+                          reverse=descending)
+        if limit is not None:
+            rows = rows[:limit]
+        return rows
+
+
+    def test(self):
+        """ Run a test SQL query against every shard. Returns True if 
+        all pass. """
+
+        return all(self._map(lambda shard: shard.test()))
+
+
+    def close(self):
+        """ Close all connections to all shards. """
+
+        logging.info('Closing all shards ...')
+        self._executor.shutdown(wait=True)
+        for shard in self.shards:
+            shard.close()
+
+
+    def _map(self, function, *iterables):
+        """ Call function with each shard (and the matching item of each
+        of iterables) in parallel, and return the results in order. """
+
+        return list(self._executor.map(function, self.shards, *iterables))
+
+
+    def _combine(self, rows, group_by, aggregates):
+        """ Combine rows by group, in the order the groups first appear.
+        """
+
+        groups = collections.OrderedDict()
+        for row in rows:
+            groups.setdefault(tuple(row[index] for index in group_by), 
+                              []).append(row)
+        combined = []
+        for members in groups.values():
+            row = list(members[0])
+            for index, function in aggregates.items():
+                row[index] = self._COMBINE[function](
+                    [member[index] for member in members])
+            combined.append(tuple(row))
+        return combined
+
+
+# Each replica process started by SQLite3DB.replicate() holds a single
+# connection to its own in-memory copy of the database, or the error 
+# that kept it from loading one.
+_replica = None
+_replica_error = None
+
+
+def _load_replica(snapshot):
+    """ Return a read-only, in-memory copy of a database snapshot. """
+
+    replica = sqlite3.connect(':memory:')
+    try:
+        with contextlib.closing(sqlite3.connect(snapshot)) as source:
+            source.backup(replica)
+        replica.execute('PRAGMA query_only = ON;')
+    except Exception:
+        replica.close()
+        raise
+    return replica
+
+
+def _replica_initializer(snapshot):
+    """ Load a database snapshot into a replica's memory. 
+
+    A process pool replaces a worker whose initializer raises with a 
+    new one, forever, so the error is kept and raised by each query 
+    instead.
+
+    """
+
+    global _replica, _replica_error
+    try:
+        _replica = _load_replica(snapshot)
+    except Exception as e:
+        _replica_error = e
+
+
+def _replica_query(query):
+    """ Execute a read query on a replica and return its rows. """
+
+    if _replica is None:
+        raise _replica_error
+    sql, parameters = query
+    with contextlib.closing(_replica.cursor()) as cursor:
+        cursor.execute(sql, parameters)
+        return cursor.fetchall()
 
 
 def main():
@@ -465,85 +5449,95 @@ def main():
     # Set logging level.
     logging.basicConfig(level=logging.WARNING)
 
-    # Create database object.
-    db = SQLite3DB('example.db')
+    # Create database object. Using it as a context manager closes its
+    # pooled connections on the way out.
+    with SQLite3DB('example.db') as db:
 
-    # If database file does not exist, then create the database file by
-    # executing the set of SQL statements that define the database's 
-    # schema from a file. And once the database schema is loaded, load 
-    # the initial data by executing a set of SQL statements from a file.
-    if not os.path.isfile('example.db'):
-       changes, rows = db.execute('example_db_schema.sql')
-       changes, rows = db.execute('example_db_init.sql')
+        # If database file does not exist, then create the database file
+        # by executing the set of SQL statements that define the 
+        # database's schema from a file. And once the database schema is
+        # loaded, load the initial data by executing a set of SQL 
+        # statements from a file.
+        if not os.path.isfile('example.db'):
+           changes, rows = db.execute('example_db_schema.sql')
+           changes, rows = db.execute('example_db_init.sql')
 
-    # Run a test query on the database. 
-    if db.test():
-       print('Passed database test.')
-    else:
-       print('Failed database test.')
-       return 1
+        # Run a test query on the database. 
+        if db.test():
+           print('Passed database test.')
+        else:
+           print('Failed database test.')
+           return 1
     
-    # Query the customer names from database.
-    changes, rows = db.execute('SELECT name FROM customer;')
-    print(changes, rows)
+        # Query the customer names from database.
+        changes, rows = db.execute('SELECT name FROM customer;')
+        print(changes, rows)
    
-    # Add a merchant. Cooking Power Tools, LLC.
-    changes, rows = db.execute("""
-        INSERT INTO merchant ( name, country_id )
-             SELECT 'Cooking Power Tools, LLC.', country.id
-               FROM country
-              WHERE country.name = 'United States'; 
-        """)
-    print(changes, rows)
-
-    # Add a new product.
-    changes, rows = db.execute("""
-        INSERT INTO product ( merchant_id, name, price, status )
-             SELECT merchant.id, 'Air Fryer', 99.95, 'Unavailble'
-               FROM merchant
-              WHERE merchant.name = 'Cooking Power Tools, LLC.';
-        """)
-    print(changes, rows)
-
-    # Add a new order from a customer.
-    changes, rows = db.execute("""
-        INSERT INTO customer_order ( customer_id, status )
-             SELECT customer.id, 'Pending'
-               FROM customer
-              WHERE customer.name = 'Rajneel';
-        """)
-    print(changes, rows)
-
-    changes, rows = db.execute("""
-        INSERT INTO order_item ( customer_order_id, product_id, quantity )
-             VALUES ( ( SELECT customer_order.id
-                          FROM customer_order
-                         WHERE customer_order.customer_id =
-                             ( SELECT customer.id
-                                 FROM customer
-                                WHERE customer.name = 'Rajneel' ) 
-                           AND customer_order.status = 'Pending' ),
-                             ( SELECT product.id
-                                 FROM product
-                                WHERE product.name='Air Fryer' ),
-                             ( 1 ) ); 
-        """)
-    print(changes, rows)
-
-    # Query what products each customer ordered and how many they ordered.
-    changes, rows = db.execute("""
-        SELECT customer.name, product.name, order_item.quantity
-          FROM customer_order
-          JOIN customer
-            ON customer.id = customer_order.customer_id
-          JOIN product 
-            ON product.id = order_item.product_id
-          JOIN order_item 
-            ON customer_order.id = order_item.customer_order_id;
-        """)
-    print(changes, rows)
-
-    return 0
+        # Add a merchant, one of its products and an order for it from a
+        # customer. All four inserts share one connection and are 
+        # committed together, or not at all.
+        with db.transaction():
+
+            # Add a merchant. Cooking Power Tools, LLC.
+            changes, rows = db.execute("""
+                INSERT INTO merchant ( name, country_id )
+                     SELECT ?, country.id
+                       FROM country
+                      WHERE country.name = ?; 
+                """, ('Cooking Power Tools, LLC.', 'United States'))
+            print(changes, rows)
+
+            # Add a new product.
+            changes, rows = db.execute("""
+                INSERT INTO product ( merchant_id, name, price, status )
+                     SELECT merchant.id, :name, :price, :status
+                       FROM merchant
+                      WHERE merchant.name = :merchant;
+                """, {'name': 'Air Fryer', 'price': 99.95,
+                      'status': 'Unavailble',
+                      'merchant': 'Cooking Power Tools, LLC.'})
+            print(changes, rows)
+
+            # Add a new order from a customer.
+            changes, rows = db.execute("""
+                INSERT INTO customer_order ( customer_id, status )
+                     SELECT customer.id, ?
+                       FROM customer
+                      WHERE customer.name = ?;
+                """, ('Pending', 'Rajneel'))
+            print(changes, rows)
+
+            changes, rows = db.execute("""
+                INSERT INTO order_item ( customer_order_id, product_id, quantity )
+                     VALUES ( ( SELECT customer_order.id
+                                  FROM customer_order
+                                 WHERE customer_order.customer_id =
+                                     ( SELECT customer.id
+                                         FROM customer
+                                        WHERE customer.name = ? ) 
+                                   AND customer_order.status = ? ),
+                                     ( SELECT product.id
+                                         FROM product
+                                        WHERE product.name = ? ),
+                                     ( ? ) ); 
+                """, ('Rajneel', 'Pending', 'Air Fryer', 1))
+            print(changes, rows)
+
+        # Query what products each customer ordered and how many they 
+        # ordered.
+        changes, rows = db.execute("""
+            SELECT customer.name, product.name, order_item.quantity
+              FROM customer_order
+              JOIN customer
+                ON customer.id = customer_order.customer_id
+              JOIN product 
+                ON product.id = order_item.product_id
+              JOIN order_item 
+                ON customer_order.id = order_item.customer_order_id;
+            """)
+        print(changes, rows)
+
+        return 0
 
 
 if __name__ == '__main__':
@@ -0,0 +1,400 @@
+#!/usr/bin/env python
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+from sqlite3db import SQLite3DB
+
+
+# Rows generated per unit of scale for each table of the example schema.
+ROWS = {
+    'country': 20,
+    'customer': 1000,
+    'merchant': 100,
+    'product': 1000,
+    'customer_order': 2000,
+    'order_item': 5000,
+}
+
+# The multi-way join run by main() in sqlite3db.py.
+JOIN = """
+    SELECT customer.name, product.name, order_item.quantity
+      FROM customer_order
+      JOIN customer
+        ON customer.id = customer_order.customer_id
+      JOIN product
+        ON product.id = order_item.product_id
+      JOIN order_item
+        ON customer_order.id = order_item.customer_order_id;
+    """
+
+STATUSES = ('Available', 'Unavailable', 'Discontinued')
+ORDER_STATUSES = ('Pending', 'Shipped', 'Delivered', 'Cancelled')
+
+
+def generate(db, scale=1, seed=0):
+    """ Fill a new database with a synthetic dataset.
+
+    The schema is loaded from example_db_schema.sql, and each table then
+    gets ROWS[table] * scale rows of random, but reproducible, data,
+    with every foreign key pointing at an existing row.
+
+    Arguments:
+      db: SQLite3DB: required: Database to fill. Its file should be new.
+      scale: float: optional: Multiplies the number of rows per table.
+      seed: int: optional: Seed for the random number generator.
+
+    Returns:
+      counts: dict: Number of rows in each table.
+
+    """
+
+    rng = random.Random(seed)
+    counts = {table: max(1, int(rows * scale))
+              for table, rows in ROWS.items()}
+
+    schema = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'example_db_schema.sql')
+    db.execute(schema, mode='SCRIPT')
+
+    db.load('INSERT INTO country ( name ) VALUES ( ? );',
+            (('country-{}'.format(i),) for i in range(counts['country'])),
+            fast=True)
+    for table in ('customer', 'merchant'):
+        db.load(('INSERT INTO {} ( name, country_id ) '
+                 'VALUES ( ?, ? );').format(table),
+                (('{}-{}'.format(table, i),
+                  rng.randint(1, counts['country']))
+                 for i in range(counts[table])),
+                fast=True)
+    db.load("""INSERT INTO product ( merchant_id, name, price, status )
+                    VALUES ( ?, ?, ?, ? );""",
+            ((rng.randint(1, counts['merchant']), 'product-{}'.format(i),
+              round(rng.uniform(0.01, 500.0), 2), rng.choice(STATUSES))
+             for i in range(counts['product'])),
+            fast=True)
+    db.load("""INSERT INTO customer_order ( customer_id, status )
+                    VALUES ( ?, ? );""",
+            ((rng.randint(1, counts['customer']),
+              rng.choice(ORDER_STATUSES))
+             for i in range(counts['customer_order'])),
+            fast=True)
+    db.load("""INSERT INTO order_item
+                    ( customer_order_id, product_id, quantity )
+                    VALUES ( ?, ?, ? );""",
+            ((rng.randint(1, counts['customer_order']),
+              rng.randint(1, counts['product']), rng.randint(1, 10))
+             for i in range(counts['order_item'])),
+            fast=True)
+
+    return counts
+
+
+def percentile(latencies, percent):
+    """ Return the nearest-rank percentile of sorted latencies. """
+
+    if not latencies:
+        return None
+    rank = max(1, int(round(percent / 100.0 * len(latencies))))
+    return latencies[min(rank, len(latencies)) - 1]
+
+
+def summarize(latencies, elapsed, rows=None):
+    """ Summarize the latencies (in seconds) of a benchmark's operations.
+
+    Latencies are reported in milliseconds, and throughput in
+    operations (and rows, if given) per second of elapsed time.
+
+    """
+
+    latencies = sorted(latencies)
+    summary = {
+        'operations': len(latencies),
+        'elapsed_s': elapsed,
+        'ops_per_s': len(latencies) / elapsed if elapsed else None,
+        'mean_ms': 1000.0 * sum(latencies) / len(latencies),
+    }
+    for percent in (50, 90, 99):
+        summary['p{}_ms'.format(percent)] = \
+            1000.0 * percentile(latencies, percent)
+    summary['max_ms'] = 1000.0 * latencies[-1]
+    if rows is not None:
+        summary['rows'] = rows
+        summary['rows_per_s'] = rows / elapsed if elapsed else None
+    return summary
+
+
+def timed(operation, repeat):
+    """ Run operation() repeat times, returning latencies and elapsed. 
+
+    The operation is run once more beforehand, untimed, to warm up the
+    connection pool and caches.
+
+    """
+
+    operation()
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        operation()
+        latencies.append(time.perf_counter() - begin)
+    return latencies, time.perf_counter() - start
+
+
+def bench_connect(db, options, counts):
+    """ Open and close a new connection. """
+
+    def operation():
+        db.connect().close()
+
+    return summarize(*timed(operation, options.repeat))
+
+
+def bench_normal(db, options, counts):
+    """ Query every customer name in NORMAL mode, as main() does. """
+
+    latencies, elapsed = timed(
+        lambda: db.execute('SELECT name FROM customer;'), options.repeat)
+    return summarize(latencies, elapsed,
+                     rows=counts['customer'] * options.repeat)
+
+
+def bench_point_lookup(db, options, counts):
+    """ Look up single products by primary key. """
+
+    rng = random.Random(options.seed)
+    ids = itertools.cycle([rng.randint(1, counts['product'])
+                           for _ in range(options.repeat * 100)])
+    return summarize(*timed(
+        lambda: db.execute('SELECT * FROM product WHERE id = ?;',
+                           (next(ids),)),
+        options.repeat * 100))
+
+
+def bench_many(db, options, counts):
+    """ Insert batches of order items in MANY mode. """
+
+    rng = random.Random(options.seed)
+    batch = ["""INSERT INTO order_item
+                    ( customer_order_id, product_id, quantity )
+                    VALUES ( ?, ?, ? );"""]
+    batch.extend((rng.randint(1, counts['customer_order']),
+                  rng.randint(1, counts['product']), rng.randint(1, 10))
+                 for _ in range(options.batch_size))
+    latencies, elapsed = timed(lambda: db.execute(batch), options.repeat)
+    return summarize(latencies, elapsed,
+                     rows=options.batch_size * options.repeat)
+
+
+def bench_script(db, options, counts):
+    """ Execute a file of INSERT statements in SCRIPT mode. """
+
+    rng = random.Random(options.seed)
+    descriptor, path = tempfile.mkstemp(prefix='sqlite3db-bench-',
+                                        suffix='.sql')
+    with os.fdopen(descriptor, 'w') as script:
+        script.write('BEGIN;\n')
+        for _ in range(options.batch_size):
+            script.write(('INSERT INTO customer_order ( customer_id, '
+                          "status ) VALUES ( {}, '{}' );\n").format(
+                              rng.randint(1, counts['customer']),
+                              rng.choice(ORDER_STATUSES)))
+        script.write('COMMIT;\n')
+    try:
+        latencies, elapsed = timed(lambda: db.execute(path, mode='SCRIPT'),
+                                   options.repeat)
+    finally:
+        os.remove(path)
+    return summarize(latencies, elapsed,
+                     rows=options.batch_size * options.repeat)
+
+
+def bench_join(db, options, counts):
+    """ Run the multi-way join from main(). """
+
+    rows = []
+    latencies, elapsed = timed(lambda: rows.append(len(db.execute(JOIN)[1])),
+                               options.repeat)
+    return summarize(latencies, elapsed, rows=sum(rows))
+
+
+def bench_dump(db, options, counts):
+    """ Dump the whole database to SQL text. """
+
+    directory = tempfile.mkdtemp(prefix='sqlite3db-bench-')
+    try:
+        path = os.path.join(directory, 'dump.sql')
+        return summarize(*timed(lambda: db.dump(path),
+                                max(1, options.repeat // 10)))
+    finally:
+        shutil.rmtree(directory)
+
+
+def bench_concurrent(db, options, counts):
+    """ Look up products by primary key from several threads at once. """
+
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(seed):
+        rng = random.Random(seed)
+        ids = itertools.cycle([rng.randint(1, counts['product'])
+                               for _ in range(options.repeat * 100)])
+        local, _ = timed(
+            lambda: db.execute('SELECT * FROM product WHERE id = ?;',
+                               (next(ids),)),
+            options.repeat * 100)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(options.seed + i,))
+               for i in range(options.threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    summary = summarize(latencies, time.perf_counter() - start)
+    summary['threads'] = options.threads
+    return summary
+
+
+# Benchmarks, in the order they are run. Those that write come last, so
+# that the data read by the others is the same whichever are selected.
+BENCHMARKS = {
+    'connect': bench_connect,
+    'normal': bench_normal,
+    'point_lookup': bench_point_lookup,
+    'join': bench_join,
+    'concurrent': bench_concurrent,
+    'dump': bench_dump,
+    'many': bench_many,
+    'script': bench_script,
+}
+
+
+def compare(results, baseline):
+    """ Print the change in throughput and p50 latency from baseline. 
+
+    A metric that is missing, or zero, in either run is reported as 
+    n/a, since there is no change to compute.
+
+    """
+
+    def change(summary, before, metric):
+        now, then = summary.get(metric), before.get(metric)
+        if not now or not then:
+            return '{:>8}'.format('n/a')
+        return '{:>+8.1%}'.format(now / then - 1.0)
+
+    for name, summary in results['results'].items():
+        before = baseline.get('results', {}).get(name)
+        if not before:
+            continue
+        print('{:<14} ops/s {}   p50 {}'.format(
+            name, change(summary, before, 'ops_per_s'),
+            change(summary, before, 'p50_ms')), file=sys.stderr)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description='Benchmark sqlite3db against a synthetic dataset for '
+                    'the example schema.')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='multiplies the number of rows per table '
+                             '(default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='random seed (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=100,
+                        help='operations per benchmark (default: '
+                             '%(default)s)')
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help='rows per MANY or SCRIPT operation (default: '
+                             '%(default)s)')
+    parser.add_argument('--threads', type=int, default=4,
+                        help='threads for the concurrent benchmark '
+                             '(default: %(default)s)')
+    parser.add_argument('--profile', default=None,
+                        help='PRAGMA profile passed to SQLite3DB')
+    parser.add_argument('--database', default=None,
+                        help='path for the generated database (default: '
+                             'a temporary file, removed afterwards)')
+    parser.add_argument('--benchmarks', nargs='+', choices=BENCHMARKS,
+                        default=list(BENCHMARKS),
+                        help='benchmarks to run (default: all)')
+    parser.add_argument('--output', default=None,
+                        help='write JSON results to this file (default: '
+                             'standard output)')
+    parser.add_argument('--compare', default=None,
+                        help='JSON results of an earlier run to compare '
+                             'against')
+    options = parser.parse_args()
+
+    # Keep the wrapper's own logging out of the timings.
+    logging.basicConfig(level=logging.WARNING)
+
+    directory = None
+    database = options.database
+    if database is None:
+        directory = tempfile.mkdtemp(prefix='sqlite3db-bench-')
+        database = os.path.join(directory, 'bench.db')
+    elif os.path.exists(database):
+        parser.error('database already exists: {}'.format(database))
+
+    try:
+        with SQLite3DB(database, profile=options.profile) as db:
+            start = time.perf_counter()
+            counts = generate(db, options.scale, options.seed)
+            results = {
+                'meta': {
+                    'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                    'python': platform.python_version(),
+                    'sqlite': sqlite3.sqlite_version,
+                    'platform': platform.platform(),
+                    'scale': options.scale,
+                    'seed': options.seed,
+                    'repeat': options.repeat,
+                    'batch_size': options.batch_size,
+                    'profile': options.profile,
+                    'generate_s': time.perf_counter() - start,
+                },
+                'dataset': counts,
+                'results': {},
+            }
+            for name, benchmark in BENCHMARKS.items():
+                if name in options.benchmarks:
+                    results['results'][name] = benchmark(db, options, 
+                                                         counts)
+    finally:
+        if directory is not None:
+            shutil.rmtree(directory)
+
+    if options.output is None:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        with open(options.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+    if options.compare is not None:
+        with open(options.compare, 'r') as baseline:
+            compare(results, json.load(baseline))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,901 @@
+import asyncio
+import contextlib
+import io
+import logging
+import os
+import sqlite3
+import threading
+
+import pytest
+
+import sqlite3db
+
+
+# A query that runs for several seconds unless it is interrupted.
+SLOW = """ WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c)
+           SELECT count(*) FROM c WHERE x < 100000000; """
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'test.db')
+
+
+@pytest.fixture
+def db(path):
+    db = sqlite3db.SQLite3DB(path, result_cache_size=16)
+    db.execute('CREATE TABLE item ( id INTEGER PRIMARY KEY, name TEXT );')
+    yield db
+    db.close()
+
+
+def test_pool_reuses_released_connection(path):
+    pool = sqlite3db.ConnectionPool(
+        lambda: sqlite3.connect(path, check_same_thread=False), max_size=2)
+    try:
+        first = pool.acquire()
+        pool.release(first)
+        second = pool.acquire()
+        assert second is first
+        third = pool.acquire()
+        assert third is not first
+        pool.release(second)
+        pool.release(third)
+    finally:
+        pool.close()
+
+
+def test_group_commit_failure_fails_only_its_request(db):
+    futures = [db.submit('INSERT INTO item ( name ) VALUES ( ? );', ('a',)),
+               db.submit('INSERT INTO missing ( name ) VALUES ( ? );',
+                         ('b',)),
+               db.submit('INSERT INTO item ( name ) VALUES ( ? );', ('c',))]
+    assert futures[0].result(timeout=10)[0] == 1
+    with pytest.raises(sqlite3.OperationalError):
+        futures[1].result(timeout=10)
+    assert futures[2].result(timeout=10)[0] == 1
+    assert db.query('SELECT name FROM item ORDER BY id;')[1] == \
+        [('a',), ('c',)]
+
+
+def test_writer_connect_failure_fails_queued_and_later_writes():
+
+    submitted = threading.Event()
+
+    def connect():
+        submitted.wait(10)
+        raise sqlite3.OperationalError('unable to open database file')
+
+    writer = sqlite3db.WriteQueue(connect)
+    future = writer.submit('INSERT INTO item ( name ) VALUES ( 1 );')
+    submitted.set()
+    with pytest.raises(sqlite3.OperationalError):
+        future.result(timeout=10)
+    with pytest.raises(sqlite3.OperationalError):
+        writer.submit('INSERT INTO item ( name ) VALUES ( 2 );')
+    writer.close()
+
+
+def test_async_cancellation_holds_slot_and_spares_next_call(path):
+
+    async def run():
+        db = sqlite3db.AsyncSQLite3DB(path, workers=1)
+        try:
+            # A cancelled call keeps its slot until the worker is done.
+            done = threading.Event()
+            task = asyncio.ensure_future(db._call(done.wait, 10))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            assert db._semaphore.locked()
+            done.set()
+
+            # A cancelled query is interrupted, but the next one is not.
+            task = asyncio.ensure_future(db.query(SLOW))
+            await asyncio.sleep(0.2)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            assert await asyncio.wait_for(db.query('SELECT 1;'), 10) == \
+                (0, [(1,)])
+        finally:
+            await db.close()
+
+    asyncio.run(run())
+
+
+def test_result_cache_invalidated_by_writes(db):
+    db.execute('INSERT INTO item ( name ) VALUES ( ? );', ('a',))
+    assert db.query('SELECT name FROM item;')[1] == [('a',)]
+    assert db.query('SELECT name FROM item;')[1] == [('a',)]
+    assert db.result_cache_info().hits == 1
+    db.execute('INSERT INTO item ( name ) VALUES ( ? );', ('b',))
+    assert db.query('SELECT name FROM item;')[1] == [('a',), ('b',)]
+    assert db.result_cache_info().invalidations >= 1
+
+
+def test_result_cache_skips_non_deterministic_queries(db):
+    for sql in ('SELECT random();', "SELECT strftime('%f', 'now');",
+                'SELECT random() FROM item;'):
+        db.query(sql)
+        db.query(sql)
+    assert db.result_cache_info().hits == 0
+    assert db.result_cache_info().currsize == 0
+
+
+def test_pool_times_out_when_exhausted(path):
+    pool = sqlite3db.ConnectionPool(
+        lambda: sqlite3.connect(path, check_same_thread=False), max_size=1)
+    try:
+        with pool.connection():
+            with pytest.raises(TimeoutError):
+                pool.acquire(timeout=0.05)
+    finally:
+        pool.close()
+
+
+def test_pool_reset_retires_and_release_rolls_back(path):
+    pool = sqlite3db.ConnectionPool(
+        lambda: sqlite3.connect(path, check_same_thread=False))
+    try:
+        connection = pool.acquire()
+        connection.execute('CREATE TABLE item ( name TEXT );')
+        connection.execute("INSERT INTO item VALUES ( 'a' );")
+        assert connection.in_transaction
+        pool.release(connection)
+        assert not connection.in_transaction
+        pool.reset()
+        assert pool.acquire() is not connection
+    finally:
+        pool.close()
+
+
+def test_sqlite3db_shares_one_pooled_connection(path):
+    with sqlite3db.SQLite3DB(path, metrics=True) as db:
+        for _ in range(5):
+            db.query('SELECT 1;')
+        assert db.stats()['connections']['count'] == 1
+    with pytest.raises(sqlite3.ProgrammingError):
+        db.query('SELECT 1;')
+
+
+def test_statement_cache_counts_hits_misses_and_reprepares(path):
+    with sqlite3db.SQLite3DB(path, profile='balanced') as db:
+        assert db.statement_cache_info() == (0, 0, 128)
+        db.execute('CREATE TABLE item ( id INTEGER PRIMARY KEY );')
+        info = db.statement_cache_info()
+        for _ in range(3):
+            db.query('SELECT id FROM item WHERE id = ?;', (1,))
+        assert db.statement_cache_info().hits - info.hits == 2
+        assert db.statement_cache_info().misses - info.misses == 1
+        # A schema change expires the prepared statement.
+        db.execute('CREATE TABLE other ( id INTEGER );')
+        info = db.statement_cache_info()
+        db.query('SELECT id FROM item WHERE id = ?;', (1,))
+        assert db.statement_cache_info().misses - info.misses == 1
+
+
+def test_execute_binds_normal_mode_parameters(path):
+    with sqlite3db.SQLite3DB(path) as db:
+        db.execute('CREATE TABLE item ( id INTEGER, name TEXT );')
+        db.execute('INSERT INTO item VALUES ( ?, ? );', (1, 'a'))
+        db.execute('INSERT INTO item VALUES ( :id, :name );',
+                   {'id': 2, 'name': "b'; DROP TABLE item; --"})
+        assert db.execute('SELECT name FROM item WHERE id = ?;', (2,))[1] \
+            == [("b'; DROP TABLE item; --",)]
+
+
+def test_iterquery_streams_all_rows_in_batches(db):
+    db.execute_many('INSERT INTO item ( name ) VALUES ( ? );',
+                    [(str(i),) for i in range(1000)])
+    rows = db.iterquery('SELECT name FROM item ORDER BY id;', size=7)
+    assert next(rows) == ('0',)
+    assert [name for name, in rows] == [str(i) for i in range(1, 1000)]
+    with pytest.raises(ValueError):
+        list(db.iterquery('SELECT name FROM item;', size=0))
+    with pytest.raises(TypeError):
+        list(db.iterquery(None))
+
+
+def test_iterquery_closed_early_returns_its_connection(path):
+    with sqlite3db.SQLite3DB(path, pool_max_size=1, pool_timeout=1) as db:
+        db.execute('CREATE TABLE item ( id INTEGER );')
+        db.execute_many('INSERT INTO item VALUES ( ? );',
+                        [(i,) for i in range(100)])
+        rows = db.iterquery('SELECT id FROM item;', size=10)
+        assert next(rows) == (0,)
+        rows.close()
+        assert db.query('SELECT count(*) FROM item;')[1] == [(100,)]
+
+
+def test_load_streams_chunks_and_keeps_committed_chunks(db):
+    progress = []
+    count = db.load('INSERT INTO item ( name ) VALUES ( ? );',
+                    ((str(i),) for i in range(25)), chunk_size=10,
+                    progress=lambda count, rate: progress.append(count))
+    assert count == 25
+    assert progress == [10, 20, 25]
+    db.execute('CREATE TABLE pair ( a INTEGER NOT NULL );')
+    rows = [(1,)] * 10 + [(None,)]
+    with pytest.raises(sqlite3.IntegrityError):
+        db.load('INSERT INTO pair VALUES ( ? );', iter(rows), chunk_size=10)
+    assert db.query('SELECT count(*) FROM pair;')[1] == [(10,)]
+    with pytest.raises(TypeError):
+        db.load('INSERT INTO pair VALUES ( ? );', 5)
+
+
+def test_execute_many_does_not_mutate_its_argument(db):
+    batch = ['INSERT INTO item ( name ) VALUES ( ? );', ('a',), ('b',)]
+    db.execute(batch)
+    assert len(batch) == 3
+    assert db.query('SELECT count(*) FROM item;')[1] == [(2,)]
+
+
+def test_load_csv_reads_csv_and_tsv_files(db, tmp_path):
+    csv_path = tmp_path / 'items.csv'
+    csv_path.write_text('name\na\n"b, c"\n')
+    tsv_path = tmp_path / 'items.tsv'
+    tsv_path.write_text('d\te\n')
+    sql = 'INSERT INTO item ( name ) VALUES ( ? );'
+    assert db.load_csv(sql, str(csv_path)) == 2
+    assert db.load_csv('INSERT INTO item ( name ) VALUES ( ? || ? );',
+                       tsv_path, header=False) == 1
+    assert db.query('SELECT name FROM item ORDER BY id;')[1] == \
+        [('a',), ('b, c',), ('de',)]
+
+
+def test_load_csv_rejects_bad_paths(db, tmp_path):
+    sql = 'INSERT INTO item ( name ) VALUES ( ? );'
+    for path in (None, 42, ''):
+        with pytest.raises(ValueError):
+            db.load_csv(sql, path)
+    with pytest.raises(FileNotFoundError):
+        db.load_csv(sql, str(tmp_path / 'missing.csv'))
+
+
+def test_cache_flushes_memory_writes_back_to_disk(db, path):
+    db.cache()
+    db.execute('INSERT INTO item ( name ) VALUES ( ? );', ('a',))
+    with sqlite3.connect(path) as disk:
+        assert disk.execute('SELECT name FROM item;').fetchall() == []
+    db.flush()
+    db.execute('INSERT INTO item ( name ) VALUES ( ? );', ('b',))
+    db.uncache()
+    assert db.query('SELECT name FROM item ORDER BY id;')[1] == \
+        [('a',), ('b',)]
+
+
+def test_flush_refuses_to_overwrite_changes_made_while_cached(db, path):
+    db.cache()
+    db.execute('INSERT INTO item ( name ) VALUES ( ? );', ('a',))
+    disk = sqlite3.connect(path)
+    disk.execute("INSERT INTO item ( name ) VALUES ( 'b' );")
+    disk.commit()
+    disk.close()
+    with pytest.raises(sqlite3.OperationalError):
+        db.flush()
+    with pytest.raises(sqlite3.OperationalError):
+        db.uncache()
+    assert db.query('SELECT name FROM item;')[1] == [('a',)]
+    db.uncache(force=True)
+    assert db.query('SELECT name FROM item;')[1] == [('a',)]
+
+
+def test_replicas_answer_scattered_queries(db):
+    db.execute_many('INSERT INTO item ( name ) VALUES ( ? );',
+                    [('a',), ('b',)])
+    with pytest.raises(sqlite3.ProgrammingError):
+        db.scatter(['SELECT 1;'])
+    db.replicate(processes=2)
+    try:
+        assert db.scatter(['SELECT count(*) FROM item;',
+                           ('SELECT name FROM item WHERE id = ?;', (2,))]) \
+            == [[(2,)], [('b',)]]
+        with pytest.raises(sqlite3.OperationalError):
+            db.scatter(["INSERT INTO item ( name ) VALUES ( 'c' );"])
+    finally:
+        db.unreplicate()
+
+
+def test_replica_initializer_failure_is_raised_by_queries(tmp_path,
+                                                          monkeypatch):
+    monkeypatch.setattr(sqlite3db, '_replica', None)
+    monkeypatch.setattr(sqlite3db, '_replica_error', None)
+    sqlite3db._replica_initializer(str(tmp_path / 'missing' / 'test.db'))
+    with pytest.raises(sqlite3.OperationalError):
+        sqlite3db._replica_query(('SELECT 1;', ()))
+
+
+def test_profiles_apply_pragma_settings_to_each_connection(path):
+    with sqlite3db.SQLite3DB(path, profile='balanced') as db:
+        settings = db.settings()
+        assert settings['journal_mode'] == 'wal'
+        assert settings['synchronous'] == 1
+        assert settings['cache_size'] == -65536
+    with sqlite3db.SQLite3DB(path, profile={'busy_timeout': 1234,
+                                            'recursive_triggers': True}) \
+            as db:
+        assert db.settings()['busy_timeout'] == 1234
+        assert db.settings()['recursive_triggers'] == 1
+    with sqlite3db.SQLite3DB(path, profile='read_only') as db:
+        with pytest.raises(sqlite3.OperationalError):
+            db.execute('CREATE TABLE item ( id INTEGER );')
+    # A profile is copied, so changing it later changes nothing.
+    profile = {'busy_timeout': 1000}
+    db = sqlite3db.SQLite3DB(path, profile=profile)
+    profile['busy_timeout'] = 'OFF; DROP TABLE item'
+    assert db.profile == {'busy_timeout': 1000}
+    db.close()
+
+
+@pytest.mark.parametrize('profile', ['fastest', {'no_such_pragma': 1},
+                                     {'journal_mode': 'WAL; DROP TABLE x'},
+                                     {'cache_size': 1.5}])
+def test_profiles_reject_unknown_names_and_values(path, profile):
+    with pytest.raises(ValueError):
+        sqlite3db.SQLite3DB(path, profile=profile)
+
+
+def test_fast_paths_match_execute(db, tmp_path):
+    assert db.execute_many('INSERT INTO item ( name ) VALUES ( ? );',
+                           ((name,) for name in 'ab')) == (2, [])
+    script = tmp_path / 'script.sql'
+    script.write_text("INSERT INTO item ( name ) VALUES ( 'c' );\n"
+                      "INSERT INTO item ( name ) VALUES ( 'd' );\n")
+    assert db.execute_script(str(script)) == (2, [])
+    assert db.query('SELECT name FROM item WHERE id > ?;', (2,)) == \
+        db.execute('SELECT name FROM item WHERE id > ?;', (2,)) == \
+        (0, [('c',), ('d',)])
+    with pytest.raises(sqlite3.OperationalError):
+        db.query('SELECT * FROM missing;')
+
+
+def test_execute_mode_skips_the_filesystem_check(db, tmp_path,
+                                                  monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sql = 'SELECT count(*) FROM item;'
+    (tmp_path / sql).write_text('DROP TABLE item;')
+    assert db.execute(sql, mode='NORMAL') == (0, [(0,)])
+    with pytest.raises(ValueError):
+        db.execute(sql, mode='MANY')
+    with pytest.raises(ValueError):
+        db.execute([sql], mode='NORMAL')
+
+
+def test_execute_logs_steps_only_when_info_is_enabled(db, caplog):
+    with caplog.at_level(logging.WARNING):
+        db.execute('SELECT 1;')
+    assert not caplog.records
+    with caplog.at_level(logging.INFO):
+        db.execute('SELECT 1;')
+    assert any('Execution mode is' in record.getMessage()
+               for record in caplog.records)
+
+
+def test_result_cache_tells_equal_values_of_other_types_apart(db):
+    db.execute("INSERT INTO item ( name ) VALUES ( 'a' );")
+    sql = 'SELECT typeof(?) FROM item;'
+    assert db.query(sql, (1,))[1] == [('integer',)]
+    assert db.query(sql, (1.0,))[1] == [('real',)]
+    sql = 'SELECT typeof(:x) FROM item;'
+    assert db.query(sql, {'x': 1})[1] == [('integer',)]
+    assert db.query(sql, {'x': 1.0})[1] == [('real',)]
+    assert db.query(sql, {'x': 1.0})[1] == [('real',)]
+    assert db.result_cache_info().hits == 1
+
+
+def test_async_workers_follow_the_database_into_memory(path):
+
+    async def run():
+        async with sqlite3db.AsyncSQLite3DB(path, workers=2) as db:
+            await db.execute('CREATE TABLE item ( name TEXT );')
+            assert await db.query('SELECT count(*) FROM item;') == \
+                (0, [(0,)])
+            db.db.cache()
+            await db.execute("INSERT INTO item VALUES ( 'a' );")
+            assert await db.query('SELECT count(*) FROM item;') == \
+                (0, [(1,)])
+            with sqlite3.connect(path) as disk:
+                assert disk.execute(
+                    'SELECT count(*) FROM item;').fetchall() == [(0,)]
+            db.db.uncache()
+            assert await db.query('SELECT count(*) FROM item;') == \
+                (0, [(1,)])
+
+    asyncio.run(run())
+
+
+def test_write_queue_commits_requests_in_groups(path):
+    with sqlite3.connect(path) as connection:
+        connection.execute('CREATE TABLE item ( name TEXT );')
+    groups = []
+    writer = sqlite3db.WriteQueue(
+        lambda: sqlite3.connect(path, check_same_thread=False),
+        batch_size=10, max_latency=0.5, track=lambda connection, sql: sql,
+        settle=groups.append)
+    futures = [writer.submit('INSERT INTO item VALUES ( ? );', (str(i),))
+               for i in range(25)]
+    assert [future.result(timeout=10)[0] for future in futures] == [1] * 25
+    writer.close()
+    assert sum(map(len, groups)) == 25
+    assert max(map(len, groups)) == 10
+    assert len(groups) < 25
+    with sqlite3.connect(path) as connection:
+        assert connection.execute(
+            'SELECT count(*) FROM item;').fetchall() == [(25,)]
+    with pytest.raises(ValueError):
+        sqlite3db.WriteQueue(lambda: None, batch_size=0)
+
+
+def test_transaction_commits_or_rolls_back_all_of_its_work(db):
+    with db.transaction():
+        db.execute("INSERT INTO item ( name ) VALUES ( 'a' );")
+        db.query("INSERT INTO item ( name ) VALUES ( 'b' );")
+    with pytest.raises(RuntimeError):
+        with db.transaction('IMMEDIATE'):
+            db.execute("INSERT INTO item ( name ) VALUES ( 'c' );")
+            raise RuntimeError
+    assert db.query('SELECT name FROM item ORDER BY id;')[1] == \
+        [('a',), ('b',)]
+    with pytest.raises(ValueError):
+        with db.transaction('LAZY'):
+            pass
+
+
+def test_nested_transactions_are_savepoints(db, tmp_path):
+    with db.transaction() as connection:
+        db.execute("INSERT INTO item ( name ) VALUES ( 'a' );")
+        with pytest.raises(RuntimeError):
+            with db.transaction() as inner:
+                assert inner is connection
+                db.execute("INSERT INTO item ( name ) VALUES ( 'b' );")
+                raise RuntimeError
+        with db.transaction():
+            db.execute("INSERT INTO item ( name ) VALUES ( 'c' );")
+        script = tmp_path / 'script.sql'
+        script.write_text('SELECT 1;')
+        with pytest.raises(sqlite3.ProgrammingError):
+            db.execute_script(str(script))
+    assert db.query('SELECT name FROM item ORDER BY id;')[1] == \
+        [('a',), ('c',)]
+
+
+def test_transaction_is_isolated_from_other_threads(db):
+    with db.transaction():
+        db.execute("INSERT INTO item ( name ) VALUES ( 'a' );")
+        rows = []
+        thread = threading.Thread(target=lambda: rows.extend(
+            db.query('SELECT count(*) FROM item;')[1]))
+        thread.start()
+        thread.join(10)
+        assert rows == [(0,)]
+    assert db.query('SELECT count(*) FROM item;')[1] == [(1,)]
+
+
+def test_backup_copies_the_database_in_steps(db, path, tmp_path):
+    db.execute_many('INSERT INTO item ( name ) VALUES ( ? );',
+                    [('x' * 1000,) for _ in range(100)])
+    progress = []
+    target = db.backup(pages=4, progress=lambda copied, total:
+                       progress.append((copied, total)))
+    assert target == path + '.bak'
+    assert len(progress) > 1
+    assert progress[-1][0] == progress[-1][1]
+    with sqlite3.connect(target) as copy:
+        assert copy.execute('SELECT count(*) FROM item;').fetchall() == \
+            [(100,)]
+    memory = db.backup(':memory:', pages=0)
+    try:
+        assert memory.execute('SELECT count(*) FROM item;').fetchall() == \
+            [(100,)]
+    finally:
+        memory.close()
+    copy = str(tmp_path / 'copy.db')
+    assert db.backup(copy) == copy
+
+
+def _fill_shop(db, tmp_path):
+    script = tmp_path / 'shop.sql'
+    script.write_text("""
+        CREATE TABLE merchant ( id INTEGER PRIMARY KEY AUTOINCREMENT, 
+                                name TEXT UNIQUE );
+        CREATE TABLE product ( id INTEGER PRIMARY KEY, 
+                               merchant_id INTEGER REFERENCES merchant,
+                               name TEXT );
+        CREATE INDEX product_name ON product ( name );
+        CREATE VIEW catalog AS SELECT merchant.name, product.name 
+                                 FROM product JOIN merchant 
+                                   ON merchant.id = product.merchant_id;
+        INSERT INTO merchant ( name ) VALUES ( 'm1' ), ( 'm2' );
+        DELETE FROM merchant WHERE name = 'm2';
+        INSERT INTO product VALUES ( 1, 1, 'p;1' ), ( 2, 1, 'p2' );
+        """)
+    db.execute_script(str(script))
+
+
+def _shop(db):
+    return (db.query('SELECT * FROM catalog ORDER BY 2;')[1],
+            db.query("SELECT name FROM sqlite_master WHERE type = 'index' "
+                     "AND name = 'product_name';")[1],
+            db.query("SELECT seq FROM sqlite_sequence "
+                     "WHERE name = 'merchant';")[1])
+
+
+@pytest.mark.parametrize('target', ['dump.sql', 'dump.sql.gz'])
+def test_dump_and_restore_round_trip(db, tmp_path, target):
+    _fill_shop(db, tmp_path)
+    target = db.dump(str(tmp_path / target))
+    statements = []
+    with sqlite3db.SQLite3DB(str(tmp_path / 'copy.db')) as copy:
+        count = copy.restore(target, batch_size=2,
+                             progress=statements.append)
+        assert statements[-1] == count
+        assert _shop(copy) == _shop(db) == \
+            ([('m1', 'p2'), ('m1', 'p;1')], [('product_name',)], [(2,)])
+
+
+def test_dump_tables_writes_one_file_per_table(db, tmp_path):
+    _fill_shop(db, tmp_path)
+    directory = str(tmp_path / 'dump')
+    paths = db.dump_tables(directory, compression='bz2', workers=2)
+    assert sorted(os.path.basename(path) for path in paths) == \
+        ['catalog.sql.bz2', 'item.sql.bz2', 'merchant.sql.bz2',
+         'product.sql.bz2']
+    with sqlite3db.SQLite3DB(str(tmp_path / 'copy.db')) as copy:
+        copy.restore(directory)
+        assert _shop(copy) == _shop(db)
+    with pytest.raises(sqlite3.OperationalError):
+        db.dump_tables(directory, tables=['missing'])
+    with pytest.raises(ValueError):
+        db.dump(str(tmp_path / 'dump.sql'), compression='zip')
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_run_script_runs_the_example_scripts(path):
+    with sqlite3db.SQLite3DB(path) as db:
+        for name in ('example_db_schema.sql', 'example_db_init.sql'):
+            script = os.path.join(HERE, name)
+            count, offset = db.run_script(script, batch_size=7)
+            assert count > 0
+            assert 0 < offset <= os.path.getsize(script)
+        assert db.test()
+        assert db.query('SELECT count(*) FROM customer;')[1][0][0] > 0
+
+
+def test_run_script_resumes_from_its_checkpoint(db, tmp_path):
+    script = tmp_path / 'script.sql'
+    script.write_text("INSERT INTO item ( name ) VALUES ( 'a' );\n"
+                      "INSERT INTO item ( name ) VALUES ( 'b' );\n"
+                      "INSERT INTO missing VALUES ( 'c' );\n"
+                      "INSERT INTO item ( name ) VALUES ( 'd' ); -- d\n"
+                      "/* end; */\n")
+    checkpoint = str(tmp_path / 'script.checkpoint')
+    with pytest.raises(sqlite3.OperationalError):
+        db.run_script(str(script), batch_size=1, checkpoint=checkpoint)
+    assert db.query('SELECT name FROM item ORDER BY id;')[1] == \
+        [('a',), ('b',)]
+    db.execute('CREATE TABLE missing ( name TEXT );')
+    assert db.run_script(str(script), checkpoint=checkpoint)[0] == 2
+    assert not os.path.exists(checkpoint)
+    assert db.query('SELECT name FROM item ORDER BY id;')[1] == \
+        [('a',), ('b',), ('d',)]
+    script.write_text("INSERT INTO item ( name ) VALUES ( 'e' );\n"
+                      "INSERT INTO item ( name ) /* ; */\n")
+    with pytest.raises(ValueError):
+        db.run_script(str(script))
+
+
+def test_columns_are_typed_from_declared_types(db):
+    db.execute('CREATE TABLE product ( id INTEGER, price REAL, '
+               'name TEXT );')
+    db.execute_many('INSERT INTO product VALUES ( ?, ?, ? );',
+                    [(1, 9.5, 'a'), (2, None, 'b'), (3, 1.0, 'c')])
+    sql = ('SELECT id, price, name, count(*) OVER () AS n, id AS price2 '
+           'FROM product ORDER BY id;')
+    # The second call runs a cached prepared statement.
+    for _ in range(2):
+        columns = db.columns(sql, chunk_size=2, as_numpy=False)
+        assert list(columns) == ['id', 'price', 'name', 'n', 'price2']
+        assert columns['id'].typecode == 'q'
+        assert list(columns['id']) == [1, 2, 3]
+        assert columns['price'].typecode == 'd'
+        assert columns['price'][0] == 9.5 and columns['price'][1] != \
+            columns['price'][1]
+        assert columns['name'] == ['a', 'b', 'c']
+        assert columns['n'].typecode == 'q'
+        assert list(columns['price2']) == [1, 2, 3]
+
+
+def test_columns_of_statements_prepared_elsewhere_are_typed(db):
+    db.execute("INSERT INTO item VALUES ( 1, 'a' );")
+    sql = 'SELECT id FROM item;'
+    db.query(sql)
+    assert db.columns(sql, as_numpy=False)['id'].typecode == 'q'
+
+
+def test_columns_widen_or_fall_back_to_lists(db):
+    db.execute('CREATE TABLE reading ( a INTEGER, b INTEGER, c INTEGER );')
+    db.execute_many('INSERT INTO reading VALUES ( ?, ?, ? );',
+                    [(1, 1, 2 ** 62 + 1), (None, 'x', 1.5)])
+    columns = db.columns('SELECT a, b, c, b AS a2 FROM reading;',
+                         chunk_size=1, as_numpy=False)
+    assert columns['a'].typecode == 'd'
+    assert columns['a'][0] == 1.0 and columns['a'][1] != columns['a'][1]
+    assert columns['b'] == [1, 'x']
+    assert columns['c'] == [2 ** 62 + 1, 1.5]
+    assert columns['a2'] == [1, 'x']
+    assert db.columns('SELECT a FROM reading WHERE 0;', as_numpy=False) \
+        == {'a': sqlite3db.array.array('q')}
+    if sqlite3db.numpy is None:
+        with pytest.raises(ImportError):
+            db.columns('SELECT a FROM reading;', as_numpy=True)
+
+
+def test_metrics_count_statements_rows_and_changes(path, tmp_path):
+    with sqlite3db.SQLite3DB(path, metrics=True) as db:
+        assert db.stats()['statements']['count'] == 0
+        db.execute('CREATE TABLE item ( name TEXT );')
+        db.execute_many('INSERT INTO item VALUES ( ? );', [('a',), ('b',)])
+        db.query('SELECT name FROM item;')
+        db.query('SELECT name FROM item;')
+        script = tmp_path / 'script.sql'
+        script.write_text("INSERT INTO item VALUES ( 'c' );")
+        db.execute(str(script))
+        stats = db.stats()
+        assert stats['statements']['count'] == 5
+        assert stats['modes'] == {'NORMAL': 3, 'MANY': 1, 'SCRIPT': 1}
+        assert stats['rows'] == 4
+        assert stats['changes'] == 3
+        assert stats['by_statement']['SELECT name FROM item;']['calls'] == 2
+        assert stats['by_statement'][str(script)]['changes'] == 1
+        assert stats['connections']['count'] == 1
+        text = db.metrics_text()
+        assert 'sqlite3db_statements_total{mode="MANY"} 1\n' in text
+        assert ('sqlite3db_statement_calls_total'
+                '{sql="SELECT name FROM item;"} 2\n') in text
+        assert 'sqlite3db_statement_cache_hits_total' in text
+        db.reset_stats()
+        assert db.stats()['statements']['count'] == 0
+    with sqlite3db.SQLite3DB(path) as db:
+        assert db.stats() is None and db.metrics_text() is None
+        assert db.slow_queries() == []
+
+
+def test_slow_queries_are_logged_with_their_plans(path, caplog):
+    with sqlite3db.SQLite3DB(path, slow_query_time=0.0) as db:
+        db.execute('CREATE TABLE item ( id INTEGER PRIMARY KEY );')
+        db.query('SELECT * FROM item WHERE id = ?;', (1,))
+        record = db.slow_queries()[-1]
+        assert record['sql'] == 'SELECT * FROM item WHERE id = ?;'
+        assert record['mode'] == 'NORMAL'
+        assert any('item' in line for line in record['plan'])
+        assert db.stats()['slow_queries'] == 2
+    assert any(record.levelno == logging.WARNING and 'Slow SQL' in
+               record.getMessage() for record in caplog.records)
+
+
+def _fill_orders(db):
+    db.execute('CREATE TABLE customer ( id INTEGER PRIMARY KEY, '
+               'email TEXT );')
+    db.execute('CREATE TABLE purchase ( id INTEGER PRIMARY KEY, '
+               'customer_id INTEGER REFERENCES customer ( id ), '
+               'total REAL );')
+    db.execute_many('INSERT INTO customer VALUES ( ?, ? );',
+                    [(i, 'c{}@example.com'.format(i)) for i in range(200)])
+    db.execute_many('INSERT INTO purchase VALUES ( ?, ?, ? );',
+                    [(i, i % 200, i / 10.0) for i in range(2000)])
+
+
+def test_advise_proposes_foreign_key_and_workload_indexes(db):
+    _fill_orders(db)
+    query = ('SELECT id FROM customer WHERE email = ?;',
+             ('c7@example.com',))
+    advice = db.advise([query])
+    proposed = {(index['table'], tuple(index['columns'])): index
+                for index in advice['indexes']}
+    assert set(proposed) == {('purchase', ('customer_id',)),
+                             ('customer', ('email',))}
+    assert proposed['customer', ('email',)]['estimated_speedup'] == 200.0
+    assert not any(index['created'] for index in advice['indexes'])
+    assert any('SCAN' in line for line in advice['queries'][0]['plan'])
+    # Nothing was created.
+    assert db.query("SELECT count(*) FROM sqlite_master "
+                    "WHERE type = 'index';")[1] == [(0,)]
+
+
+def test_advise_creates_only_the_indexes_the_planner_uses(db):
+    _fill_orders(db)
+    advice = db.advise(['SELECT id FROM customer WHERE email = '
+                        "'c7@example.com';"], create=True, repeat=5)
+    assert all(index['created'] and index['used']
+               for index in advice['indexes'])
+    query, = advice['queries']
+    assert any('SEARCH' in line for line in query['plan_after'])
+    assert query['seconds_before'] and query['seconds_after']
+    assert len(db.query("SELECT name FROM sqlite_master "
+                        "WHERE type = 'index';")[1]) == 2
+    # Once they exist, the same indexes are not proposed again.
+    assert db.advise(['SELECT id FROM customer WHERE email = '
+                      "'c7@example.com';"])['indexes'] == []
+
+
+def test_schema_catalog_describes_tables_indexes_and_keys(db):
+    _fill_orders(db)
+    db.execute('CREATE UNIQUE INDEX customer_email ON customer ( email );')
+    db.execute('CREATE VIEW big AS SELECT * FROM purchase WHERE total > 9;')
+    catalog = db.schema()
+    assert sorted(catalog.tables) == ['customer', 'item', 'purchase']
+    assert catalog.views == ('big',)
+    customer = catalog.table('CUSTOMER')
+    assert [column.name for column in customer.columns] == ['id', 'email']
+    assert customer.columns[0] == sqlite3db.ColumnInfo('id', 'INTEGER',
+                                                       False, None, 1)
+    assert customer.indexes == (sqlite3db.IndexInfo(
+        'customer_email', ('email',), True, 'c'),)
+    assert catalog.indexed_columns('customer') == {'id', 'email'}
+    key, = catalog.table('purchase').foreign_keys
+    assert (key.columns, key.table, key.references) == \
+        (('customer_id',), 'customer', ('id',))
+    assert catalog.table('missing') is None
+
+
+def test_schema_catalog_is_reloaded_only_when_the_schema_changes(db, path):
+    catalog = db.schema()
+    assert db.schema() is catalog
+    db.execute("INSERT INTO item ( name ) VALUES ( 'a' );")
+    assert db.schema() is catalog
+    # A change made by another connection is noticed, too.
+    with sqlite3.connect(path) as other:
+        other.execute('CREATE TABLE other ( id INTEGER );')
+    changed = db.schema()
+    assert changed.version > catalog.version
+    assert 'other' in changed.tables
+    # A change that is rolled back is never kept.
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.execute('CREATE TABLE doomed ( id INTEGER );')
+            assert 'doomed' in db.schema().tables
+            raise RuntimeError
+    assert 'doomed' not in db.schema().tables
+
+
+@pytest.fixture
+def sharded(tmp_path):
+    db = sqlite3db.ShardedSQLite3DB(
+        [str(tmp_path / 'shard{}.db'.format(i)) for i in range(3)])
+    db.execute('CREATE TABLE item ( id INTEGER, kind TEXT, value );')
+    yield db
+    db.close()
+
+
+def test_sharded_writes_go_to_the_owning_shard(sharded):
+    rows = [(i, 'odd' if i % 2 else 'even', i) for i in range(30)]
+    assert sharded.execute_many('INSERT INTO item VALUES ( ?, ?, ? );',
+                                rows, key=lambda row: row[0]) == 30
+    for shard in sharded.shards:
+        ids = [id for id, in shard.query('SELECT id FROM item;')[1]]
+        assert ids and all(sharded.shard(id) is shard for id in ids)
+    assert sharded.query('SELECT value FROM item WHERE id = ?;', (7,),
+                         key=7) == [(7,)]
+    assert sharded.submit('UPDATE item SET value = 0 WHERE id = ?;', (7,),
+                          key=7).result(timeout=10)[0] == 1
+    assert sharded.query('SELECT kind, count(*), sum(value), max(id) '
+                         'FROM item GROUP BY kind;', group_by=[0],
+                         aggregates={1: 'count', 2: 'sum', 3: 'max'},
+                         order_by=[0]) == \
+        [('even', 15, 210, 28), ('odd', 15, 218, 29)]
+    assert sharded.query('SELECT id FROM item ORDER BY id DESC LIMIT 2;',
+                         order_by=[(0, True)], limit=2) == [(29,), (28,)]
+    with pytest.raises(ValueError):
+        sharded.query('SELECT avg(value) FROM item;', aggregates={0: 'avg'})
+
+
+def test_sharded_order_by_sorts_mixed_types_as_sqlite(sharded):
+    values = [None, 3, 2.5, 'b', b'\x00', -1, 'a']
+    sharded.execute_many('INSERT INTO item VALUES ( ?, NULL, ? );',
+                         list(enumerate(values)), key=lambda row: row[0])
+    merged = sharded.query('SELECT value FROM item;', order_by=[0])
+    with contextlib.closing(sqlite3.connect(':memory:')) as connection:
+        connection.execute('CREATE TABLE item ( value );')
+        connection.executemany('INSERT INTO item VALUES ( ? );',
+                               [(value,) for value in values])
+        one = connection.execute(
+            'SELECT value FROM item ORDER BY value;').fetchall()
+    assert merged == one
+    assert sharded.query('SELECT value FROM item;',
+                         order_by=[(0, True)]) == one[::-1]
+    assert sharded.query('SELECT min(value), max(value) FROM item;',
+                         aggregates={0: 'min', 1: 'max'}) == [(-1, b'\x00')]
+
+
+def test_sharded_ranges_partition_keys_in_order(tmp_path):
+    with pytest.raises(ValueError):
+        sqlite3db.ShardedSQLite3DB([str(tmp_path / 'a.db')], ranges=[10])
+    with pytest.raises(TypeError):
+        sqlite3db.ShardedSQLite3DB(str(tmp_path / 'a.db'))
+    with sqlite3db.ShardedSQLite3DB([str(tmp_path / 'a.db'),
+                                     str(tmp_path / 'b.db')],
+                                    ranges=[10]) as db:
+        assert [db.shard_index(key) for key in (-5, 9, 10, 99)] == \
+            [0, 0, 1, 1]
+
+
+@pytest.fixture
+def blobs(db):
+    db.execute('CREATE TABLE file ( data BLOB );')
+    db.execute('INSERT INTO file VALUES ( NULL );')
+    return db
+
+
+class _Unseekable(object):
+
+    def __init__(self, data):
+        self._data = io.BytesIO(data)
+
+    def read(self, size=-1):
+        return self._data.read(size)
+
+    def seekable(self):
+        return False
+
+
+def test_write_blob_and_read_it_back_in_chunks(blobs):
+    data = bytes(range(256)) * 40
+    assert blobs.write_blob('file', 'data', 1, data, chunk_size=1000) == \
+        len(data)
+    chunks = list(blobs.iterblob('file', 'data', 1, chunk_size=4096))
+    assert [len(chunk) for chunk in chunks] == [4096, 4096, 2048]
+    assert all(isinstance(chunk, memoryview) for chunk in chunks)
+    assert b''.join(chunks) == data
+
+    source = io.BytesIO(b'xx' + data)
+    source.seek(2)
+    assert blobs.write_blob('file', 'data', 1, source, chunk_size=777) == \
+        len(data)
+    assert blobs.query('SELECT data FROM file;')[1] == [(data,)]
+    assert blobs.write_blob('file', 'data', 1, [b'ab', b'cd'], size=4) == 4
+    assert blobs.query('SELECT data FROM file;')[1] == [(b'abcd',)]
+
+
+def test_write_blob_rejects_bad_sizes(blobs):
+    with pytest.raises(ValueError):
+        blobs.write_blob('file', 'data', 1, _Unseekable(b'abc'))
+    assert blobs.write_blob('file', 'data', 1, _Unseekable(b'abc'),
+                            size=3) == 3
+    with pytest.raises(ValueError):
+        blobs.write_blob('file', 'data', 1, [b'ab'])
+    with pytest.raises(ValueError):
+        blobs.write_blob('file', 'data', 1, [b'ab', b'cd'], size=3)
+    with pytest.raises(sqlite3.OperationalError):
+        blobs.write_blob('file', 'data', 2, b'abc')
+    # A failed write leaves the BLOB as it was.
+    assert blobs.query('SELECT data FROM file;')[1] == [(b'abc',)]
+
+
+@pytest.mark.parametrize('native', [True, False])
+def test_blob_reads_and_writes_in_place(blobs, monkeypatch, native):
+    if not native:
+        # As before Python 3.11, which has no Connection.blobopen().
+        def missing(connection):
+            raise AttributeError('blobopen')
+        monkeypatch.setattr(sqlite3db.Connection, 'blobopen',
+                            property(missing))
+    blobs.write_blob('file', 'data', 1, b'hello world')
+    assert blobs.query('SELECT data FROM file;')[1] == [(b'hello world',)]
+    with blobs.blob('file', 'data', 1, readonly=False) as blob:
+        assert isinstance(blob, sqlite3db.SQLBlob) is not native
+        blob.seek(6)
+        blob.write(b'there')
+        blob.seek(0)
+        assert blob.read(5) == b'hello'
+        assert blob.tell() == 5
+        with pytest.raises(ValueError):
+            blob.write(b'too long to fit')
+    with blobs.blob('file', 'data', 1) as blob:
+        assert len(blob) == 11
+        assert blob.read() == b'hello there'
+    # The write invalidated the cached result.
+    assert blobs.query('SELECT data FROM file;')[1] == [(b'hello there',)]
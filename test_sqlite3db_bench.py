@@ -0,0 +1,49 @@
+import argparse
+
+import pytest
+
+import sqlite3db
+import sqlite3db_bench
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = sqlite3db.SQLite3DB(str(tmp_path / 'bench.db'))
+    yield db
+    db.close()
+
+
+def test_generate_is_reproducible_and_consistent(db, tmp_path):
+    counts = sqlite3db_bench.generate(db, scale=0.01, seed=1)
+    for table, count in counts.items():
+        assert db.query('SELECT count(*) FROM {};'.format(table))[1] == \
+            [(count,)]
+    assert db.query('PRAGMA foreign_key_check;')[1] == []
+    with sqlite3db.SQLite3DB(str(tmp_path / 'again.db')) as again:
+        assert sqlite3db_bench.generate(again, scale=0.01, seed=1) == counts
+        sql = 'SELECT * FROM order_item ORDER BY id;'
+        assert again.query(sql) == db.query(sql)
+
+
+def test_benchmarks_report_latency_percentiles(db):
+    counts = sqlite3db_bench.generate(db, scale=0.01)
+    options = argparse.Namespace(repeat=5, seed=0, batch_size=10,
+                                 threads=2)
+    for name, benchmark in sqlite3db_bench.BENCHMARKS.items():
+        summary = benchmark(db, options, counts)
+        assert summary['operations'] > 0, name
+        assert summary['p50_ms'] <= summary['p99_ms'] <= summary['max_ms']
+
+
+def test_compare_skips_missing_and_zero_metrics(capsys):
+    results = {'results': {'a': {'ops_per_s': 200.0, 'p50_ms': 1.0},
+                           'b': {'ops_per_s': None, 'p50_ms': 2.0},
+                           'c': {'ops_per_s': 100.0, 'p50_ms': 1.0}}}
+    baseline = {'results': {'a': {'ops_per_s': 100.0, 'p50_ms': 2.0},
+                            'b': {'ops_per_s': 100.0, 'p50_ms': 0.0},
+                            'c': {'p50_ms': 1.0}}}
+    sqlite3db_bench.compare(results, baseline)
+    lines = capsys.readouterr().err.splitlines()
+    assert lines[0].split() == ['a', 'ops/s', '+100.0%', 'p50', '-50.0%']
+    assert lines[1].split() == ['b', 'ops/s', 'n/a', 'p50', 'n/a']
+    assert lines[2].split() == ['c', 'ops/s', 'n/a', 'p50', '+0.0%']